@@ -0,0 +1,385 @@
+import os
+import sys
+import copy
+import json
+import time
+import types
+import runpy
+import pickle
+import shutil
+import argparse
+import datetime
+import tempfile
+import traceback
+import contextlib
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from synthetic_data import make_fmu_polygons, make_sites, make_nof_grades, make_groundwater_results, make_swimmability_tables, make_managed_sites
+
+#resource (unix) is used for the peak memory of the builder, it is not available on windows
+try:
+    import resource
+except ImportError:
+    resource = None
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+RIVER_PARAMETERS = ['NOF.CLAR.Med', 'NOF.DRP.Combined', 'NOF.NH4N.Combined', 'NOF.NO3.Combined', 'NOF.Chl_a',
+                    'NOF.ASPM', 'NOF.MCI', 'NOF.QMCI',
+                    'NOF.ECOLI.Combined', 'NOF.ECOLI.G260', 'NOF.ECOLI.G540', 'NOF.ECOLI.Med', 'NOF.ECOLI.p95']
+RIVER_FINAL_NAME_MAP = {'Ecosystem health'    : 'Ecosystem Health',
+                        'Water quality'       : 'Water quality',
+                        'NOF.CLAR.Med'        : 'Suspended Fine Sediment',
+                        'NOF.DRP.Combined'    : 'Dissolved Reactive Phosphorus',
+                        'NOF.NH4N.Combined'   : 'Ammonia Toxicity',
+                        'NOF.NO3.Combined'    : 'Nitrate Toxicity',
+                        'NOF.Chl_a'           : 'Chlorophyll a',
+                        'Aquatic life'        : 'Aquatic Life',
+                        'NOF.ASPM'            : 'ASPM',
+                        'NOF.MCI'             : 'MCI',
+                        'NOF.QMCI'            : 'QMCI',
+                        'Fish IBI'            : 'Fish IBI',
+                        'Ecosystem processes' : 'Ecosystem Processes',
+                        'DO'                  : 'Dissolved Oxygen',
+                        'NOF.ECOLI.Combined'  : 'Human Health SOE',
+                        'NOF.ECOLI.G260'      : 'E coli: proportion of Samples > 260 MPN',
+                        'NOF.ECOLI.G540'      : 'E coli: proportion of Samples > 540 MPN',
+                        'NOF.ECOLI.Med'       : 'E coli: median',
+                        'NOF.ECOLI.p95'       : 'E coli: 95th Percentile'}
+STATE_PERIODS = ['2014 - 2018', '2019 - 2023', '2020 - 2024']
+GRADE_COLOURS = {'A' : '#4575b4', 'B' : '#91bfdb', 'C' : '#fee090', 'D' : '#fc8d59', 'E' : '#d73027', 'No Data' : '#bdbdbd'}
+LEGEND_TEMPLATE = '{% macro html(this, kwargs) %}<div class="legend">Synthetic legend</div>{% endmacro %}'
+MAP_FIGURE_SETTINGS = {'zoom_start'             : 8,
+                       'tile_layer'             : 'OpenStreetMap',
+                       'simplify_tolerance'     : 0.0005,
+                       'fmu_simplify_tolerance' : 50,
+                       'fmu_fill_color'         : '#f0f0f0',
+                       'fmu_highlight_color'    : '#c0c0c0',
+                       'linecolor'              : '#000000',
+                       'fmu_lineweight'         : 1,
+                       'lineweight'             : 1,
+                       'fillOpacity'            : 0.6,
+                       'max_riverline_weight'   : 3,
+                       'riverline_colour'       : '#2c7fb8'}
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+def prepare_river(input_dir : str,
+                  n_sites   : int,
+                  seed      : int = 0) -> dict:
+    '''
+    Function to write the synthetic inputs of main_make_river_maps.py and return its settings.
+
+    Parameters
+    ----------
+    input_dir : str
+        DESCRIPTION. Folder to write the inputs to.
+    n_sites : int
+        DESCRIPTION. Number of sites.
+    seed : int, optional
+        DESCRIPTION. The default is 0. Random seed.
+
+    Returns
+    -------
+    settings : dict
+        DESCRIPTION. Settings dictionary of the river maps.
+
+    '''
+    fmu_gdf = make_fmu_polygons(seed = seed)
+    fmu_gdf.to_file(os.path.join(input_dir, 'fmu.gpkg'))
+    sites = make_sites(fmu_gdf, n_sites, seed = seed)
+    make_nof_grades(sites, RIVER_PARAMETERS, STATE_PERIODS, seed = seed).to_csv(os.path.join(input_dir, 'river_state.csv'), index=False)
+    with open(os.path.join(input_dir, 'macrons.pkl'), 'wb') as f:
+        pickle.dump({x : x for x in sites['Site']}, f)
+
+    return {'river_state_data'         : os.path.join(input_dir, 'river_state.csv'),
+            'macron_data_file'         : os.path.join(input_dir, 'macrons.pkl'),
+            'site_column'              : 'Site',
+            'year_column'              : 'Period',
+            'NPS_attribute_column'     : 'Attribute',
+            'NPS_grade_column'         : 'Grade',
+            'x_column'                 : 'NZTMX',
+            'y_column'                 : 'NZTMY',
+            'site_epsg_code'           : 2193,
+            'status_column'            : 'Status',
+            'rep_site_status'          : 'Representative',
+            'include_impact_sites'     : True,
+            'filter_column'            : 'Filter',
+            'remove_filter_fails'      : False,
+            'ignore_sites'             : [],
+            'region_type'              : 'fmu',
+            'max_distance'             : 500,
+            'years_of_interest'        : STATE_PERIODS,
+            'parameter_list'           : RIVER_PARAMETERS,
+            'water_quality_attributes' : RIVER_PARAMETERS[0:5],
+            'aquatic_life_attributes'  : RIVER_PARAMETERS[5:8],
+            'ecoli_parameters'         : RIVER_PARAMETERS[8:],
+            'river_dataframe_columns'  : ['Site', 'Site name label', 'NZTMX', 'NZTMY', 'Status', 'FMU'] + list(RIVER_FINAL_NAME_MAP.keys()) + ['state period'],
+            'final_name_map'           : RIVER_FINAL_NAME_MAP,
+            'fmu_name_map'             : {x : x for x in fmu_gdf['FMU_Name']},
+            'geospatial_settings'      : {'layer_cache_dir'  : os.path.join(input_dir, 'layer_cache'),
+                                          'geospatial_files' : {'fmu' : {'file' : os.path.join(input_dir, 'fmu.gpkg'), 'name' : 'FMU_Name', 'epsg' : 2193}}},
+            'map_settings'             : {'nof_grade_mapping'    : GRADE_COLOURS,
+                                          'map_figure_settings'  : MAP_FIGURE_SETTINGS,
+                                          'map_legend_templates' : {'nof_grade_template'       : LEGEND_TEMPLATE,
+                                                                    'nof_grade_template_ecoli' : LEGEND_TEMPLATE},
+                                          'plot_riverlines'      : False}}
+###############################################################################
+###############################################################################
+###############################################################################
+def prepare_groundwater(input_dir : str,
+                        n_sites   : int,
+                        seed      : int = 0) -> dict:
+    '''
+    Function to write the synthetic inputs of main_make_groundwater_maps.py and return its settings.
+
+    '''
+    fmu_gdf = make_fmu_polygons(seed = seed)
+    fmu_gdf.to_file(os.path.join(input_dir, 'fmu.gpkg'))
+    attributes = {'Nitrate' : 'Nitrate grade', 'E. coli' : 'E. coli grade', 'Arsenic' : 'Arsenic grade'}
+    make_groundwater_results(make_sites(fmu_gdf, n_sites, seed = seed),
+                             {x : ['Good', 'Fair', 'Poor', 'No Data'] for x in attributes.values()},
+                             seed = seed).to_excel(os.path.join(input_dir, 'groundwater_state.xlsx'), index=False)
+
+    return {'state_data'                        : os.path.join(input_dir, 'groundwater_state.xlsx'),
+            'site_column'                       : 'Site',
+            'x_column'                          : 'NZTMX',
+            'y_column'                          : 'NZTMY',
+            'site_epsg_code'                    : 2193,
+            'attribute_columns'                 : attributes,
+            'number_of_ecoli_detections_column' : 'E. coli detections',
+            'geospatial_settings'               : {'layer_cache_dir'  : os.path.join(input_dir, 'layer_cache'),
+                                                   'geospatial_files' : {'fmu' : {'file' : os.path.join(input_dir, 'fmu.gpkg'), 'name' : 'FMU_Name', 'epsg' : 2193}}},
+            'map_settings'                      : {'grade_mapping'        : {x : {'Good' : '#4575b4', 'Fair' : '#fee090', 'Poor' : '#d73027'} for x in attributes.keys()},
+                                                   'map_figure_settings'  : MAP_FIGURE_SETTINGS,
+                                                   'map_legend_templates' : {x : LEGEND_TEMPLATE for x in attributes.keys()}}}
+###############################################################################
+###############################################################################
+###############################################################################
+def prepare_swimmability(input_dir : str,
+                         n_sites   : int,
+                         seed      : int = 0) -> dict:
+    '''
+    Function to write the synthetic inputs of main_make_swimmability_maps.py and return its settings. The per FMU and
+    all site results are read from the data folder next to the script, so they are written by run_builder.
+
+    '''
+    fmu_gdf = make_fmu_polygons(seed = seed)
+    fmu_gdf.to_file(os.path.join(input_dir, 'fmu.gpkg'))
+    fmu_results, results, meta_data = make_swimmability_tables(make_sites(fmu_gdf, n_sites, seed = seed), seed = seed)
+    meta_data.to_excel(os.path.join(input_dir, 'lawa_sites.xlsx'), index=False)
+    data_files = {f'{x}_Swimmability.xlsx' : fmu_results.get(x, results.iloc[0:0]) for x in fmu_gdf['FMU_Name']}
+    data_files.update({'All_Swimmability.xlsx' : results})
+
+    return {'fmu_files'                 : {x : f'{x}_Swimmability.xlsx' for x in fmu_gdf['FMU_Name']},
+            'all_site_results'          : 'All_Swimmability.xlsx',
+            'lawa_sites_meta_data_file' : os.path.join(input_dir, 'lawa_sites.xlsx'),
+            'site_column'               : 'Site',
+            'meta_data_site_column'     : 'SiteName',
+            'x_column'                  : 'NZTMX',
+            'y_column'                  : 'NZTMY',
+            'site_epsg_code'            : 2193,
+            'green_column'              : 'Green',
+            'amber_column'              : 'Amber',
+            'red_column'                : 'Red',
+            'no_sample_column'          : 'No Sample',
+            'contact_rec_season_text'   : '2023-2024 season',
+            'geospatial_settings'       : {'layer_cache_dir'  : os.path.join(input_dir, 'layer_cache'),
+                                           'geospatial_files' : {'fmu' : {'file' : os.path.join(input_dir, 'fmu.gpkg'), 'name' : 'FMU_Name', 'epsg' : 2193}}},
+            'map_settings'              : {'map_figure_settings'  : MAP_FIGURE_SETTINGS,
+                                           'map_legend_templates' : {'grade_template' : LEGEND_TEMPLATE}},
+            'data_files'                : data_files}
+###############################################################################
+###############################################################################
+###############################################################################
+def prepare_managed_sites(input_dir : str,
+                          n_sites   : int,
+                          seed      : int = 0) -> dict:
+    '''
+    Function to write the synthetic inputs of main_managed_sites.py and return its settings.
+
+    '''
+    fmu_gdf = make_fmu_polygons(seed = seed)
+    fmu_gdf.to_file(os.path.join(input_dir, 'fmu.gpkg'))
+    make_managed_sites(fmu_gdf, n_sites, seed = seed).to_file(os.path.join(input_dir, 'managed_sites.gpkg'), layer = 'ManagedSites')
+
+    return {'gdb_file'                : os.path.join(input_dir, 'managed_sites.gpkg'),
+            'layers'                  : ['ManagedSites'],
+            'FMUShpFile'              : os.path.join(input_dir, 'fmu.gpkg'),
+            'layer_cache_dir'         : os.path.join(input_dir, 'layer_cache'),
+            'management_level_column' : 'HRC_Manage_Level',
+            'min_HRC_manage_level'    : 3,
+            'system_type_column'      : 'System',
+            'fmu_name_column'         : 'FMU_Name',
+            'map_popup_columns'       : {'Area_ha' : 'Total area (ha): '},
+            'zoom_start'              : 8,
+            'tile_layer'              : 'OpenStreetMap',
+            'fmu_simplify_tolerance'  : 0.0005,
+            'fmu_fill_color'          : '#f0f0f0',
+            'fmu_highlight_color'     : '#c0c0c0',
+            'linecolor'               : '#000000',
+            'fmu_lineweight'          : 1}
+###############################################################################
+###############################################################################
+###############################################################################
+def swimmability_gradings() -> tuple:
+    '''
+    Function to give the swimmability grade names and colours, as settings.parameter_gradings does for the real data.
+
+    '''
+    cmap = {'Green' : '#1a9850', 'Amber' : '#fdae61', 'Red' : '#d73027', 'No Sample' : '#bdbdbd'}
+    name_map = {'Green' : 'Suitable for swimming', 'Amber' : 'Caution advised', 'Red' : 'Unsuitable for swimming', 'No Sample' : 'Not sampled'}
+    grading_order = {x : j for j,x in enumerate(cmap.keys())}
+    return {}, grading_order, {j : x for x,j in grading_order.items()}, cmap, name_map
+
+
+#the map builders, their folder in the repo, the folder their results are saved to and the function preparing their inputs
+BUILDERS = {'river'         : {'code_dir' : 'surface_water_quality/scripts/state_maps',  'script' : 'main_make_river_maps.py',         'results' : 'rivers',        'prepare' : prepare_river},
+            'groundwater'   : {'code_dir' : 'groundwater/scripts/state_maps',            'script' : 'main_make_groundwater_maps.py',   'results' : 'state_maps',    'prepare' : prepare_groundwater},
+            'swimmability'  : {'code_dir' : 'surface_water_quality/scripts/swimmability', 'script' : 'main_make_swimmability_maps.py', 'results' : 'swimmability',  'prepare' : prepare_swimmability},
+            'managed_sites' : {'code_dir' : 'biodiversity/scripts/managed_sites',        'script' : 'main_managed_sites.py',           'results' : 'managed_sites', 'prepare' : prepare_managed_sites}}
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+def run_builder(builder  : str,
+                settings : dict,
+                case_dir : str) -> dict:
+    '''
+    Function to run one map builder on its synthetic inputs, in a fresh process (see run_benchmarks). The builder script
+    is run as __main__ from a copy of the repo layout in case_dir, with a settings module that returns the synthetic settings.
+
+    Parameters
+    ----------
+    builder : str
+        DESCRIPTION. Name of the builder in BUILDERS.
+    settings : dict
+        DESCRIPTION. Settings from the prepare function of the builder.
+    case_dir : str
+        DESCRIPTION. Folder of this benchmark case.
+
+    Returns
+    -------
+    dict
+        DESCRIPTION. Wall time, CPU time, peak memory, number and size of the outputs, and the traceback text if the builder failed.
+
+    '''
+    builder_settings = BUILDERS.get(builder)
+    code_dir    = os.path.join(REPO_DIR, builder_settings.get('code_dir'))
+    work_dir    = os.path.join(case_dir, 'scripts', os.path.basename(code_dir))
+    results_dir = os.path.join(case_dir, 'results', builder_settings.get('results'))
+    os.makedirs(os.path.join(work_dir, 'data'), exist_ok=True)
+    os.makedirs(results_dir, exist_ok=True)
+    for file_name, data in settings.pop('data_files', {}).items():
+        data.to_excel(os.path.join(work_dir, 'data', file_name), index=False)
+
+    settings_module = types.ModuleType('settings')
+    settings_module.load_settings      = lambda: copy.deepcopy(settings)
+    settings_module.parameter_gradings = swimmability_gradings
+    sys.modules['settings'] = settings_module
+    sys.path.insert(0, code_dir)
+    os.chdir(work_dir)
+
+    error = None
+    wall_start = time.perf_counter()
+    cpu_start  = time.process_time()
+    with open(os.path.join(case_dir, 'log.txt'), 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+        try:
+            runpy.run_path(os.path.join(code_dir, builder_settings.get('script')), run_name='__main__')
+        except Exception:
+            error = traceback.format_exc()
+    wall = time.perf_counter() - wall_start
+    cpu  = time.process_time() - cpu_start
+
+    #peak memory of this process and of any worker processes of the builder (linux reports kilobytes)
+    peak_rss_mb = None
+    if resource is not None:
+        peak_rss_mb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+    outputs = [os.path.join(x[0], y) for x in os.walk(results_dir) for y in x[2] if y.endswith('.html')]
+    return {'wall_s'       : wall,
+            'cpu_s'        : cpu,
+            'peak_rss_mb'  : peak_rss_mb,
+            'n_outputs'    : len(outputs),
+            'output_bytes' : sum([os.path.getsize(x) for x in outputs]),
+            'error'        : error}
+###############################################################################
+###############################################################################
+###############################################################################
+def run_benchmarks(builders   : list,
+                   scales     : list,
+                   work_dir   : str,
+                   report_dir : str,
+                   seed       : int = 0,
+                   keep       : bool = False) -> pd.DataFrame:
+    '''
+    Function to run the map builders against synthetic inputs at several scales and report their timing, peak memory and
+    output size. Each case runs in its own process, so the builders do not share cached layers or peak memory.
+
+    Parameters
+    ----------
+    builders : list
+        DESCRIPTION. Names of the builders in BUILDERS.
+    scales : list
+        DESCRIPTION. Numbers of sites.
+    work_dir : str
+        DESCRIPTION. Folder for the inputs and outputs of each case.
+    report_dir : str
+        DESCRIPTION. Folder to save the report to, as benchmark_{date}.csv and .json.
+    seed : int, optional
+        DESCRIPTION. The default is 0. Random seed of the synthetic data.
+    keep : bool, optional
+        DESCRIPTION. The default is False. If True the inputs and outputs of each case are kept in work_dir.
+
+    Returns
+    -------
+    report : pd.DataFrame
+        DESCRIPTION. One row per builder and scale.
+
+    '''
+    rows = []
+    for builder in builders:
+        for n_sites in scales:
+            print(f'{builder}, {n_sites} sites...')
+            case_dir  = os.path.join(work_dir, f'{builder}_{n_sites}')
+            input_dir = os.path.join(case_dir, 'inputs')
+            os.makedirs(input_dir, exist_ok=True)
+            settings = BUILDERS.get(builder).get('prepare')(input_dir, n_sites, seed)
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                result = executor.submit(run_builder, builder, settings, case_dir).result()
+            if result.get('error') is not None:
+                print(f"{builder} failed with {n_sites} sites:\n{result.get('error')}")
+            rows.append(dict({'builder' : builder, 'n_sites' : n_sites}, **result))
+            if not keep:
+                shutil.rmtree(case_dir, ignore_errors=True)
+
+    report = pd.DataFrame(rows)
+    os.makedirs(report_dir, exist_ok=True)
+    report_name = os.path.join(report_dir, f"benchmark_{datetime.datetime.now().strftime('%Y_%m_%d__%H_%M')}")
+    report.to_csv(f'{report_name}.csv', index=False)
+    with open(f'{report_name}.json', 'w', encoding='utf-8') as f:
+        json.dump(report.to_dict(orient='records'), f, indent=1)
+    print(report.drop(columns='error').round(3).to_string(index=False))
+    return report
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the map builders against synthetic data and report timing, peak memory and output size.')
+    parser.add_argument('--builders',   nargs='+', default=list(BUILDERS.keys()), choices=list(BUILDERS.keys()))
+    parser.add_argument('--sites',      nargs='+', type=int, default=[100, 1000], help='numbers of sites, e.g. --sites 100 1000 10000')
+    parser.add_argument('--seed',       type=int, default=0)
+    parser.add_argument('--work-dir',   default=None, help='folder for the inputs and outputs of each case (a temporary folder by default)')
+    parser.add_argument('--report-dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results'))
+    parser.add_argument('--keep',       action='store_true', help='keep the inputs and outputs of each case')
+    args = parser.parse_args()
+
+    work_dir = args.work_dir if args.work_dir is not None else tempfile.mkdtemp(prefix='map_benchmarks_')
+    run_benchmarks(args.builders, args.sites, os.path.abspath(work_dir), args.report_dir, seed = args.seed, keep = args.keep)
+    if args.work_dir is None and not args.keep:
+        shutil.rmtree(work_dir, ignore_errors=True)
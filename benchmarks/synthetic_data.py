@@ -0,0 +1,225 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import Polygon, Point
+from geopandas.tools import sjoin
+
+#NZTM bounds of the synthetic region
+REGION_BOUNDS = (1750000, 5500000, 1910000, 5620000)
+NOF_GRADES    = ['A', 'B', 'C', 'D', 'E']
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+def make_fmu_polygons(n_fmus              : int = 8,
+                      bounds              : tuple = REGION_BOUNDS,
+                      vertices_per_border : int = 400,
+                      seed                : int = 0) -> gpd.GeoDataFrame:
+    '''
+    Function to make synthetic FMU polygons which tile the region. The borders between FMUs are shared random walks,
+    so the polygons have as many vertices as real borders and simplifying them can leave gaps.
+
+    Parameters
+    ----------
+    n_fmus : int, optional
+        DESCRIPTION. The default is 8. Number of FMUs.
+    bounds : tuple, optional
+        DESCRIPTION. The default is REGION_BOUNDS. (xmin, ymin, xmax, ymax) of the region in NZTM.
+    vertices_per_border : int, optional
+        DESCRIPTION. The default is 400. Number of vertices on each border between two FMUs.
+    seed : int, optional
+        DESCRIPTION. The default is 0. Random seed.
+
+    Returns
+    -------
+    fmu_gdf : gpd.GeoDataFrame
+        DESCRIPTION. Geodataframe with columns FMU_Name and geometry, in EPSG:2193.
+
+    '''
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = bounds
+    width = (xmax - xmin) / n_fmus
+    ys = np.linspace(ymin, ymax, vertices_per_border)
+
+    #the outer borders are straight, the inner borders wander but never reach their neighbours
+    borders = [np.full(len(ys), float(xmin))]
+    for fmu_j in range(1, n_fmus):
+        walk = np.cumsum(rng.normal(0, width / 40, len(ys)))
+        borders.append(xmin + fmu_j * width + np.clip(walk - walk.mean(), -0.35 * width, 0.35 * width))
+    borders.append(np.full(len(ys), float(xmax)))
+
+    polygons = [Polygon(list(zip(borders[j], ys)) + list(zip(borders[j+1][::-1], ys[::-1]))) for j in range(n_fmus)]
+    return gpd.GeoDataFrame({'FMU_Name' : [f'FMU {j+1}' for j in range(n_fmus)]}, geometry = polygons, crs = 2193)
+###############################################################################
+###############################################################################
+###############################################################################
+def make_sites(fmu_gdf : gpd.GeoDataFrame,
+               n_sites : int,
+               seed    : int = 0) -> pd.DataFrame:
+    '''
+    Function to make synthetic monitoring sites at random locations in the region.
+
+    Parameters
+    ----------
+    fmu_gdf : gpd.GeoDataFrame
+        DESCRIPTION. FMU polygons from make_fmu_polygons.
+    n_sites : int
+        DESCRIPTION. Number of sites.
+    seed : int, optional
+        DESCRIPTION. The default is 0. Random seed.
+
+    Returns
+    -------
+    sites : pd.DataFrame
+        DESCRIPTION. Dataframe with columns Site, NZTMX, NZTMY (EPSG:2193) and FMU.
+
+    '''
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = fmu_gdf.total_bounds
+    sites = pd.DataFrame({'Site'  : [f'Synthetic Stream at Site {j:05d}' for j in range(n_sites)],
+                          'NZTMX' : rng.uniform(xmin, xmax, n_sites).round(),
+                          'NZTMY' : rng.uniform(ymin, ymax, n_sites).round()})
+    points = gpd.GeoDataFrame(sites, geometry = gpd.points_from_xy(sites['NZTMX'], sites['NZTMY']), crs = fmu_gdf.crs)
+    fmus = sjoin(points, fmu_gdf[['FMU_Name', 'geometry']], how='left', predicate='within').groupby(level=0)['FMU_Name'].first()
+    sites['FMU'] = fmus.reindex(sites.index).values
+    return sites
+###############################################################################
+###############################################################################
+###############################################################################
+def make_nof_grades(sites            : pd.DataFrame,
+                    parameters       : list,
+                    state_periods    : list,
+                    missing_fraction : float = 0.1,
+                    seed             : int = 0) -> pd.DataFrame:
+    '''
+    Function to make a synthetic long table of NOF grades, in the layout of the river state data.
+
+    Parameters
+    ----------
+    sites : pd.DataFrame
+        DESCRIPTION. Sites from make_sites.
+    parameters : list
+        DESCRIPTION. NOF attribute names (e.g. NOF.MCI).
+    state_periods : list
+        DESCRIPTION. State periods (e.g. '2019 - 2023').
+    missing_fraction : float, optional
+        DESCRIPTION. The default is 0.1. Fraction of site, state period and attribute rows that are left out.
+    seed : int, optional
+        DESCRIPTION. The default is 0. Random seed.
+
+    Returns
+    -------
+    grades : pd.DataFrame
+        DESCRIPTION. Dataframe with columns Site, Period, Attribute, Grade, NZTMX, NZTMY, Status and Filter.
+
+    '''
+    rng = np.random.default_rng(seed)
+    rows = pd.MultiIndex.from_product([sites.index, state_periods, parameters], names = ['site', 'Period', 'Attribute']).to_frame(index=False)
+    rows = rows.loc[rng.random(len(rows)) >= missing_fraction].reset_index(drop=True)
+    site_rows = sites.loc[rows['site']].reset_index(drop=True)
+    return pd.DataFrame({'Site'      : site_rows['Site'],
+                         'Period'    : rows['Period'],
+                         'Attribute' : rows['Attribute'],
+                         'Grade'     : rng.choice(NOF_GRADES, len(rows)),
+                         'NZTMX'     : site_rows['NZTMX'],
+                         'NZTMY'     : site_rows['NZTMY'],
+                         'Status'    : np.where(rng.random(len(rows)) < 0.9, 'Representative', 'Impact'),
+                         'Filter'    : True})
+###############################################################################
+###############################################################################
+###############################################################################
+def make_groundwater_results(sites      : pd.DataFrame,
+                             attributes : dict,
+                             seed       : int = 0) -> pd.DataFrame:
+    '''
+    Function to make a synthetic groundwater state table, one row per site and one grade column per attribute.
+
+    Parameters
+    ----------
+    sites : pd.DataFrame
+        DESCRIPTION. Sites from make_sites.
+    attributes : dict
+        DESCRIPTION. Dictionary of grade column -> list of possible grades.
+    seed : int, optional
+        DESCRIPTION. The default is 0. Random seed.
+
+    Returns
+    -------
+    results : pd.DataFrame
+        DESCRIPTION. Dataframe with columns Site, NZTMX, NZTMY, the grade columns and E. coli detections.
+
+    '''
+    rng = np.random.default_rng(seed)
+    results = sites[['Site', 'NZTMX', 'NZTMY']].copy()
+    for column_j, grades_j in attributes.items():
+        results[column_j] = rng.choice(grades_j, len(results))
+    results['E. coli detections'] = rng.integers(0, 12, len(results))
+    return results
+###############################################################################
+###############################################################################
+###############################################################################
+def make_swimmability_tables(sites : pd.DataFrame,
+                             seed  : int = 0) -> tuple[dict, pd.DataFrame, pd.DataFrame]:
+    '''
+    Function to make synthetic swimmability tables: the percentage of samples in each grade at each site, per FMU and for
+    all sites, and the site meta data (whose site names differ slightly from the results, as the LAWA names do).
+
+    Parameters
+    ----------
+    sites : pd.DataFrame
+        DESCRIPTION. Sites from make_sites.
+    seed : int, optional
+        DESCRIPTION. The default is 0. Random seed.
+
+    Returns
+    -------
+    tuple[dict, pd.DataFrame, pd.DataFrame]
+        DESCRIPTION. Dictionary of FMU name -> results of the sites in that FMU, the results of all sites and the site meta data.
+
+    '''
+    rng = np.random.default_rng(seed)
+    shares = rng.dirichlet(np.ones(4), len(sites)) * 100
+    results = pd.DataFrame({'Site'      : sites['Site'].values,
+                            'Green'     : shares[:,0].round(1),
+                            'Amber'     : shares[:,1].round(1),
+                            'Red'       : shares[:,2].round(1),
+                            'No Sample' : shares[:,3].round(1)})
+    fmu_results = {fmu_j : results.loc[(sites['FMU'] == fmu_j).values].reset_index(drop=True) for fmu_j in sorted(sites['FMU'].dropna().unique())}
+    meta_data = pd.DataFrame({'SiteName' : sites['Site'].str.replace(' at ', ' @ ').values,
+                              'NZTMX'    : sites['NZTMX'].values,
+                              'NZTMY'    : sites['NZTMY'].values})
+    return fmu_results, results, meta_data
+###############################################################################
+###############################################################################
+###############################################################################
+def make_managed_sites(fmu_gdf : gpd.GeoDataFrame,
+                       n_sites : int,
+                       seed    : int = 0) -> gpd.GeoDataFrame:
+    '''
+    Function to make synthetic managed site polygons (roughly round areas of 1 to 80 ha) in the region.
+
+    Parameters
+    ----------
+    fmu_gdf : gpd.GeoDataFrame
+        DESCRIPTION. FMU polygons from make_fmu_polygons.
+    n_sites : int
+        DESCRIPTION. Number of managed sites.
+    seed : int, optional
+        DESCRIPTION. The default is 0. Random seed.
+
+    Returns
+    -------
+    managed_sites : gpd.GeoDataFrame
+        DESCRIPTION. Geodataframe with columns Site_Name, HRC_Manage_Level, System, Area_ha and geometry, in EPSG:2193.
+
+    '''
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = fmu_gdf.total_bounds
+    radius = rng.uniform(60, 500, n_sites)
+    polygons = [Point(x,y).buffer(r, 8) for x,y,r in zip(rng.uniform(xmin, xmax, n_sites), rng.uniform(ymin, ymax, n_sites), radius)]
+    return gpd.GeoDataFrame({'Site_Name'        : [f'Managed site {j:05d}' for j in range(n_sites)],
+                             'HRC_Manage_Level' : rng.integers(1, 6, n_sites),
+                             'System'           : rng.choice(['Wetland', 'Forest', 'Forest ', 'Coastal'], n_sites),
+                             'Area_ha'          : np.pi * radius**2 / 10000},
+                            geometry = polygons, crs = fmu_gdf.crs)
@@ -9,6 +9,11 @@ Purpose : to get the managed sites for Biodiversity Annual SOE Reporting
 
 import pandas as pd
 import geopandas as gpd
+import os
+import sys
+#shared modules (e.g. geospatial_layers) are in the shared folder at the top of the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'shared'))
+from geospatial_layers import load_layer
 import matplotlib.pyplot as plt
 import copy
 import folium 
@@ -86,7 +91,7 @@ def getFMUFlie (settings: dict,
 
     '''    
     #get shape file by reading 
-    FMUshpdf= gpd.read_file(settings.get("FMUShpFile"))
+    FMUshpdf= load_layer(settings.get("FMUShpFile"), cache_dir = settings.get("layer_cache_dir"))
     
     return FMUshpdf
 #################################################################################################################
@@ -8,8 +8,12 @@ Created on Fri Aug 23 11:07:32 2024
 
 import pandas as pd
 import geopandas as gpd
-import copy
 import os
+import sys
+#shared modules (e.g. geospatial_layers) are in the shared folder at the top of the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'shared'))
+from geospatial_layers import load_layer
+import copy
 from shapely.geometry import Polygon
 
 
@@ -37,7 +41,8 @@ def load_geodb  (settings:  dict,
 #################################################################################################################
 #################################################################################################################    
 def getFMUFlie (settings: dict,
-                
+                epsg               : int|None = None,
+                simplify_tolerance : float|None = None
                 ):
     '''
     
@@ -46,8 +51,11 @@ def getFMUFlie (settings: dict,
     ----------
     settings : dict
         DESCRIPTION.
-     : TYPE
-        DESCRIPTION.
+    epsg : int|None, optional
+        DESCRIPTION. The default is None. EPSG code to reproject to, None keeps the CRS of the FMU file.
+    simplify_tolerance : float|None, optional
+        DESCRIPTION. The default is None. If provided the FMU polygons are simplified with this tolerance (in units of epsg),
+        the simplified layer is cached by load_layer so it is only simplified once.
 
     Returns
     -------
@@ -55,7 +63,7 @@ def getFMUFlie (settings: dict,
 
     '''    
     #get shape file by reading 
-    FMUshpdf= gpd.read_file(settings.get("FMUShpFile"))
+    FMUshpdf= load_layer(settings.get("FMUShpFile"), epsg = epsg, simplify_tolerance = simplify_tolerance, cache_dir = settings.get("layer_cache_dir"))
     
     return FMUshpdf
 
@@ -194,6 +202,9 @@ def main():
     #we only want managed sites, so get rid of the lower level sites
     FMUlevel_sites = FMUlevel_sites.loc[FMUlevel_sites[settings.get('management_level_column')] >= settings.get('min_HRC_manage_level')].reset_index(drop=True)
     
+    #FMU polygons for the maps, simplified once
+    FMUshp_map = getFMUFlie (settings, epsg = 4326, simplify_tolerance = settings.get('fmu_simplify_tolerance'))
+    
     #make maps
     systems = [['All'],['Wetland'],['Forest','Forest '],['Coastal']]
     for system_j in systems:
@@ -205,7 +216,7 @@ def main():
             print('filtered data to system type...')
             temp_data = FMUlevel_sites.loc[FMUlevel_sites[settings.get('system_type_column')].isin(system_j)].reset_index(drop=True) 
         make_a_map(temp_data,
-                       FMUshp,
+                       FMUshp_map,
                        settings,
                        os.path.join(results_dir, f'managed_sites_{system_j[0]}.html'),
                        map_centroid_y,
@@ -42,7 +42,7 @@ def make_a_map(gdf                        : gpd.GeoDataFrame,
     m = make_basemap(gdf,settings,map_centroid_y,map_centroid_x)
     
     #add polygon
-    m = add_and_simplify_region_polygons(m,region_gdf,settings,filter_text,cluster_name_column_gdf)
+    m = add_region_polygons(m,region_gdf,settings,filter_text,cluster_name_column_gdf)
     
     #add and cluster markers
     m = add_markers(m,gdf,region_gdf,settings,cluster_to_centroids,cluster_name_column_gdf)
@@ -140,11 +140,11 @@ def calculate_polygon_statistics(gdf                        : gpd.GeoDataFrame,
 ###############################################################################
 ###############################################################################
     
-def add_and_simplify_region_polygons(m                       : folium.Map,
-                                     region_gdf              : gpd.GeoDataFrame,
-                                     settings                : dict,
-                                     filter_text             : str,
-                                     cluster_name_column_gdf :  str) -> folium.Map:
+def add_region_polygons(m                       : folium.Map,
+                        region_gdf              : gpd.GeoDataFrame,
+                        settings                : dict,
+                        filter_text             : str,
+                        cluster_name_column_gdf :  str) -> folium.Map:
     '''
     Function to add regional polygons to the map.
 
@@ -153,7 +153,8 @@ def add_and_simplify_region_polygons(m                       : folium.Map,
     m : folium.Map
         DESCRIPTION. Folium map object.
     region_gdf : gpd.GeoDataFrame
-        DESCRIPTION. Regional geodataframe (geometry column is used to plot the region).
+        DESCRIPTION. Regional geodataframe (geometry column is used to plot the region). It should already be simplified, e.g. from
+        load_layer with a simplify_tolerance, so the polygons are simplified once for every map.
     settings : dict
         DESCRIPTION. Settings dictionary.
     filter_text : str
@@ -168,8 +169,6 @@ def add_and_simplify_region_polygons(m                       : folium.Map,
 
     '''
     map_popup_columns = settings.get('map_popup_columns')
-    region_gdf["geometry"] = region_gdf["geometry"].simplify(tolerance=settings.get('fmu_simplify_tolerance'),
-                                                                   preserve_topology=True)
     region_gdf = region_gdf.set_geometry('geometry')
     region_gdf['filter_text'] = filter_text
     plot_gdf = region_gdf[['geometry', cluster_name_column_gdf, 'filter_text', 'Number of managed sites: '] +  [x for x in map_popup_columns.values()]]
@@ -9,6 +9,11 @@ from branca.element import Template, MacroElement, Element, IFrame
 from folium.plugins import Geocoder, FeatureGroupSubGroup
 from settings import load_settings
 from map_functions import make_map
+import sys
+#shared modules (e.g. geospatial_layers, build_manifest) are in the shared folder at the top of the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'shared'))
+from geospatial_layers import get_geospatial_layer
+from build_manifest import hash_frame, hash_settings, code_version, load_manifest, output_status, record_output, report_build
 
 #################################################################################################################
 #################################################################################################################
@@ -62,18 +67,35 @@ if __name__ == '__main__':
     settings    =  load_settings()
     data        =  load_data(settings)
     
-    #load geospatial file
-    geospatial_file = gpd.read_file(settings.get('geospatial_settings').get('geospatial_files').get('fmu').get('file'))  
-    geospatial_file = geospatial_file.to_crs(4326) 
+    #load geospatial file, simplified along the shared FMU borders once for all of the maps
+    geospatial_file = get_geospatial_layer(settings, 'fmu', epsg = 4326, simplify_tolerance = settings.get('map_settings').get('map_figure_settings').get('simplify_tolerance'))
     
     gis_data = gpd.GeoDataFrame(
     data, geometry=gpd.points_from_xy(data[settings.get("x_column")], data[settings.get("y_column")]), crs=f"EPSG:{settings.get('site_epsg_code')}")
     gis_data = gis_data.to_crs(4326) 
     
+    #the build manifest records the inputs of each map, so maps with unchanged inputs are not rebuilt
+    manifest = load_manifest(os.path.join(results_dir, 'build_manifest.json'))
+    code = code_version(os.path.dirname(os.path.abspath(__file__)))
+    
     for attribute_j in settings.get('attribute_columns').keys():
+        save_name = os.path.join(results_dir, f'{attribute_j.replace(".","").replace(":"," ").replace(">"," ")}.html')
+        #only the current attribute of the site data is hashed, so a changed result only rebuilds the maps it is on
+        inputs = {'fmu_data'  : hash_frame(geospatial_file),
+                  'site_data' : hash_frame(gis_data, [x for x in gis_data.columns if x not in settings.get('attribute_columns').keys() or x == attribute_j]),
+                  'settings'  : hash_settings({'map_settings'        : settings.get('map_settings'),
+                                              'geospatial_settings' : settings.get('geospatial_settings'),
+                                              'attribute'           : settings.get('attribute_columns').get(attribute_j)}),
+                  'code'      : code}
+        if output_status(manifest, save_name, inputs, settings.get('force_rebuild', False)) is None:
+            continue
         make_map(geospatial_file,
                  gis_data,
                  attribute_j,
-                 save_name = os.path.join(results_dir, f'{attribute_j.replace(".","").replace(":"," ").replace(">"," ")}.html'),
+                 save_name = save_name,
                  settings = settings,
-                 legend_template = settings.get('map_settings').get('map_legend_templates').get(attribute_j))
\ No newline at end of file
+                 legend_template = settings.get('map_settings').get('map_legend_templates').get(attribute_j))
+        record_output(manifest, save_name, inputs)
+    
+    #save the manifest and report what was rebuilt
+    report_build(manifest)
\ No newline at end of file
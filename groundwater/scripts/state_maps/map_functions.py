@@ -42,11 +42,11 @@ def make_basemap(settings       : dict,
 #################################################################################################################
 #################################################################################################################
 ################################################################################################################# 
-def add_and_simplify_region_polygons(m                       : folium.Map,
-                                     region_gdf              : gpd.GeoDataFrame,
-                                     settings                : dict,
-                                     fmu_name_column         : str
-                                     ) -> folium.Map:
+def add_region_polygons(m                       : folium.Map,
+                        region_gdf              : gpd.GeoDataFrame,
+                        settings                : dict,
+                        fmu_name_column         : str
+                        ) -> folium.Map:
     '''
     Function to add regional polygons to the map.
 
@@ -55,7 +55,8 @@ def add_and_simplify_region_polygons(m                       : folium.Map,
     m : folium.Map
         DESCRIPTION. Folium map object.
     region_gdf : gpd.GeoDataFrame
-        DESCRIPTION. Regional geodataframe (geometry column is used to plot the region).
+        DESCRIPTION. Regional geodataframe (geometry column is used to plot the region). It should already be simplified, e.g. from
+        get_geospatial_layer with a simplify_tolerance, so the shared borders are simplified once for every map.
     settings : dict
         DESCRIPTION. Settings dictionary.
     fmu_name : str    
@@ -67,7 +68,6 @@ def add_and_simplify_region_polygons(m                       : folium.Map,
 
     '''
     region_gdf = region_gdf.set_geometry('geometry')
-    region_gdf["geometry"] = region_gdf["geometry"].simplify(tolerance=settings.get('map_settings').get('map_figure_settings').get('simplify_tolerance'),preserve_topology=True)
     
    
     geojson  = folium.GeoJson(region_gdf, style_function=lambda x: {"fillColor": settings.get('map_settings').get('map_figure_settings').get('fmu_fill_color'),
@@ -207,7 +207,7 @@ def make_map(fmu_shapes          : gpd.GeoDataFrame,
     m = make_basemap(settings,site_data.centroid.y.mean(),site_data.centroid.x.mean())
     
     #add polygon
-    m = add_and_simplify_region_polygons(m,fmu_shapes,settings,settings.get('geospatial_settings').get('geospatial_files').get('fmu').get('name'))
+    m = add_region_polygons(m,fmu_shapes,settings,settings.get('geospatial_settings').get('geospatial_files').get('fmu').get('name'))
 
     #add and cluster markers
     m = add_markers(m,site_data,settings,current_column)
@@ -0,0 +1,239 @@
+import os
+import glob
+import json
+import hashlib
+import datetime
+import pandas as pd
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+def hash_frame(df      : pd.DataFrame,
+               columns : list|None = None) -> str:
+    '''
+    Function to hash the rows of a dataframe (values, column names and row order, but not the index). Geometry columns
+    are hashed from their WKB.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        DESCRIPTION. Dataframe to hash.
+    columns : list|None, optional
+        DESCRIPTION. The default is None. Columns to hash, None hashes every column.
+
+    Returns
+    -------
+    str
+        DESCRIPTION. Hash of the dataframe.
+
+    '''
+    if columns is not None:
+        df = df[columns]
+    df = pd.DataFrame({str(x) : (df[x].to_wkb(hex=True) if hasattr(df[x], 'to_wkb') else df[x]) for x in df.columns})
+    sha = hashlib.sha1(json.dumps(list(df.columns)).encode('utf-8'))
+    sha.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return sha.hexdigest()
+###############################################################################
+###############################################################################
+###############################################################################
+def hash_settings(settings : dict|list) -> str:
+    '''
+    Function to hash a settings dictionary (or a part of it).
+
+    Parameters
+    ----------
+    settings : dict|list
+        DESCRIPTION. Settings to hash. Values that are not json types (e.g. paths) are hashed from their string.
+
+    Returns
+    -------
+    str
+        DESCRIPTION. Hash of the settings.
+
+    '''
+    return hashlib.sha1(json.dumps(settings, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+###############################################################################
+###############################################################################
+###############################################################################
+def hash_files(file_paths : list) -> str:
+    '''
+    Function to hash the contents of a list of files. Missing files are hashed from their name and a missing marker, so
+    a file that is created (even empty) changes the hash.
+
+    Parameters
+    ----------
+    file_paths : list
+        DESCRIPTION. Paths to the files.
+
+    Returns
+    -------
+    str
+        DESCRIPTION. Hash of the files.
+
+    '''
+    sha = hashlib.sha1()
+    for file_path in file_paths:
+        sha.update(os.path.basename(str(file_path)).encode('utf-8'))
+        if file_path is not None and os.path.isfile(file_path):
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(chunk)
+        else:
+            sha.update(b'<missing>')
+    return sha.hexdigest()
+###############################################################################
+###############################################################################
+###############################################################################
+def code_version(code_dir : str|None = None) -> str:
+    '''
+    Function to get the version of the code that makes the outputs, as a hash of the python files in the script folder
+    and in the shared folder (the folder of this file).
+
+    Parameters
+    ----------
+    code_dir : str|None, optional
+        DESCRIPTION. The default is None. Folder of the scripts, None only hashes the shared folder.
+
+    Returns
+    -------
+    str
+        DESCRIPTION. Hash of the python files.
+
+    '''
+    shared_dir = os.path.dirname(os.path.abspath(__file__))
+    code_files = sorted(glob.glob(os.path.join(shared_dir, '*.py')))
+    if code_dir is not None and os.path.abspath(code_dir) != shared_dir:
+        code_files += sorted(glob.glob(os.path.join(code_dir, '*.py')))
+    return hash_files(code_files)
+###############################################################################
+###############################################################################
+###############################################################################
+def load_manifest(manifest_file : str) -> dict:
+    '''
+    Function to load the build manifest, which records the inputs each output was last built from.
+
+    Parameters
+    ----------
+    manifest_file : str
+        DESCRIPTION. Path to the manifest json file. It does not need to exist yet.
+
+    Returns
+    -------
+    manifest : dict
+        DESCRIPTION. Manifest dictionary.
+
+    '''
+    outputs = {}
+    if os.path.isfile(manifest_file):
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            outputs = json.load(f).get('outputs', {})
+    return {'manifest_file' : manifest_file,
+            'outputs'       : outputs,
+            'run'           : {}}
+###############################################################################
+###############################################################################
+###############################################################################
+def output_key(manifest  : dict,
+               save_name : str) -> str:
+    '''
+    Function to get the key of an output in the manifest (its path relative to the manifest file).
+
+    '''
+    return os.path.relpath(os.path.abspath(save_name), os.path.dirname(os.path.abspath(manifest.get('manifest_file')))).replace('\\', '/')
+###############################################################################
+###############################################################################
+###############################################################################
+def output_status(manifest    : dict,
+                  save_name   : str,
+                  inputs      : dict,
+                  force       : bool = False,
+                  other_files : list|None = None) -> str|None:
+    '''
+    Function to check if an output needs to be rebuilt. The decision is recorded for report_build.
+
+    Parameters
+    ----------
+    manifest : dict
+        DESCRIPTION. Manifest from load_manifest.
+    save_name : str
+        DESCRIPTION. Path of the output file.
+    inputs : dict
+        DESCRIPTION. Dictionary of input name -> hash (e.g. {'data' : hash_frame(...), 'settings' : hash_settings(...), 'code' : code_version(code_dir)}).
+    force : bool, optional
+        DESCRIPTION. The default is False. If True the output is always rebuilt.
+    other_files : list|None, optional
+        DESCRIPTION. The default is None. Other files made with the output (e.g. its images), the output is rebuilt if
+        any of them is missing.
+
+    Returns
+    -------
+    str|None
+        DESCRIPTION. Reason the output needs to be rebuilt, or None if it is up to date.
+
+    '''
+    key      = output_key(manifest, save_name)
+    recorded = manifest.get('outputs').get(key)
+    if force:
+        reason = 'forced'
+    elif recorded is None:
+        reason = 'new output'
+    elif not os.path.isfile(save_name):
+        reason = 'output file missing'
+    elif any(not os.path.isfile(x) for x in (other_files or [])):
+        reason = 'other output file missing'
+    else:
+        changed = sorted(set(x for x in list(inputs.keys()) + list(recorded.get('inputs').keys()) if inputs.get(x) != recorded.get('inputs').get(x)))
+        reason = f'changed {", ".join(changed)}' if len(changed) > 0 else None
+    manifest.get('run').update({key : reason})
+    return reason
+###############################################################################
+###############################################################################
+###############################################################################
+def record_output(manifest  : dict,
+                  save_name : str,
+                  inputs    : dict):
+    '''
+    Function to record the inputs an output was built from, once it has been saved.
+
+    Parameters
+    ----------
+    manifest : dict
+        DESCRIPTION. Manifest from load_manifest.
+    save_name : str
+        DESCRIPTION. Path of the output file.
+    inputs : dict
+        DESCRIPTION. Dictionary of input name -> hash, as given to output_status.
+
+    '''
+    manifest.get('outputs').update({output_key(manifest, save_name) : {'inputs' : inputs,
+                                                                         'built'  : datetime.datetime.now().isoformat(timespec='seconds')}})
+###############################################################################
+###############################################################################
+###############################################################################
+def report_build(manifest : dict) -> pd.DataFrame:
+    '''
+    Function to save the manifest and print which outputs were rebuilt in this run, and why.
+
+    Parameters
+    ----------
+    manifest : dict
+        DESCRIPTION. Manifest from load_manifest.
+
+    Returns
+    -------
+    report : pd.DataFrame
+        DESCRIPTION. Dataframe with the output, whether it was rebuilt and the reason.
+
+    '''
+    os.makedirs(os.path.dirname(os.path.abspath(manifest.get('manifest_file'))), exist_ok=True)
+    with open(manifest.get('manifest_file'), 'w', encoding='utf-8') as f:
+        json.dump({'outputs' : manifest.get('outputs')}, f, indent=1, sort_keys=True)
+
+    report = pd.DataFrame({'output'  : list(manifest.get('run').keys()),
+                           'rebuilt' : [x is not None for x in manifest.get('run').values()],
+                           'reason'  : [x if x is not None else 'unchanged' for x in manifest.get('run').values()]})
+    print(f"Rebuilt {report['rebuilt'].sum()} of {len(report)} outputs")
+    for _,row_j in report.loc[report['rebuilt']].iterrows():
+        print(f"    {row_j['output']}: {row_j['reason']}")
+    return report
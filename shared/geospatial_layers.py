@@ -0,0 +1,265 @@
+import os
+import hashlib
+import tempfile
+import geopandas as gpd
+
+#topojson is used for topology-shared simplification, without it each polygon is simplified on its own
+try:
+    import topojson
+except ImportError:
+    topojson = None
+
+#layers loaded in this process, keyed by the same key that is used for the on-disk cache
+_LAYER_CACHE = {}
+
+#source signatures, worked out once per process as they list the folder of the source
+_SIGNATURE_CACHE = {}
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+def source_signature(file_path: str) -> str:
+    '''
+    Function to build a signature of a geospatial source so that cached copies are rebuilt when the source changes.
+    For a shapefile the modification times of all the sidecar files (.dbf, .prj, etc) are included, for a directory
+    (e.g. a file geodatabase) the modification times of every file in the directory are included. The signature is
+    worked out once per process, so later calls (e.g. one for every map) do not list the folder again.
+
+    Parameters
+    ----------
+    file_path : str
+        DESCRIPTION. Path to the geospatial source.
+
+    Returns
+    -------
+    str
+        DESCRIPTION. Signature string made of the absolute path and modification times.
+
+    '''
+    file_path = os.path.abspath(file_path)
+    if file_path in _SIGNATURE_CACHE:
+        return _SIGNATURE_CACHE.get(file_path)
+    if os.path.isdir(file_path):
+        parts = [os.path.join(file_path, x) for x in sorted(os.listdir(file_path))]
+    else:
+        stem  = os.path.splitext(os.path.basename(file_path))[0]
+        parent = os.path.dirname(file_path)
+        parts = [os.path.join(parent, x) for x in sorted(os.listdir(parent)) if os.path.splitext(x)[0] == stem]
+    mtimes = [f'{os.path.basename(x)}:{os.path.getmtime(x)}' for x in parts if os.path.isfile(x)]
+    _SIGNATURE_CACHE.update({file_path : '|'.join([file_path] + mtimes)})
+    return _SIGNATURE_CACHE.get(file_path)
+###############################################################################
+###############################################################################
+###############################################################################
+def layer_key(file_path          : str,
+              layer              : str|None = None,
+              epsg               : int|None = None,
+              simplify_tolerance : float|None = None) -> str:
+    '''
+    Function to build the key of a (possibly reprojected and simplified) layer.
+
+    Parameters
+    ----------
+    file_path : str
+        DESCRIPTION. Path to the geospatial source.
+    layer : str|None, optional
+        DESCRIPTION. The default is None. Layer name within the source (e.g. for a geodatabase).
+    epsg : int|None, optional
+        DESCRIPTION. The default is None. EPSG code the layer is reprojected to, None keeps the source CRS.
+    simplify_tolerance : float|None, optional
+        DESCRIPTION. The default is None. Simplification tolerance (in units of the layer CRS), None means not simplified.
+
+    Returns
+    -------
+    str
+        DESCRIPTION. Key for the layer.
+
+    '''
+    simplify_method = 'topology' if topojson is not None else 'geometry'
+    key = f'{source_signature(file_path)}|layer={layer}|epsg={epsg}|simplify={simplify_method}:{simplify_tolerance}'
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+###############################################################################
+###############################################################################
+###############################################################################
+def topology_simplify(gdf       : gpd.GeoDataFrame,
+                      tolerance : float) -> gpd.GeoDataFrame:
+    '''
+    Function to simplify polygons along their shared borders. The borders are split into arcs that are shared by the
+    neighbouring polygons (as in TopoJSON) and each arc is simplified once, so no gaps or slivers open up between
+    neighbours. If topojson is not installed each geometry is simplified on its own (topology preserved).
+
+    Parameters
+    ----------
+    gdf : gpd.GeoDataFrame
+        DESCRIPTION. Geodataframe to simplify.
+    tolerance : float
+        DESCRIPTION. Simplification tolerance, in units of the layer CRS.
+
+    Returns
+    -------
+    gdf : gpd.GeoDataFrame
+        DESCRIPTION. Simplified geodataframe, with the same columns and index.
+
+    '''
+    if topojson is None or len(gdf) == 0:
+        gdf = gdf.copy()
+        gdf["geometry"] = gdf["geometry"].simplify(tolerance=tolerance, preserve_topology=True)
+        return gdf
+    simplified = topojson.Topology(gdf, prequantize=False, toposimplify=tolerance).to_gdf(crs=gdf.crs)
+    simplified.index = gdf.index
+    return simplified[list(gdf.columns)]
+###############################################################################
+###############################################################################
+###############################################################################
+def to_topojson(gdf : gpd.GeoDataFrame) -> dict:
+    '''
+    Function to convert a geodataframe to a TopoJSON dictionary, where borders shared by neighbouring polygons are only
+    stored once. The features are under objects.data (e.g. for folium.TopoJson(to_topojson(gdf), 'objects.data')).
+
+    Parameters
+    ----------
+    gdf : gpd.GeoDataFrame
+        DESCRIPTION. Geodataframe to convert, usually already simplified.
+
+    Returns
+    -------
+    dict
+        DESCRIPTION. TopoJSON dictionary.
+
+    '''
+    if topojson is None:
+        raise ImportError('topojson is needed for TopoJSON output (pip install topojson)')
+    return topojson.Topology(gdf, prequantize=False).to_dict()
+###############################################################################
+###############################################################################
+###############################################################################
+def write_parquet_atomic(df        : gpd.GeoDataFrame,
+                         file_path : str,
+                         **kwargs):
+    '''
+    Function to save a (geo)dataframe as parquet without ever leaving a half-written file at file_path. The data is
+    written to a temporary file in the same folder, which is then moved into place with os.replace, so another process
+    reading file_path sees either the old file or the complete new one.
+
+    Parameters
+    ----------
+    df : gpd.GeoDataFrame
+        DESCRIPTION. (Geo)dataframe to save.
+    file_path : str
+        DESCRIPTION. Parquet file.
+    **kwargs
+        DESCRIPTION. Passed to to_parquet.
+
+    '''
+    folder = os.path.dirname(os.path.abspath(file_path))
+    os.makedirs(folder, exist_ok=True)
+    handle, temp_file = tempfile.mkstemp(dir = folder, prefix = f'{os.path.basename(file_path)}.', suffix = '.tmp')
+    os.close(handle)
+    try:
+        df.to_parquet(temp_file, **kwargs)
+        os.replace(temp_file, file_path)
+    finally:
+        if os.path.isfile(temp_file):
+            os.remove(temp_file)
+###############################################################################
+###############################################################################
+###############################################################################
+def load_layer(file_path          : str,
+               layer              : str|None = None,
+               epsg               : int|None = None,
+               simplify_tolerance : float|None = None,
+               cache_dir          : str|None = None) -> gpd.GeoDataFrame:
+    '''
+    Function to load a geospatial layer once per process. Reprojected and simplified variants are kept in memory and
+    saved as GeoParquet in cache_dir, so later runs skip reading the source and reprojecting it. The cache files are
+    written by write_parquet_atomic and a cache file that cannot be read is rebuilt.
+
+    Parameters
+    ----------
+    file_path : str
+        DESCRIPTION. Path to the geospatial source (shapefile, geodatabase, etc).
+    layer : str|None, optional
+        DESCRIPTION. The default is None. Layer name within the source (e.g. for a geodatabase).
+    epsg : int|None, optional
+        DESCRIPTION. The default is None. EPSG code to reproject to, None keeps the source CRS.
+    simplify_tolerance : float|None, optional
+        DESCRIPTION. The default is None. If provided the geometries are simplified with this tolerance (in units of the layer CRS) by topology_simplify.
+    cache_dir : str|None, optional
+        DESCRIPTION. The default is None. Directory for the GeoParquet cache. If None a 'layer_cache' folder in the working directory is used.
+
+    Returns
+    -------
+    gdf : gpd.GeoDataFrame
+        DESCRIPTION. A copy of the layer, so callers are free to modify it.
+
+    '''
+    key = layer_key(file_path, layer, epsg, simplify_tolerance)
+    if key in _LAYER_CACHE:
+        return _LAYER_CACHE.get(key).copy()
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.getcwd(), 'layer_cache')
+    stem = os.path.splitext(os.path.basename(os.path.normpath(file_path)))[0]
+    cache_file = os.path.join(cache_dir, f'{stem}_{layer or "0"}_{key}.parquet')
+
+    gdf = None
+    if os.path.isfile(cache_file):
+        try:
+            gdf = gpd.read_parquet(cache_file)
+        except Exception as error:
+            #a damaged or unreadable cache file is rebuilt from the source
+            print(f'Rebuilding {cache_file}: {error}')
+    if gdf is None:
+        if simplify_tolerance is not None:
+            gdf = load_layer(file_path, layer = layer, epsg = epsg, cache_dir = cache_dir)
+            gdf = topology_simplify(gdf, simplify_tolerance)
+        elif epsg is not None:
+            gdf = load_layer(file_path, layer = layer, cache_dir = cache_dir)
+            if gdf.crs != f'EPSG:{epsg}':
+                gdf = gdf.to_crs(epsg)
+        elif layer is not None:
+            gdf = gpd.read_file(file_path, layer = layer)
+        else:
+            gdf = gpd.read_file(file_path)
+        try:
+            write_parquet_atomic(gdf, cache_file)
+        except ImportError:
+            #pyarrow is not installed, so we only keep the layer in memory
+            pass
+
+    _LAYER_CACHE.update({key : gdf})
+    return gdf.copy()
+###############################################################################
+###############################################################################
+###############################################################################
+def get_geospatial_layer(settings           : dict,
+                         layer_type         : str = 'fmu',
+                         epsg               : int|None = None,
+                         simplify_tolerance : float|None = None) -> gpd.GeoDataFrame:
+    '''
+    Function to get one of the layers defined in settings['geospatial_settings']['geospatial_files'] from the layer registry.
+
+    Parameters
+    ----------
+    settings : dict
+        DESCRIPTION. Settings dictionary.
+    layer_type : str, optional
+        DESCRIPTION. The default is 'fmu'. Key of the layer in the geospatial files settings.
+    epsg : int|None, optional
+        DESCRIPTION. The default is None. EPSG code to reproject to, None keeps the source CRS.
+    simplify_tolerance : float|None, optional
+        DESCRIPTION. The default is None. If provided the geometries are simplified with this tolerance (in units of the layer CRS) by topology_simplify.
+
+    Returns
+    -------
+    gpd.GeoDataFrame
+        DESCRIPTION. A copy of the layer.
+
+    '''
+    layer_settings = settings.get('geospatial_settings').get('geospatial_files').get(layer_type)
+    return load_layer(layer_settings.get('file'),
+                      layer              = layer_settings.get('layer'),
+                      epsg               = epsg,
+                      simplify_tolerance = simplify_tolerance,
+                      cache_dir          = settings.get('geospatial_settings').get('layer_cache_dir'))
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+from itertools import chain
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+def state_filter_spec(settings : dict) -> list:
+    '''
+    Function to get the filters of the state data of one site type: end year, no impact sites, site type, parameters and nOK.
+
+    Parameters
+    ----------
+    settings : dict
+        DESCRIPTION. Settings of the site type (with state_columns and impact_sites).
+
+    Returns
+    -------
+    list
+        DESCRIPTION. List of (name, column, operator, value) filters, in the order they are applied.
+
+    '''
+    columns = settings.get('state_columns')
+    return [('end year',     columns.get('end_year_column'),  '==',     columns.get('end_year')),
+            ('impact sites', columns.get('site_column'),      'not in', settings.get('impact_sites')),
+            ('site type',    columns.get('site_type_column'), 'in',     columns.get('site_type')),
+            ('parameters',   columns.get('parameter_column'), 'in',     list(chain.from_iterable(columns.get('parameters')))),
+            ('nOK',          columns.get('number_ok_column'), 'in',     columns.get('number_ok'))]
+###############################################################################
+###############################################################################
+###############################################################################
+def trend_filter_spec(settings : dict) -> list:
+    '''
+    Function to get the filters of the trend data of one site type: end year, site type, site status, parameters, trend
+    direction and trend period.
+
+    Parameters
+    ----------
+    settings : dict
+        DESCRIPTION. Settings of the site type (with trends_columns).
+
+    Returns
+    -------
+    list
+        DESCRIPTION. List of (name, column, operator, value) filters, in the order they are applied.
+
+    '''
+    columns = settings.get('trends_columns')
+    return [('end year',        columns.get('end_year_column'),     '==', columns.get('end_year')),
+            ('site type',       columns.get('site_type_column'),    'in', columns.get('site_type')),
+            ('site status',     columns.get('status_type_column'),  'in', columns.get('status_type')),
+            ('parameters',      columns.get('parameter_column'),    'in', columns.get('parameters')),
+            ('trend direction', columns.get('trend_dir_column'),    'in', columns.get('trend_dir_ok')),
+            ('trend period',    columns.get('trend_period_column'), 'in', columns.get('trend_periods'))]
+###############################################################################
+###############################################################################
+###############################################################################
+def apply_filter_spec(data  : pd.DataFrame,
+                      spec  : list,
+                      rows  : np.ndarray|None = None,
+                      label : str = '') -> pd.DataFrame:
+    '''
+    Function to filter a dataframe with a filter spec. The filters are combined into one mask, so the data is copied once,
+    and the number of rows each filter removed (from the rows kept by the filters before it) is printed.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DESCRIPTION. Dataframe to filter.
+    spec : list
+        DESCRIPTION. List of (name, column, operator, value) filters, the operator is ==, in or not in.
+    rows : np.ndarray|None, optional
+        DESCRIPTION. The default is None. Positions of the rows to filter (e.g. the rows of one site type), None filters every row.
+    label : str, optional
+        DESCRIPTION. The default is ''. Label of the printed summary.
+
+    Returns
+    -------
+    pd.DataFrame
+        DESCRIPTION. The rows that pass every filter, with a new index.
+
+    '''
+    if rows is None:
+        rows = np.arange(len(data))
+    keep = np.ones(len(rows), dtype=bool)
+    removed = []
+    for name_j, column_j, operator_j, value_j in spec:
+        values = data[column_j].take(rows)
+        if operator_j == '==':
+            passed = (values == value_j).to_numpy(dtype=bool, na_value=False)
+        elif operator_j == 'in':
+            passed = values.isin(value_j).to_numpy()
+        elif operator_j == 'not in':
+            passed = ~values.isin(value_j).to_numpy()
+        else:
+            raise ValueError(f'Unknown filter operator {operator_j} for {name_j}')
+        removed.append(f'{name_j} -{int((keep & ~passed).sum())}')
+        keep &= passed
+
+    print(f"{label}: {len(rows)} rows, {', '.join(removed)}, {int(keep.sum())} kept")
+    return data.take(rows[keep]).reset_index(drop=True)
@@ -0,0 +1,76 @@
+import os
+import plotly.io as pio
+
+#figures waiting to be saved as images, as (figure, image file)
+_IMAGE_QUEUE = []
+_BATCH_SETTINGS = {'enabled' : False, 'formats' : None}
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+def start_image_batch(formats : list|None = None):
+    '''
+    Function to start collecting the images of the figures, so they are all saved at once by write_image_batch instead of
+    one Kaleido call for each figure.
+
+    Parameters
+    ----------
+    formats : list|None, optional
+        DESCRIPTION. The default is None. Image formats to save each figure in (e.g. ['svg','png','pdf']), None uses the
+        extension of the image file.
+
+    '''
+    _IMAGE_QUEUE.clear()
+    _BATCH_SETTINGS.update({'enabled' : True, 'formats' : formats})
+###############################################################################
+###############################################################################
+###############################################################################
+def export_image(fig,
+                 save_name_image : str):
+    '''
+    Function to save a figure as an image. While a batch is started the image is queued, otherwise it is saved straight away.
+
+    Parameters
+    ----------
+    fig : go.Figure
+        DESCRIPTION. Plotly figure.
+    save_name_image : str
+        DESCRIPTION. Image file, the formats of the batch replace its extension.
+
+    '''
+    if not _BATCH_SETTINGS.get('enabled'):
+        fig.write_image(save_name_image)
+        return
+    stem, extension = os.path.splitext(save_name_image)
+    for format_j in (_BATCH_SETTINGS.get('formats') or [extension.lstrip('.')]):
+        _IMAGE_QUEUE.append((fig, f'{stem}.{format_j}'))
+###############################################################################
+###############################################################################
+###############################################################################
+def write_image_batch() -> int:
+    '''
+    Function to save the queued images and end the batch. The images of every figure and format are rendered by one Kaleido
+    session (plotly.io.write_images, Kaleido 1.0 or newer), which starts the browser once for the whole batch. With older
+    versions of plotly, which do not have write_images, the images are saved one at a time. Errors of Kaleido (e.g. it is
+    not installed) are raised.
+
+    Returns
+    -------
+    int
+        DESCRIPTION. Number of images saved.
+
+    '''
+    queue = list(_IMAGE_QUEUE)
+    _IMAGE_QUEUE.clear()
+    _BATCH_SETTINGS.update({'enabled' : False})
+    if len(queue) == 0:
+        return 0
+
+    if hasattr(pio, 'write_images'):
+        pio.write_images([x[0] for x in queue], [x[1] for x in queue])
+    else:
+        #write_images is not in this version of plotly
+        for fig_j, file_j in queue:
+            fig_j.write_image(file_j)
+    return len(queue)
@@ -0,0 +1,404 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from image_export import export_image
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+def plot_donut_figure(df,settings,name_column = 'Grade', facet_column = 'PrettyStandard',save_name = 'test.html', save_name_image = 'test.svg', variable_order = [],height = 600):
+    # Order the facets by variable_order, without changing df
+    facet = df[facet_column].astype(pd.CategoricalDtype(variable_order, ordered=True))
+    grouped_data = df.groupby([facet, df[name_column]], observed=True).size().reset_index(name="Count")
+    grouped_data['nice_variable_name'] = grouped_data[facet_column].map(settings.get('parameter_name_map'))
+    # Customizable font size for facet titles
+    facet_font_size = 14
+    
+    custom_colors = {"PASS": "#c4dfb9", "FAIL": "#ff7f7f"}
+    
+    # Create a donut plot using faceting and wrap into 2 columns
+    fig = px.pie(
+        grouped_data,
+        names="Grade",
+        values="Count",
+        facet_col="nice_variable_name",
+        facet_col_wrap=2,  # Arrange facets in 2 columns (2x2 grid)
+        color="Grade",     # Map colors to the "Grade" column
+        color_discrete_map=custom_colors,  # Apply custom colors
+        hole=0.5           # Makes it a donut plot
+    )
+    
+    # Update layout for a tighter appearance and remove the overall title
+    fig.update_layout(
+        height=height,                     # Adjust height
+        width = 600,
+        margin=dict(t=40, b=20, l=20, r=20),  # Reduce margins
+        font=dict(size=facet_font_size),      # Set font size for facets
+    )
+    
+    # Remove "PrettyStandard =" from facet titles
+    facet_titles = grouped_data["PrettyStandard"].unique()
+    fig.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1], font=dict(size=facet_font_size)))
+    
+    # Reduce spacing between subplots and hide axis tick labels
+    fig.update_xaxes(showticklabels=False)  # Hide x-axis labels
+    fig.update_yaxes(showticklabels=False)  # Hide y-axis labels
+    
+    fig.write_html(save_name,include_plotlyjs="cdn")
+    export_image(fig, save_name_image)
+
+###############################################################################
+###############################################################################
+###############################################################################
+def plot_final_interim_donut_figure(df,settings,name_column = 'Grade', facet_column = 'PrettyStandard',save_name = 'test.html', save_name_image = 'test.svg', variable_order = [],height = 600):
+    # Order the facets by variable_order, without changing df
+    facet = df[facet_column].astype(pd.CategoricalDtype(variable_order, ordered=True))
+    grouped_data = df.groupby([facet, df[name_column]], observed=True).size().reset_index(name="Count")
+    grouped_data['nice_variable_name'] = grouped_data[facet_column].map(settings.get('parameter_name_map'))
+    # Customizable font size for facet titles
+    facet_font_size = 14
+    
+    custom_colors = {"PASS (Final)": "#c4dfb9", "FAIL (Final)": "#ff7f7f", "PASS (Interim)": "#c4dfb9", "FAIL (Interim)": "#ff7f7f"}
+    custom_pattern = {"PASS (Final)": "", "FAIL (Final)": "", "PASS (Interim)": ".", "FAIL (Interim)": "."}
+    
+    ###########################################################################
+    ###########################################################################
+    ###########################################################################
+    # Create the facets by looping through unique values of `nice_variable_name`
+    unique_nice_variable_names = grouped_data['nice_variable_name'].unique()
+
+    # Create a subplot grid with 2 columns (facets)
+    num_facets = len(unique_nice_variable_names)
+    num_columns = 2
+    num_rows = (num_facets + 1) // num_columns  # Calculate rows needed for the facets
+    
+    # Create the subplots with spacing adjustments
+    fig = make_subplots(
+        rows=num_rows, 
+        cols=num_columns, 
+        subplot_titles=unique_nice_variable_names,  # Set facet titles
+        specs=[[{"type": "pie"}, {"type": "pie"}]] * num_rows,  # Specify the subplot type
+        vertical_spacing=0.05,  # Reduce vertical spacing between rows of subplots
+        horizontal_spacing=0.02  # Reduce horizontal spacing between columns of subplots
+    )
+    
+    # Iterate over each facet (each unique value of nice_variable_name)
+    for i, nice_value in enumerate(unique_nice_variable_names):
+        # Filter data for this facet
+        facet_data = grouped_data[grouped_data['nice_variable_name'] == nice_value]
+        
+        # Calculate total for the facet to compute percentages
+        total_count = facet_data['Count'].sum()
+        
+        # Filter out the labels where percentage is 0%
+        facet_data = facet_data[facet_data['Count'] / total_count > 0]
+    
+        # Determine pattern_shape values: apply valid patterns or empty string for no pattern
+        patterns = [custom_pattern.get(label, "") for label in facet_data[name_column]]
+        
+        # Calculate the row and column position for each facet
+        row = (i // num_columns) + 1
+        col = (i % num_columns) + 1
+        
+        # Create pie chart for each facet
+        pie_chart = go.Pie(
+            labels=facet_data[name_column],
+            values=facet_data['Count'],
+            hole=0.5,  # Makes it a donut plot
+            name=nice_value,  # Set the facet name for legend
+            marker=dict(
+                colors=[custom_colors.get(label, "#ffffff") for label in facet_data[name_column]],  # Apply custom colors
+                pattern_shape=patterns  # Apply custom patterns
+            ),
+            textinfo='percent',  # Show percentage on the chart
+            textposition='inside'
+        )
+        
+        # Add pie chart to the specific subplot
+        fig.add_trace(pie_chart, row=row, col=col)
+    
+    # Update layout for facets (reduce space between subplots)
+    fig.update_layout(
+        height=height,  # Adjust height
+        width=675,  # Adjust width
+        margin=dict(t=40, b=20, l=20, r=20),  # Reduce margins
+        font=dict(size=12),  # Set font size for facets
+        showlegend=True,  # Display legend with labels
+        title_text="",  # Remove main title
+    )
+    
+    # Adjust subplot titles' position (move titles lower)
+    annotations = []
+    for i, title in enumerate(unique_nice_variable_names):
+        row = (i // num_columns) + 1
+        col = (i % num_columns) + 1
+        
+        # Calculate the x and y position based on row and column
+        x = (col - 1) / num_columns + 0.5 / num_columns  # Center titles in their respective columns
+        y = 1 - (row - 1) / num_rows - 0.01*(row-1)  # Move title lower by decreasing y
+    
+        annotations.append(
+            dict(
+                x=x,  # Horizontal position
+                y=y,  # Vertical position, lowered closer to the plot
+                text=title,  # Use the actual title text
+                showarrow=False,
+                font=dict(size=12),
+                xref="paper", 
+                yref="paper"
+            )
+        )
+    
+    # Apply the annotations to the figure
+    fig.update_layout(annotations=annotations)
+    ###########################################################################
+    ###########################################################################
+    ###########################################################################
+    
+    # Remove "PrettyStandard =" from facet titles
+    facet_titles = grouped_data["PrettyStandard"].unique()
+    fig.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1], font=dict(size=facet_font_size)))
+    
+    # Reduce spacing between subplots and hide axis tick labels
+    fig.update_xaxes(showticklabels=False)  # Hide x-axis labels
+    fig.update_yaxes(showticklabels=False)  # Hide y-axis labels
+    
+    fig.write_html(save_name,include_plotlyjs="cdn")
+    export_image(fig, save_name_image)
+
+###############################################################################
+###############################################################################
+###############################################################################
+def plot_percentage_stacked_bar(df, settings, name_column='Grade', facet_column='PrettyStandard', save_name='test.html', save_name_image='test.svg', variable_order=[], height=600):
+    # Order the facets by variable_order, without changing df
+    facet = df[facet_column].astype(pd.CategoricalDtype(variable_order, ordered=True))
+    
+    # Group the data and calculate counts
+    grouped_data = df.groupby([facet, df[name_column]], observed=True).size().reset_index(name="Count")
+    
+    # Calculate percentage for each "Grade" (PASS/FAIL) within each facet
+    grouped_data['Percentage'] = grouped_data['Count'] / grouped_data.groupby(facet_column, observed=True)['Count'].transform('sum') * 100
+    
+    # Create the stacked bar chart using Plotly Express
+    fig = px.bar(
+        grouped_data,
+        x=facet_column,                  # x-axis will be facet_column (PrettyStandard)
+        y='Percentage',                  # y-axis will be the percentage
+        color=name_column,               # Color bars by Grade (PASS/FAIL)
+        title="Percentage of Pass/Fail by PrettyStandard",
+        labels={facet_column: 'PrettyStandard', name_column: 'Grade'},  # Axis labels
+        color_discrete_map={"PASS": "#c4dfb9", "FAIL": "#ff7f7f"},  # Custom colors for Grade
+        height=height,                   # Set the height of the chart
+        barmode='stack',                 # Stack the bars to show percentage breakdown
+    )
+
+    # Save the plot as HTML and image
+    fig.write_html(save_name, include_plotlyjs="cdn")
+    export_image(fig, save_name_image)
+###############################################################################
+###############################################################################
+###############################################################################
+def plot_trend_table(df,settings, variable_column = 'npID',confidence_column = 'SimpleConfidence', years = 5, save_name = 'test.html', save_name_image = 'test.svg', all_confidences = False):
+    #df is the trend proportions of one period (oneplan_summary_engine.trend_proportions), with a percentage column
+    #all_confidences shows every confidence category as a column (0.0% if there are no trends in it), otherwise only those in the data
+    headers = ['']
+    for key_j in settings.get('confidences').keys():
+        if all_confidences or key_j in list(df[confidence_column]):
+            color = settings.get('confidences').get(key_j).get('color')
+            arrow = settings.get('confidences').get(key_j).get('angle')
+            multiplier = settings.get('confidences').get(key_j).get('multiplier')
+            headers.append(f"<span style='font-size:48px; color:{color}; font-weight:bold;'>{'&nbsp;' * multiplier}{arrow}</span><br> <br> <br><span style='font-size:16px;'>{key_j}</span>")
+    
+    # Pivot the table to have 'SimpleConfidence' as columns and npID as rows, missing combinations are 0%
+    pivot_df = df.pivot(index=variable_column, columns=confidence_column, values='percentage').fillna(0)
+    pivot_df = pivot_df.round(1).astype(str) + '%'
+    if all_confidences:
+        pivot_df = pivot_df.reindex(columns=list(settings.get('confidences').keys()), fill_value='0.0%')
+    else:
+        pivot_df = pivot_df[[x for x in list(settings.get('confidences').keys()) if x in pivot_df.columns]]
+    pivot_df.index = pivot_df.index.map(settings.get('parameter_name_map'))
+    
+    # Define alternating colors for rows
+    row_colors = ['#d8d8d8', '#ececec'] * (len(pivot_df) // 2 + 1)  # Ensure enough colors for all rows
+    row_colors = row_colors[:len(pivot_df)]  # Trim to the exact number of rows
+    
+    
+    table = go.Figure(go.Table(
+        header=dict(values=headers,
+                    align="center",
+                    line_color="darkslategray",
+                    fill_color="#f9f9f9",),
+        cells=dict(values=[pivot_df.index] + [pivot_df[col] for col in pivot_df.columns],
+                   font = {'size':20}, height = 30,
+                   fill_color=[row_colors]
+                   )
+    ))
+    table.update_layout(
+    height=900,
+    width=1800,
+    autosize=True,
+    title=f"Proportion of trends in each category - {years} year trends",
+    title_font=dict(size=24),
+    )
+    
+    table.write_html(save_name,include_plotlyjs="cdn")
+    export_image(table, save_name_image)
+    
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+def plot_heatmap_results(
+    df, 
+    settings, 
+    site_column='sID', 
+    variable_column='PrettyStandard', 
+    variable_order=[], 
+    category_column='pass_fail_interim_final', 
+    save_name='test.html', 
+    save_name_image='test.svg',
+    height=410,
+    width=820,
+    render_mode='scatter',
+    ):
+    # render_mode: 'scatter' draws a marker for each site and variable, 'webgl' draws the same markers with WebGL,
+    # 'heatmap' draws one heatmap of all cells (fast for hundreds of sites) and 'auto' uses scatter for up to 1000 cells
+    # and heatmap above that. A height or width of None is computed from the number of sites and variables.
+    # Define custom colors and outline colors
+    custom_colors = {
+        "PASS (Final)": "#98c785", 
+        "FAIL (Final)": "#ff7f7f", 
+        "PASS (Interim)": "#e4e4e4", 
+        "FAIL (Interim)": "#e4e4e4"
+    }
+    custom_outline_colors = {
+        "PASS (Final)": "#98c785", 
+        "FAIL (Final)": "#ff7f7f", 
+        "PASS (Interim)": "#98c785", 
+        "FAIL (Interim)": "#ff7f7f"
+    }
+    
+    # Add outline colors and names to a copy of the dataframe
+    df = df.assign(OutlineColor = df[category_column].map(custom_outline_colors),
+                   nice_variable_name = df[variable_column].map(settings.get('parameter_name_map')))
+    
+    # Sort data by site name, then by defined variable order
+    variable_order_mapping = {v: i for i, v in enumerate(variable_order)}
+    df_sorted = df.sort_values(
+        by=[site_column, variable_column],
+        key=lambda col: col.astype(object).map(variable_order_mapping) if col.name == variable_column else col
+    ).reset_index(drop=True)
+    
+    n_sites = df_sorted[site_column].nunique()
+    n_variables = df_sorted[variable_column].nunique()
+    if render_mode == 'auto':
+        render_mode = 'scatter' if n_sites * n_variables <= 1000 else 'heatmap'
+    if height is None:
+        height = max(400, 25 * n_sites + 200)
+    if width is None:
+        width = max(600, 60 * n_variables + 450)
+    
+    fig = go.Figure()
+    if render_mode == 'heatmap':
+        # Lighter fill for interim results, as a heatmap cell has no outline
+        heatmap_colors = {
+            "PASS (Final)": "#98c785", 
+            "FAIL (Final)": "#ff7f7f", 
+            "PASS (Interim)": "#cfe5c6", 
+            "FAIL (Interim)": "#ffc4c4"
+        }
+        categories = list(heatmap_colors.keys())
+        sites = sorted(df_sorted[site_column].unique())
+        variables = [x for x in variable_order if x in set(df_sorted[variable_column])] + sorted(set(df_sorted[variable_column]) - set(variable_order))
+        
+        # Grid of category codes, one row per site and one column per variable
+        site_position = pd.Index(sites).get_indexer(df_sorted[site_column])
+        variable_position = pd.Index(variables).get_indexer(df_sorted[variable_column].astype(object))
+        codes = pd.Index(categories).get_indexer(df_sorted[category_column].astype(object))
+        valid = (site_position >= 0) & (variable_position >= 0) & (codes >= 0)
+        z = np.full((len(sites), len(variables)), np.nan)
+        z[site_position[valid], variable_position[valid]] = codes[valid]
+        labels = np.where(np.isnan(z), '', np.array(categories + [''])[np.nan_to_num(z, nan=len(categories)).astype(int)])
+        
+        # Discrete colour bands centred on the category codes
+        colorscale = []
+        for i, category in enumerate(categories):
+            colorscale += [[i / len(categories), heatmap_colors[category]], [(i + 1) / len(categories), heatmap_colors[category]]]
+        fig.add_trace(
+            go.Heatmap(
+                z=z,
+                x=[settings.get('parameter_name_map').get(x, x) for x in variables],
+                y=sites,
+                text=labels,
+                hovertemplate='%{y}<br>%{x}<br>%{text}<extra></extra>',
+                colorscale=colorscale,
+                zmin=-0.5,
+                zmax=len(categories) - 0.5,
+                xgap=2,
+                ygap=2,
+                showscale=False,
+            )
+        )
+        # Legend entries for the categories in the data
+        for category in categories:
+            if category in set(df_sorted[category_column]):
+                fig.add_trace(go.Scatter(x=[None], y=[None], mode='markers', name=category,
+                                         marker=dict(size=15, symbol='square', color=heatmap_colors[category])))
+    else:
+        # Create the scatter plot with separate traces
+        trace_type = go.Scattergl if render_mode == 'webgl' else go.Scatter
+        for category, color in custom_colors.items():
+            subset = df_sorted[df_sorted[category_column] == category]
+            
+            # Skip empty subsets
+            if subset.empty:
+                continue
+            
+            fig.add_trace(
+                trace_type(
+                    x=subset['nice_variable_name'],
+                    y=subset[site_column],
+                    mode='markers',
+                    marker=dict(
+                        size=25,
+                        color=color,
+                        line=dict(color=custom_outline_colors[category], width=5)  # Per-category outline color
+                    ),
+                    name=category  # Ensures correct legend entries
+                )
+            )
+    
+    # Update layout
+    fig.update_layout(
+        height=height,
+        width=width,
+        template='plotly_white',
+        xaxis_title="",
+        yaxis_title="",
+        legend_title="",
+        xaxis=dict(tickangle=90) ,
+        legend=dict(
+        yanchor="top",  # Anchor legend at the top
+        y=1.0,          # Set vertical position
+        xanchor="left", # Anchor legend on the left
+        x=1.05,         # Set horizontal position
+        itemsizing="constant",  # Consistent item sizes
+        itemwidth=40,  # Add spacing between items (increase to add more space)
+        valign="middle",  # Vertical alignment within legend items
+    )
+    )
+    
+    fig.update_layout(
+    yaxis=dict(
+        categoryorder='array',  # Use a custom order
+        categoryarray=sorted([x for x in df_sorted[site_column].unique()])  # Your custom list of site names
+        )
+    )
+    
+    # Save the plot
+    fig.write_html(save_name, include_plotlyjs="cdn")
+    export_image(fig, save_name_image)
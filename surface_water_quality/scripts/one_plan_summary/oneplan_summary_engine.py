@@ -0,0 +1,616 @@
+import os
+import copy
+import numpy as np
+import pandas as pd
+from itertools import chain
+import sys
+#shared modules (e.g. build_manifest) are in the shared folder at the top of the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'shared'))
+from build_manifest import hash_frame, hash_settings, code_version, load_manifest, output_status, record_output, report_build
+from workbook_cache import read_sheet
+from filter_spec import state_filter_spec, trend_filter_spec, apply_filter_spec
+from image_export import start_image_batch, write_image_batch
+from oneplan_plots import plot_donut_figure, plot_final_interim_donut_figure, plot_percentage_stacked_bar, plot_trend_table, plot_heatmap_results
+
+#folder the figures and the build manifest are saved in
+RESULTS_DIR = '../../results/one_plan_summary'
+
+
+def load_settings():
+    settings = {
+        'data_file'              :    r'./data/HRC_AllStateandTrends_230824.xlsx',
+        'image_formats'          :    ['svg'],    #formats the figures are saved in as images, e.g. ['svg','png','pdf']
+        'heatmap_render_mode'    :    'auto',     #scatter, webgl, heatmap or auto (heatmap for more than 1000 cells)
+        #
+        'state_tab'              :    'OnePlanState',
+        'state_columns'          :   {
+            'site_column'        :    'sID',
+            'end_year_column'    :    'EndYear',
+            'end_year'           :    2022,
+            'pass_fail_column'   :    'Grade',
+            'grades'             :    ['PASS','FAIL'],
+            'number_ok_column'   :    'nOK',
+            'site_type_column'   :    'Type',
+            'parameter_column'   :    'PrettyStandard',},
+        #    
+        'trends_tab'             :    'Trends',    
+        'trends_columns'         :    {
+            'site_column'        :    'sID',
+            'end_year_column'    :    'EndYEar',
+            'end_year'           :    2022,    
+            'site_type_column'   :    'Type',
+            'status_type_column' :    r'Status',
+            'parameter_column'   :    'npID',
+            'trend_dir_column'   :   'TrendDirection',
+            'trend_dir_ok'       :    ['Decreasing','Increasing','Indeterminate','Not Analysed'],
+            'trend_period_column':   'Period',
+            'confidence_column'  :   'SimpleConfidence',},
+        #
+        'parameter_name_map'     : {
+            'DRP'                     : 'Dissolved Reactive Phosphorus',
+            'SIN'                     : 'Soluble Inorganic Nitrogen',
+            'NH4-N (max)'             : 'Ammoniacal Nitrogen <br>(maximum value)',
+            'NH4-N (mean)'            : 'Ammoniacal Nitrogen <br>(average value)',
+            'NH4N'                    : 'Ammoniacal Nitrogen',
+            'NH4-N'                   : 'Ammoniacal Nitrogen',
+            'E. coli (Bathing)'       : '<i>E. coli</i> <br>(bathing season)',
+            'E. coli (year round)'    : '<i>E. coli</i> <br>(all year)',
+            'ECOLI'                   : '<i>E. coli</i>',
+            'Faecal Coliforms (median)': 'Faecal Coliforms <br>(median value)',
+            'Faecal Coliforms (q90)'  : 'Faecal Coliforms <br>(90th percentile)',
+            'Enterococci (bathing)'   : 'Enterococci <br>(bathing season)',
+            'Enterococci (non-bathing)': 'Enterococci <br>(all year)',
+            'Clarity'                 : 'Visual Clarity', 
+            'CLAR'                    : 'Visual Clarity',
+            'DO (Sat)'                : 'Dissolved Oxygen Saturation',
+            'DO_Sat'                  : 'Dissolved Oxygen Saturation',
+            'Chlorophyll-a'           : 'Chlorophyll-<i>a</i>',  
+            'Chl_a'                   : 'Chlorophyll-<i>a</i>', 
+            'MCI'                     : 'Macroinvertebrate Community Index',
+            'Periphyton (filaments)'  : 'Periphyton <br>(filaments)',
+            'Peri_fils'               : 'Periphyton <br>(filaments)',
+            'Periphyton (mats)'       : 'Periphyton <br>(mats)',
+            'Peri_mats'               : 'Periphyton <br>(mats)',
+            'Chlorophyll-a (max)'     : 'Chlorophyll-<i>a</i> (maximum)',
+            'Chlorophyll-a (mean)'    : 'Chlorophyll-<i>a</i> (mean)', 
+            'E. coli (non-bathing)'   : '<i>E. coli</i> <br>(all year)',
+            'TN'                      : 'Total Nitrogen', 
+            'TP'                      : 'Total Phosphorus', 
+            'NH4-N (pH>8.5)'          : 'Ammoniacal Nitrogen',
+            'Temperature'             : 'Temperature',
+            'TEMP'                    : 'Temperature',
+            },
+        #
+        'impact_sites'           :   ['Hautapu at d/s Taihape STP',
+        'Makakahi at d/s Eketahuna STP',
+        'Makotuku at d/s Raetihi STP',
+        'Manawatu at d/s PNCC STP',
+        'Manawatu at ds Fonterra Longburn',
+        'Mangaatua at d/s Woodville STP',
+        'Mangaehuehu at d/s Rangataua STP',
+        'Mangaore at d/s Shannon STP',
+        'Mangarangiora at d/s Ormondville STP',
+        'Mangarangiora trib at ds Norsewood STP',
+        'Mangatainoka at d/s Pahiatua STP',
+        'Mangatera at d/s Dannevirke STP',
+        'Mangawhero at d/s Ohakune STP',
+        'Oroua at d/s AFFCO Feilding',
+        'Oroua at d/s Feilding STP',
+        'Oroua tributary at d/s Kimbolton STP',
+        'Oruakeretaki at d/s PPCS Oringi STP',
+        'Piakatutu at d/s Sanson STP',
+        'Pongaroa at d/s Pongaroa STP',
+        'Porewa at d/s Hunterville STP',
+        'Porewa at d/s Hunterville STP site A',
+        'Rangitawa Stream at ds Halcombe oxpond',
+        'Rangitikei at d/s Riverlands',
+        'Rangitikei at us Riverlands STP',
+        'Tutaenui Stream at d/s Marton STP',
+        'Unnamed Trib of Waipu at ds Ratana STP',
+        'Waitangi at d/s Waiouru STP',
+        'Whangaehu at d/s Winstone Pulp',
+        ],
+        'arrow_html_template' : '''
+            <div style="font-size: 24px; 
+                        color: |COLOR|; 
+                        -ms-transform: rotate(|ANGLE|deg); /* IE 9 */
+                        -webkit-transform: rotate(|ANGLE|deg); /* Chrome, Safari, Opera */
+                        transform: rotate(|ANGLE|deg); /* Standard syntax */
+                        display: inline-block;
+                        text-shadow: 1px 1px 2px black;
+                        ">
+                <i class="fa fa-arrow-right" aria-hidden="true"></i>
+            </div>
+            ''',
+        'circle_html_template' : '''
+            <div style="font-size: 24px; 
+                        color: |COLOR|; 
+                        -ms-transform: rotate(|ANGLE|deg); /* IE 9 */
+                        -webkit-transform: rotate(|ANGLE|deg); /* Chrome, Safari, Opera */
+                        transform: rotate(|ANGLE|deg); /* Standard syntax */
+                        display: inline-block;
+                        text-shadow: 1px 1px 2px black;
+                        ">
+                <i class="fa fa-circle" aria-hidden="true"></i>
+            </div>
+            ''',    
+        'confidences' : {
+        'Very Likely Improving'   : {'angle' : "↑", 'color' : '#a8caea', 'multiplier' : 4},
+        'Likely Improving'        : {'angle' : "↗", 'color' : '#c4dfb9', 'multiplier' : 3},
+        'Low Confidence'          : {'angle' : "→", 'color' : '#ffd966', 'multiplier' : 2},
+        'Likely Degrading'        : {'angle' : "↘", 'color' : '#f6b26b', 'multiplier' : 2},
+        'Very Likely Degrading'   : {'angle' : "↓", 'color' : '#ff7f7f', 'multiplier' : 4},
+        'Not Analysed'            : {'angle' : "●" , 'color' : '#bcbcbc', 'multiplier' : 2},
+        },
+        #
+        #per site type settings, state_columns, trends_columns and parameter_name_map are added to the shared settings above
+        'site_types' : {
+            'River'   : {
+                'file_suffix'        :    '',
+                'state_figures'      :    ['donut','bar'],
+                'all_confidences'    :    True,
+                'state_columns'      :    {
+                    'number_ok'      :    ['Final'],    #Final only, or include Interim?
+                    'site_type'      :    ['River'],
+                    'parameters'     :    [['DRP','SIN','NH4-N (max)','NH4-N (mean)','E. coli (year round)', 'Clarity'],
+                                           # ['E. coli (Bathing)','E. coli (year round)', 'Clarity', 'DO (Sat)'],
+                                           # ['E. coli (year round)', 'Clarity', 'DO (Sat)'],
+                                           ['Chlorophyll-a', 'MCI','Periphyton (filaments)','Periphyton (mats)']],},
+                'trends_columns'     :    {
+                    'site_type'      :    ['River'],
+                    'status_type'    :    ['RepSite'],
+                    'parameters'     :    ['DRP','SIN','NH4N',
+                                           'ECOLI','CLAR',#'DO_Sat',
+                                           'Chl_a','MCI', 'Peri_fils', 'Peri_mats'],
+                    'trend_periods'  :    [10,20],},
+                'parameter_name_map' :    {
+                    'Clarity'        :    'Visual Clarity <br> ', 
+                    'CLAR'           :    'Visual Clarity <br> ',},
+                },
+            'Lake'    : {
+                'file_suffix'        :    '_lake',
+                'state_figures'      :    ['donut','heatmap'],
+                'heatmap_size'       :    (800, 750),    #(height, width), None computes it from the number of sites or parameters
+                'state_columns'      :    {
+                    'number_ok'      :    ['Final','Interim'],
+                    'site_type'      :    ['Lake'],
+                    'parameters'     :    [['Chlorophyll-a (max)','Chlorophyll-a (mean)', 'E. coli (Bathing)', 'E. coli (non-bathing)', 'TP', 'TN', 'Clarity','NH4-N (pH>8.5)'],],},
+                'trends_columns'     :    {
+                    'site_type'      :    ['Lake'],
+                    'status_type'    :    ['Lake'],
+                    'parameters'     :    ['ECOLI','TP','NH4N','Chl_a','TN'],
+                    'trend_periods'  :    [10],},
+                },
+            'Beach'   : {
+                'file_suffix'        :    '_Coastal',
+                'state_figures'      :    ['donut','heatmap'],
+                'heatmap_size'       :    (410, 820),
+                'state_columns'      :    {
+                    'number_ok'      :    ['Final','Interim'],
+                    'site_type'      :    ['Beach'],
+                    'parameters'     :    [['Chlorophyll-a','Faecal Coliforms (median)','Faecal Coliforms (q90)','Enterococci (bathing)',
+                                            'Enterococci (non-bathing)','NH4-N','TN','TP'],],},
+                'trends_columns'     :    {
+                    'site_type'      :    ['Beach'],
+                    'status_type'    :    ['Beach'],
+                    'parameters'     :    ['Chl_a','NH4N','TN','TP'],
+                    'trend_periods'  :    [10],},
+                },
+            'Estuary' : {
+                'file_suffix'        :    '_estuary',
+                'state_figures'      :    ['donut','heatmap'],
+                'heatmap_size'       :    (580, 850),
+                'state_columns'      :    {
+                    'number_ok'      :    ['Final','Interim'],
+                    'site_type'      :    ['Estuary'],
+                    'parameters'     :    [['Chlorophyll-a','Clarity','DO (Sat)','DRP','E. coli (year round)','E. coli (Bathing)',
+                                            'NH4-N','SIN','Temperature'],],},
+                'trends_columns'     :    {
+                    'site_type'      :    ['Estuary'],
+                    'status_type'    :    ['Estuary'],
+                    'parameters'     :    ['Chl_a','DO_Sat','DRP','ECOLI','NH4N','SIN','TEMP'],
+                    'trend_periods'  :    [10],},
+                },
+            },
+        }
+    return settings
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+def site_type_settings(settings  : dict,
+                       site_type : str) -> dict:
+    '''
+    Function to get the settings of one site type, the shared settings with the state_columns, trends_columns and
+    parameter_name_map of the site type added.
+
+    Parameters
+    ----------
+    settings : dict
+        DESCRIPTION. Settings from load_settings.
+    site_type : str
+        DESCRIPTION. Key of the site type in settings['site_types'] (e.g. River).
+
+    Returns
+    -------
+    type_settings : dict
+        DESCRIPTION. Settings of the site type.
+
+    '''
+    type_settings = copy.deepcopy({x : settings.get(x) for x in settings.keys() if x != 'site_types'})
+    for key_j, value_j in settings.get('site_types').get(site_type).items():
+        if isinstance(value_j, dict):
+            type_settings.setdefault(key_j, {}).update(value_j)
+        else:
+            type_settings.update({key_j : value_j})
+    return type_settings
+###############################################################################
+###############################################################################
+###############################################################################
+def site_type_rows(indices   : dict,
+                   site_type : list) -> np.ndarray:
+    '''
+    Function to get the positions of the rows of some site types.
+
+    Parameters
+    ----------
+    indices : dict
+        DESCRIPTION. Dictionary of site type -> row positions, from the groupby of the site type column.
+    site_type : list
+        DESCRIPTION. Site types (e.g. ['Beach']).
+
+    Returns
+    -------
+    np.ndarray
+        DESCRIPTION. Positions of the rows, in the order of the data.
+
+    '''
+    return np.sort(np.concatenate([np.asarray(indices.get(x), dtype=np.int64) for x in site_type if x in indices] + [np.array([], dtype=np.int64)]))
+###############################################################################
+###############################################################################
+###############################################################################
+def as_categorical(series     : pd.Series,
+                   categories : list|None = None) -> pd.Series:
+    '''
+    Function to convert a column to a categorical column. The categories are fixed by the settings (e.g. the parameters
+    or confidences), values of the column that are not in the settings are added after them so no value is lost.
+
+    Parameters
+    ----------
+    series : pd.Series
+        DESCRIPTION. Column to convert.
+    categories : list|None, optional
+        DESCRIPTION. The default is None. Categories in their order, None uses the values of the column (sorted) without unused categories.
+
+    Returns
+    -------
+    pd.Series
+        DESCRIPTION. Categorical column.
+
+    '''
+    if categories is None:
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return series.cat.remove_unused_categories()
+        return series.astype('category')
+    extra = sorted(set(series.dropna().unique()) - set(categories))
+    return series.astype(pd.CategoricalDtype(list(categories) + extra))
+###############################################################################
+###############################################################################
+###############################################################################
+def load_state_data(settings   : dict,
+                    site_types : list) -> dict:
+    '''
+    Function to read the state data once for all site types, split it by site type and filter each part with the state
+    filters of its site type (filter_spec.state_filter_spec). Each filter is one pass over the rows of the site type and the
+    data is copied once.
+
+    Parameters
+    ----------
+    settings : dict
+        DESCRIPTION. Settings from load_settings.
+    site_types : list
+        DESCRIPTION. Keys of the site types in settings['site_types'].
+
+    Returns
+    -------
+    dict
+        DESCRIPTION. Dictionary of site type -> filtered state data.
+
+    '''
+    columns = settings.get('state_columns')
+    data = read_sheet(settings.get('data_file'), settings.get('state_tab'), convert_sheets = [settings.get('state_tab'), settings.get('trends_tab')])
+    #the text columns repeat a few values, as categories the filters and groupbys work on integer codes
+    text_columns = [columns.get(x) for x in ['site_column','pass_fail_column','number_ok_column','site_type_column','parameter_column']]
+    data = data.astype({x : 'category' for x in text_columns if x in data.columns})
+    
+    #split by site type once, each site type is then filtered from its own rows
+    indices = data.groupby(columns.get('site_type_column'), sort=False).indices
+    state_data = {}
+    for site_type_j in site_types:
+        type_settings = site_type_settings(settings, site_type_j)
+        rows = site_type_rows(indices, type_settings.get('state_columns').get('site_type'))
+        sub_data = apply_filter_spec(data, state_filter_spec(type_settings), rows = rows, label = f'{site_type_j} state')
+        type_columns = type_settings.get('state_columns')
+        #create new column for final vs interim
+        sub_data['pass_fail_interim_final'] = sub_data[columns.get('pass_fail_column')].astype(object) + ' (' + sub_data[columns.get('number_ok_column')].astype(object) + ')'
+        #fixed categories from the settings of the site type, the grades are sorted as the slices of the donut plots
+        sub_data = sub_data.assign(**{columns.get('site_column')      : as_categorical(sub_data[columns.get('site_column')]),
+                                      columns.get('site_type_column') : as_categorical(sub_data[columns.get('site_type_column')]),
+                                      columns.get('parameter_column') : as_categorical(sub_data[columns.get('parameter_column')], list(chain.from_iterable(type_columns.get('parameters')))),
+                                      columns.get('pass_fail_column') : as_categorical(sub_data[columns.get('pass_fail_column')], sorted(columns.get('grades'))),
+                                      columns.get('number_ok_column') : as_categorical(sub_data[columns.get('number_ok_column')], type_columns.get('number_ok')),
+                                      'pass_fail_interim_final'       : as_categorical(sub_data['pass_fail_interim_final'], sorted([f'{x} ({y})' for y in type_columns.get('number_ok') for x in columns.get('grades')]))})
+        state_data.update({site_type_j : sub_data})
+    return state_data
+###############################################################################
+###############################################################################
+###############################################################################
+def load_trend_data(settings   : dict,
+                    site_types : list) -> dict:
+    '''
+    Function to read the trend data once for all site types, split it by site type and filter each part with the trend
+    filters of its site type (filter_spec.trend_filter_spec).
+
+    Parameters
+    ----------
+    settings : dict
+        DESCRIPTION. Settings from load_settings.
+    site_types : list
+        DESCRIPTION. Keys of the site types in settings['site_types'].
+
+    Returns
+    -------
+    dict
+        DESCRIPTION. Dictionary of site type -> filtered trend data.
+
+    '''
+    columns = settings.get('trends_columns')
+    data = read_sheet(settings.get('data_file'), settings.get('trends_tab'), convert_sheets = [settings.get('state_tab'), settings.get('trends_tab')])
+    #the text columns repeat a few values, as categories the filters and groupbys work on integer codes
+    text_columns = [columns.get(x) for x in ['site_column','site_type_column','status_type_column','parameter_column','trend_dir_column','confidence_column']]
+    data = data.astype({x : 'category' for x in text_columns if x in data.columns})
+    
+    #split by site type once, each site type is then filtered from its own rows
+    indices = data.groupby(columns.get('site_type_column'), sort=False).indices
+    trend_data = {}
+    for site_type_j in site_types:
+        type_settings = site_type_settings(settings, site_type_j)
+        rows = site_type_rows(indices, type_settings.get('trends_columns').get('site_type'))
+        sub_data = apply_filter_spec(data, trend_filter_spec(type_settings), rows = rows, label = f'{site_type_j} trends')
+        #fixed categories from the settings of the site type, the parameters are sorted as the rows of the trend tables
+        sub_data = sub_data.assign(**{x : as_categorical(sub_data[x]) for x in text_columns if x in sub_data.columns})
+        sub_data = sub_data.assign(**{columns.get('parameter_column')  : as_categorical(sub_data[columns.get('parameter_column')], sorted(type_settings.get('trends_columns').get('parameters'))),
+                                      columns.get('confidence_column') : as_categorical(sub_data[columns.get('confidence_column')], list(settings.get('confidences').keys()))})
+        trend_data.update({site_type_j : sub_data})
+    return trend_data
+###############################################################################
+###############################################################################
+###############################################################################
+def image_files(save_name : str,
+                settings  : dict) -> list:
+    '''
+    Function to get the image files of a figure, one for each of the image formats.
+
+    Parameters
+    ----------
+    save_name : str
+        DESCRIPTION. Path of the figure without the extension.
+    settings : dict
+        DESCRIPTION. Settings of the site type from site_type_settings.
+
+    Returns
+    -------
+    list
+        DESCRIPTION. Image files of the figure.
+
+    '''
+    return [f'{save_name}.{x}' for x in settings.get('image_formats', ['svg'])]
+###############################################################################
+###############################################################################
+###############################################################################
+def make_state_figures(data            : pd.DataFrame,
+                       settings        : dict,
+                       manifest        : dict,
+                       figure_settings : dict):
+    '''
+    Function to make the state figures of one site type: a donut plot of each parameter group, with a stacked bar
+    (state_heat_) or heatmap (heatmap_) of the same group, as set by state_figures.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DESCRIPTION. State data of the site type from load_state_data.
+    settings : dict
+        DESCRIPTION. Settings of the site type from site_type_settings.
+    manifest : dict
+        DESCRIPTION. Build manifest, figures with unchanged inputs are skipped.
+    figure_settings : dict
+        DESCRIPTION. Hashes of the settings and code, added to the inputs of each figure.
+
+    '''
+    suffix = settings.get('file_suffix')
+    for iter_j,parameter_group_j in enumerate(settings.get('state_columns').get('parameters')):
+        #filter to parameters of interest
+        sub_data = data.loc[data[settings.get('state_columns').get('parameter_column')].isin(parameter_group_j)].reset_index(drop=True)
+        #plot donut plot
+        save_name = f'{RESULTS_DIR}/state_{iter_j}{suffix}'
+        figure_inputs = dict(figure_settings, data = hash_frame(sub_data))
+        if output_status(manifest, f'{save_name}.html', figure_inputs, other_files = image_files(save_name, settings)) is not None:
+            if 'heatmap' in settings.get('state_figures'):
+                plot_final_interim_donut_figure(sub_data,settings,name_column = 'pass_fail_interim_final', 
+                                                facet_column = settings.get('state_columns').get('parameter_column'),
+                                                save_name = f'{save_name}.html',
+                                                save_name_image = f'{save_name}.svg',
+                                                variable_order = parameter_group_j,
+                                                height = 300*(len(parameter_group_j)/2))
+            else:
+                plot_donut_figure(sub_data,settings,name_column = settings.get('state_columns').get('pass_fail_column'), 
+                                  facet_column = settings.get('state_columns').get('parameter_column'),
+                                  save_name = f'{save_name}.html',
+                                  save_name_image = f'{save_name}.svg',
+                                  variable_order = parameter_group_j,
+                                  height = 300*(len(parameter_group_j)/2))
+            record_output(manifest, f'{save_name}.html', figure_inputs)
+        
+        if 'bar' in settings.get('state_figures'):
+            save_name = f'{RESULTS_DIR}/state_heat_{iter_j}{suffix}'
+            figure_inputs = dict(figure_settings, data = hash_frame(sub_data))
+            if output_status(manifest, f'{save_name}.html', figure_inputs, other_files = image_files(save_name, settings)) is not None:
+                plot_percentage_stacked_bar(sub_data, settings, 
+                                            name_column=settings.get('state_columns').get('pass_fail_column'), 
+                                            facet_column= settings.get('state_columns').get('parameter_column'), 
+                                            save_name=f'{save_name}.html',
+                                            save_name_image=f'{save_name}.svg',
+                                            variable_order=parameter_group_j, 
+                                            height=600)
+                record_output(manifest, f'{save_name}.html', figure_inputs)
+        
+        if 'heatmap' in settings.get('state_figures'):
+            save_name = f'{RESULTS_DIR}/heatmap_{iter_j}{suffix}'
+            figure_inputs = dict(figure_settings, data = hash_frame(sub_data))
+            if output_status(manifest, f'{save_name}.html', figure_inputs, other_files = image_files(save_name, settings)) is not None:
+                plot_heatmap_results(sub_data,settings,
+                                     site_column = settings.get('state_columns').get('site_column'), 
+                                     variable_column = settings.get('state_columns').get('parameter_column'), 
+                                     variable_order = parameter_group_j,
+                                     category_column = 'pass_fail_interim_final', 
+                                     save_name = f'{save_name}.html',
+                                     save_name_image = f'{save_name}.svg',
+                                     height = settings.get('heatmap_size', (None, None))[0],
+                                     width = settings.get('heatmap_size', (None, None))[1],
+                                     render_mode = settings.get('heatmap_render_mode', 'auto'))
+                record_output(manifest, f'{save_name}.html', figure_inputs)
+###############################################################################
+###############################################################################
+###############################################################################
+def trend_proportions(trend_data : dict,
+                      settings   : dict) -> pd.DataFrame:
+    '''
+    Function to get the proportion of trends in each confidence category, for every site type, trend period and parameter
+    at once.
+
+    Parameters
+    ----------
+    trend_data : dict
+        DESCRIPTION. Dictionary of site type -> trend data, from load_trend_data.
+    settings : dict
+        DESCRIPTION. Settings from load_settings.
+
+    Returns
+    -------
+    proportions : pd.DataFrame
+        DESCRIPTION. Tidy dataframe with columns site_type, period, parameter and confidence columns, count and percentage
+        (of the trends of the site type, period and parameter).
+
+    '''
+    columns = settings.get('trends_columns')
+    keys = [columns.get('trend_period_column'), columns.get('parameter_column'), columns.get('confidence_column')]
+    data = pd.concat({x : trend_data.get(x)[keys] for x in trend_data.keys()}, names = ['site_type']).reset_index(level=0)
+    
+    proportions = data.groupby(['site_type'] + keys, sort=True, observed=True).size().reset_index(name='count')
+    proportions['percentage'] = (proportions['count'] / proportions.groupby(['site_type'] + keys[:2])['count'].transform('sum')) * 100
+    return proportions
+###############################################################################
+###############################################################################
+###############################################################################
+def make_trend_figures(proportions     : pd.DataFrame,
+                       settings        : dict,
+                       manifest        : dict,
+                       figure_settings : dict):
+    '''
+    Function to make the trend tables of one site type, one for each trend period.
+
+    Parameters
+    ----------
+    proportions : pd.DataFrame
+        DESCRIPTION. Trend proportions of the site type from trend_proportions.
+    settings : dict
+        DESCRIPTION. Settings of the site type from site_type_settings.
+    manifest : dict
+        DESCRIPTION. Build manifest, figures with unchanged inputs are skipped.
+    figure_settings : dict
+        DESCRIPTION. Hashes of the settings and code, added to the inputs of each figure.
+
+    '''
+    for period_j, sub_data in proportions.groupby(settings.get('trends_columns').get('trend_period_column'), sort=False):
+        sub_data = sub_data.reset_index(drop=True)
+        save_name = f"{RESULTS_DIR}/trend_{period_j}_year{settings.get('file_suffix')}"
+        figure_inputs = dict(figure_settings, data = hash_frame(sub_data))
+        if output_status(manifest, f'{save_name}.html', figure_inputs, other_files = image_files(save_name, settings)) is not None:
+            plot_trend_table(sub_data,settings, years = period_j, 
+                             variable_column = settings.get('trends_columns').get('parameter_column'),
+                             confidence_column = settings.get('trends_columns').get('confidence_column'),
+                             save_name = f'{save_name}.html', 
+                             save_name_image = f'{save_name}.svg',
+                             all_confidences = settings.get('all_confidences', False))
+            record_output(manifest, f'{save_name}.html', figure_inputs)
+###############################################################################
+###############################################################################
+###############################################################################
+def run_summary(site_types : list|None = None,
+                run_state  : bool = True,
+                run_trend  : bool = True,
+                settings   : dict|None = None):
+    '''
+    Function to make the One Plan summary figures of several site types in one run. The state and trend sheets are read
+    and filtered once, and shared by all site types.
+
+    Parameters
+    ----------
+    site_types : list|None, optional
+        DESCRIPTION. The default is None. Keys of the site types in settings['site_types'], None makes every site type.
+    run_state : bool, optional
+        DESCRIPTION. The default is True. Make the state figures (donuts, stacked bars and heatmaps).
+    run_trend : bool, optional
+        DESCRIPTION. The default is True. Make the trend tables.
+    settings : dict|None, optional
+        DESCRIPTION. The default is None. Settings, None uses load_settings.
+
+    '''
+    if settings is None:
+        settings = load_settings()
+    if site_types is None:
+        site_types = list(settings.get('site_types').keys())
+    
+    #the build manifest records the inputs of each figure, so figures with unchanged inputs are not made again
+    manifest = load_manifest(f'{RESULTS_DIR}/build_manifest.json')
+    code = code_version(os.path.dirname(os.path.abspath(__file__)))
+    
+    #the images of all figures are saved together at the end of the run
+    start_image_batch(settings.get('image_formats', ['svg']))
+    
+    if run_state:
+        state_data = load_state_data(settings, site_types)
+    if run_trend:
+        #the trend proportions are saved for the report tables, the trend tables are made from them
+        proportions = trend_proportions(load_trend_data(settings, site_types), settings)
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        proportions.to_csv(f'{RESULTS_DIR}/trend_proportions.csv', index=False)
+        try:
+            proportions.to_parquet(f'{RESULTS_DIR}/trend_proportions.parquet', index=False)
+        except ImportError:
+            #pyarrow is not installed, the csv has the same table
+            pass
+    
+    for site_type_j in site_types:
+        type_settings = site_type_settings(settings, site_type_j)
+        figure_settings = {'settings' : hash_settings(type_settings), 'code' : code}
+        if run_state:
+            make_state_figures(state_data.get(site_type_j), type_settings, manifest, figure_settings)
+        if run_trend:
+            make_trend_figures(proportions.loc[proportions['site_type'] == site_type_j], type_settings, manifest, figure_settings)
+    
+    n_images = write_image_batch()
+    print(f'Saved {n_images} images')
+    
+    #save the manifest and report what was remade
+    report_build(manifest)
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+if __name__ == '__main__':
+    #make the figures of every site type in one run
+    run_summary()
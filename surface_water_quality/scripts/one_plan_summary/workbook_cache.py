@@ -0,0 +1,146 @@
+import os
+import re
+import hashlib
+import tempfile
+import pandas as pd
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+def file_sha256(file_path : str) -> str:
+    '''
+    Function to hash the contents of a file.
+
+    Parameters
+    ----------
+    file_path : str
+        DESCRIPTION. Path to the file.
+
+    Returns
+    -------
+    str
+        DESCRIPTION. sha256 of the file.
+
+    '''
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+###############################################################################
+###############################################################################
+###############################################################################
+def sheet_cache_file(file_path  : str,
+                     sheet_name : str,
+                     file_hash  : str,
+                     cache_dir  : str) -> str:
+    '''
+    Function to get the Parquet file a sheet of a workbook is cached in, keyed by the workbook hash and the sheet name.
+
+    '''
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    sheet = ''.join([x if x.isalnum() else '_' for x in str(sheet_name)])
+    return os.path.join(cache_dir, f'{stem}_{sheet}_{file_hash[:16]}.parquet')
+###############################################################################
+###############################################################################
+###############################################################################
+def parquet_safe(df : pd.DataFrame) -> pd.DataFrame:
+    '''
+    Function to make the columns of a sheet storable in Parquet. Text columns that also hold numbers (e.g. '<0.5' and 0.7)
+    are stored as text, every other column keeps the type it was read from the workbook with.
+
+    '''
+    df = df.copy()
+    for column_j in df.select_dtypes(include='object').columns:
+        types = set(type(x) for x in df[column_j].dropna())
+        if len(types) > 1:
+            df[column_j] = df[column_j].where(df[column_j].isna(), df[column_j].astype(str))
+    df.columns = [str(x) for x in df.columns]
+    return df
+###############################################################################
+###############################################################################
+###############################################################################
+def write_sheet_cache(df         : pd.DataFrame,
+                      cache_file : str):
+    '''
+    Function to save a sheet to its Parquet cache file. The sheet is written to a temporary file that is moved into place
+    with os.replace, so a script reading the cache never sees a half-written file. The cache files of older versions of
+    the workbook (the same sheet with another hash) are deleted.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        DESCRIPTION. The sheet, from parquet_safe.
+    cache_file : str
+        DESCRIPTION. Cache file of the sheet, from sheet_cache_file.
+
+    '''
+    cache_dir = os.path.dirname(os.path.abspath(cache_file))
+    os.makedirs(cache_dir, exist_ok=True)
+    handle, temp_file = tempfile.mkstemp(dir = cache_dir, prefix = f'{os.path.basename(cache_file)}.', suffix = '.tmp')
+    os.close(handle)
+    try:
+        df.to_parquet(temp_file, index=False)
+        os.replace(temp_file, cache_file)
+    finally:
+        if os.path.isfile(temp_file):
+            os.remove(temp_file)
+
+    #{stem}_{sheet}_{hash}.parquet files of the same sheet with another hash
+    prefix = os.path.basename(cache_file)[:-len('0123456789abcdef.parquet')]
+    stale = re.compile(re.escape(prefix) + r'[0-9a-f]{16}\.parquet')
+    for file_j in os.listdir(cache_dir):
+        if stale.fullmatch(file_j) and file_j != os.path.basename(cache_file):
+            os.remove(os.path.join(cache_dir, file_j))
+###############################################################################
+###############################################################################
+###############################################################################
+def read_sheet(file_path      : str,
+               sheet_name     : str,
+               cache_dir      : str|None = None,
+               convert_sheets : list|None = None) -> pd.DataFrame:
+    '''
+    Function to read a sheet of an Excel workbook through a Parquet cache. The first time a workbook is read its sheets
+    are converted to Parquet, later reads (from any script) load the Parquet copy, which is much faster than parsing
+    the workbook. A changed workbook has a different hash, so it is converted again and the old copies are deleted.
+
+    Parameters
+    ----------
+    file_path : str
+        DESCRIPTION. Path to the workbook.
+    sheet_name : str
+        DESCRIPTION. Name of the sheet to read.
+    cache_dir : str|None, optional
+        DESCRIPTION. The default is None. Folder of the Parquet copies, None uses a workbook_cache folder next to the workbook.
+    convert_sheets : list|None, optional
+        DESCRIPTION. The default is None. Other sheets to convert while the workbook is parsed (e.g. the state and trends tabs),
+        so the workbook is only parsed once.
+
+    Returns
+    -------
+    pd.DataFrame
+        DESCRIPTION. The sheet, with the same values every time it is read.
+
+    '''
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(file_path)), 'workbook_cache')
+    file_hash  = file_sha256(file_path)
+    cache_file = sheet_cache_file(file_path, sheet_name, file_hash, cache_dir)
+    if os.path.isfile(cache_file):
+        return pd.read_parquet(cache_file)
+
+    #parse the workbook once for every sheet that is not cached yet
+    sheet_names = [sheet_name] + [x for x in (convert_sheets or []) if x != sheet_name and not os.path.isfile(sheet_cache_file(file_path, x, file_hash, cache_dir))]
+    sheets = pd.read_excel(file_path, sheet_name = sheet_names)
+    for sheet_j, data_j in sheets.items():
+        sheets.update({sheet_j : parquet_safe(data_j)})
+        try:
+            write_sheet_cache(sheets.get(sheet_j), sheet_cache_file(file_path, sheet_j, file_hash, cache_dir))
+        except ImportError:
+            #pyarrow is not installed, so the workbook is parsed on every read
+            pass
+    #the sheet is returned as it is read from the cache, so the first read has the same types as later reads
+    if os.path.isfile(cache_file):
+        return pd.read_parquet(cache_file)
+    return sheets.get(sheet_name)
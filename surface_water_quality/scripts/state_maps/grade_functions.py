@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+#label used for missing grades, it is given the lowest code so that it never wins a worst-grade comparison
+NO_DATA = 'No Data'
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+def get_grade_dtype(settings: dict) -> pd.CategoricalDtype:
+    '''
+    Function to build the ordered categorical type used for NOF grades. The grade order (best to worst) is the order of
+    the keys in settings['map_settings']['nof_grade_mapping'], and 'No Data' is placed first so it has code 0.
+
+    Parameters
+    ----------
+    settings : dict
+        DESCRIPTION. Settings dictionary.
+
+    Returns
+    -------
+    pd.CategoricalDtype
+        DESCRIPTION. Ordered categorical type ['No Data', best grade, ..., worst grade].
+
+    '''
+    grades = [x for x in settings.get('map_settings').get('nof_grade_mapping').keys() if x not in [NO_DATA, '']]
+    return pd.CategoricalDtype([NO_DATA] + grades, ordered=True)
+###############################################################################
+###############################################################################
+###############################################################################
+def to_grades(values      : pd.Series|list,
+              grade_dtype : pd.CategoricalDtype) -> pd.Series:
+    '''
+    Function to convert grade strings to the grade type. Empty strings, placeholders and missing values become 'No Data'.
+
+    Parameters
+    ----------
+    values : pd.Series|list
+        DESCRIPTION. Grade strings.
+    grade_dtype : pd.CategoricalDtype
+        DESCRIPTION. Grade type from get_grade_dtype.
+
+    Returns
+    -------
+    pd.Series
+        DESCRIPTION. Series of grades with the grade type.
+
+    '''
+    values = pd.Series(values)
+    unknown = [x for x in values.dropna().unique() if str(x).strip() != '' and x not in grade_dtype.categories]
+    if len(unknown) > 0:
+        print(f'Grades {unknown} are not in nof_grade_mapping, treating them as {NO_DATA}...')
+    return values.astype(grade_dtype).fillna(NO_DATA)
+###############################################################################
+###############################################################################
+###############################################################################
+def worst_grade(data        : pd.DataFrame,
+                columns     : list,
+                grade_dtype : pd.CategoricalDtype) -> pd.Series:
+    '''
+    Function to get the row-wise worst grade over several grade columns. 'No Data' is only returned if every column is 'No Data'.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DESCRIPTION. Dataframe with grade columns.
+    columns : list
+        DESCRIPTION. Columns to take the worst grade over.
+    grade_dtype : pd.CategoricalDtype
+        DESCRIPTION. Grade type from get_grade_dtype.
+
+    Returns
+    -------
+    pd.Series
+        DESCRIPTION. Series of the worst grades with the grade type.
+
+    '''
+    codes = np.column_stack([data[x].astype(grade_dtype).cat.codes.to_numpy() for x in columns])
+    worst = codes.max(axis=1)
+    return pd.Series(pd.Categorical.from_codes(np.maximum(worst, 0), dtype=grade_dtype), index=data.index)
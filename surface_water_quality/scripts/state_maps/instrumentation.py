@@ -0,0 +1,212 @@
+import os
+import time
+import json
+import pstats
+import cProfile
+import contextlib
+import pandas as pd
+
+#resource (unix) or psutil (windows) is used for the peak memory of the process
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+#timings of the stages run in this process, keyed by (stage path, label, process id)
+_STAGE_RECORDS = {}
+#stages that are currently running, as (name, label)
+_STAGE_STACK = []
+#cProfile results of the top level stages, only kept when profiling is enabled
+_STAGE_PROFILES = {}
+_PROFILE_SETTINGS = {'enabled' : False}
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+def peak_rss_mb() -> float|None:
+    '''
+    Function to get the peak resident memory of this process so far, in MB.
+
+    Returns
+    -------
+    float|None
+        DESCRIPTION. Peak memory in MB, or None if it cannot be measured.
+
+    '''
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        #ru_maxrss is in bytes on macOS and kilobytes on linux
+        return peak / 1024**2 if os.uname().sysname == 'Darwin' else peak / 1024
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss) / 1024**2
+    return None
+###############################################################################
+###############################################################################
+###############################################################################
+def enable_profiling(enabled : bool = True):
+    '''
+    Function to turn on cProfile for the top level stages, so the hottest stage can be dumped by write_stage_report.
+
+    Parameters
+    ----------
+    enabled : bool, optional
+        DESCRIPTION. The default is True.
+
+    '''
+    _PROFILE_SETTINGS.update({'enabled' : enabled})
+###############################################################################
+###############################################################################
+###############################################################################
+@contextlib.contextmanager
+def stage(name         : str,
+          label        : str|None = None,
+          output_files : list|None = None):
+    '''
+    Context manager to record the wall time, CPU time, peak memory and output bytes of a stage. Stages can be nested, the
+    recorded stage is the path of the nested names (e.g. make_map/add_site_level_results). Repeated calls of the same stage
+    and label are summed.
+
+    Parameters
+    ----------
+    name : str
+        DESCRIPTION. Name of the stage.
+    label : str|None, optional
+        DESCRIPTION. The default is None. Label of the stage (e.g. the map name), None uses the label of the enclosing stage.
+    output_files : list|None, optional
+        DESCRIPTION. The default is None. Files written by the stage, their sizes are recorded once the stage finishes.
+
+    '''
+    if label is None:
+        label = _STAGE_STACK[-1][1] if len(_STAGE_STACK) > 0 else ''
+    _STAGE_STACK.append((name, label))
+    path = '/'.join([x[0] for x in _STAGE_STACK])
+
+    #only top level stages are profiled, as only one profiler can run at a time
+    profiler = None
+    if _PROFILE_SETTINGS.get('enabled') and len(_STAGE_STACK) == 1:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    wall_start = time.perf_counter()
+    cpu_start  = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu  = time.process_time() - cpu_start
+        if profiler is not None:
+            profiler.disable()
+            _STAGE_PROFILES.update({path : profiler})
+        _STAGE_STACK.pop()
+
+        record = _STAGE_RECORDS.setdefault((path, label, os.getpid()), {'stage'        : path,
+                                                                         'label'        : label,
+                                                                         'pid'          : os.getpid(),
+                                                                         'calls'        : 0,
+                                                                         'wall_s'       : 0.0,
+                                                                         'cpu_s'        : 0.0,
+                                                                         'peak_rss_mb'  : None,
+                                                                         'output_bytes' : 0})
+        record['calls']  += 1
+        record['wall_s'] += wall
+        record['cpu_s']  += cpu
+        record['peak_rss_mb']   = peak_rss_mb()
+        record['output_bytes'] += sum([os.path.getsize(x) for x in (output_files or []) if os.path.isfile(x)])
+###############################################################################
+###############################################################################
+###############################################################################
+def get_stage_records() -> list:
+    '''
+    Function to get the stage records of this process.
+
+    Returns
+    -------
+    list
+        DESCRIPTION. List of stage record dictionaries.
+
+    '''
+    return [dict(x) for x in _STAGE_RECORDS.values()]
+###############################################################################
+###############################################################################
+###############################################################################
+def clear_stage_records():
+    '''
+    Function to clear the stage records and running stages of this process (e.g. in a worker process before each task,
+    as a forked worker inherits them from the main process).
+
+    '''
+    _STAGE_RECORDS.clear()
+    _STAGE_STACK.clear()
+###############################################################################
+###############################################################################
+###############################################################################
+def add_stage_records(records : list):
+    '''
+    Function to merge stage records from another process (e.g. a worker of make_maps). The records are placed under the
+    stage that is currently running.
+
+    Parameters
+    ----------
+    records : list
+        DESCRIPTION. List of stage record dictionaries from get_stage_records.
+
+    '''
+    prefix = '/'.join([x[0] for x in _STAGE_STACK])
+    for record_j in records:
+        record_j = dict(record_j)
+        if prefix != '':
+            record_j['stage'] = f"{prefix}/{record_j['stage']}"
+        current = _STAGE_RECORDS.get((record_j['stage'], record_j['label'], record_j['pid']))
+        if current is None:
+            _STAGE_RECORDS.update({(record_j['stage'], record_j['label'], record_j['pid']) : record_j})
+        else:
+            for key_j in ['calls', 'wall_s', 'cpu_s', 'output_bytes']:
+                current[key_j] += record_j[key_j]
+            current['peak_rss_mb'] = max([x for x in [current['peak_rss_mb'], record_j['peak_rss_mb']] if x is not None], default=None)
+###############################################################################
+###############################################################################
+###############################################################################
+def write_stage_report(report_name : str) -> pd.DataFrame:
+    '''
+    Function to write the stage records to {report_name}.csv and {report_name}.json and print a summary of the top level
+    stages. If profiling is enabled, the profile of the top level stage with the most wall time is saved to {report_name}.prof
+    and its most expensive functions are printed. Only this process is profiled, so set map_workers to 1 to profile the maps.
+
+    Parameters
+    ----------
+    report_name : str
+        DESCRIPTION. Path of the report, without extension.
+
+    Returns
+    -------
+    summary : pd.DataFrame
+        DESCRIPTION. Dataframe of the stages summed over labels and processes.
+
+    '''
+    os.makedirs(os.path.dirname(os.path.abspath(report_name)), exist_ok=True)
+    records = pd.DataFrame(get_stage_records(), columns = ['stage','label','pid','calls','wall_s','cpu_s','peak_rss_mb','output_bytes'])
+    summary = records.groupby('stage', sort=False).agg(calls        = ('calls','sum'),
+                                                       wall_s       = ('wall_s','sum'),
+                                                       cpu_s        = ('cpu_s','sum'),
+                                                       peak_rss_mb  = ('peak_rss_mb','max'),
+                                                       output_bytes = ('output_bytes','sum')).reset_index()
+    records.to_csv(f'{report_name}.csv', index=False)
+    with open(f'{report_name}.json', 'w', encoding='utf-8') as f:
+        json.dump({'summary' : summary.to_dict(orient='records'),
+                   'stages'  : records.to_dict(orient='records')}, f, indent=1)
+
+    print(summary.loc[~summary['stage'].str.contains('/')].round(3).to_string(index=False))
+
+    if len(_STAGE_PROFILES) > 0:
+        top_level = summary.loc[summary['stage'].isin(list(_STAGE_PROFILES.keys()))]
+        #wall time, as a stage that ran its work in worker processes has next to no CPU time in this process
+        hottest = top_level.sort_values(by='wall_s').iloc[-1]['stage']
+        _STAGE_PROFILES.get(hottest).dump_stats(f'{report_name}.prof')
+        print(f'Profile of the hottest stage ({hottest}) saved to {report_name}.prof')
+        pstats.Stats(_STAGE_PROFILES.get(hottest)).sort_stats('cumulative').print_stats(15)
+    return summary
@@ -5,12 +5,95 @@ import os
 import folium
 import geopandas as gpd
 import datetime
+import json
+import hashlib
 from branca.element import Template, MacroElement, Element, IFrame
 from folium.plugins import Geocoder, FeatureGroupSubGroup
-from map_functions import assign_site_to_fmu, make_map
+from map_functions import assign_sites_to_fmu, make_maps, make_multi_attribute_map, write_site_histories, load_zone_riverlines, riverline_cache_key
+from vector_tiles import export_vector_tiles
+import sys
+#shared modules (e.g. geospatial_layers, build_manifest) are in the shared folder at the top of the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'shared'))
+from geospatial_layers import get_geospatial_layer
+from grade_functions import NO_DATA, get_grade_dtype, to_grades, worst_grade
+from build_manifest import hash_frame, hash_settings, code_version, load_manifest, output_status, record_output, report_build
+from instrumentation import stage, enable_profiling, write_stage_report
 from settings import load_settings
 
+#pyarrow parses the state csv in parallel, without it the default pandas parser is used
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
+
+###############################################################################
+###############################################################################
+###############################################################################
+def river_state_dtypes(settings: dict) -> dict:
+    '''
+    Function to get the columns of the river state data that the maps need, and the dtype to read each of them with.
+    The text columns are read as categories, which keeps the frame small as the state and trend export grows.
+
+    Parameters
+    ----------
+    settings : dict
+        DESCRIPTION. Settings dictionary.
+
+    Returns
+    -------
+    dict
+        DESCRIPTION. Dictionary of column name -> dtype.
+
+    '''
+    dtypes = {settings.get('site_column')          : 'category',
+              settings.get('year_column')          : 'category',
+              settings.get('NPS_attribute_column') : 'category',
+              settings.get('NPS_grade_column')     : 'category',
+              settings.get('status_column')        : 'category',
+              settings.get('x_column')             : 'float64',
+              settings.get('y_column')             : 'float64'}
+    if settings.get('remove_filter_fails'):
+        #the filter column is left to be inferred, as it is read as a bool when it has no missing values
+        dtypes.update({settings.get('filter_column') : None})
+    return dtypes
+###############################################################################
+###############################################################################
+###############################################################################
+def read_river_state_data(settings: dict) -> pd.DataFrame:
+    '''
+    Function to read the columns of the river state data that the maps need. If state_data_cache_dir is in the settings,
+    the csv is converted once to a Parquet copy (rebuilt when the csv changes) and only the years of interest are read from it.
+
+    Parameters
+    ----------
+    settings : dict
+        DESCRIPTION. Settings dictionary.
+
+    Returns
+    -------
+    pd.DataFrame
+        DESCRIPTION. Dataframe of the needed columns.
+
+    '''
+    file_path = settings.get('river_state_data')
+    dtypes    = river_state_dtypes(settings)
+    columns   = list(dtypes.keys())
+    read_csv  = lambda: pd.read_csv(file_path,
+                                    usecols = columns,
+                                    dtype   = {k:v for k,v in dtypes.items() if v is not None},
+                                    engine  = 'pyarrow' if pyarrow is not None else 'c')
+
+    cache_dir = settings.get('state_data_cache_dir')
+    if cache_dir is None or pyarrow is None:
+        return read_csv()
+
+    key = hashlib.sha1(json.dumps([os.path.abspath(file_path), os.path.getsize(file_path), os.path.getmtime(file_path), dtypes]).encode('utf-8')).hexdigest()[:16]
+    cache_file = os.path.join(cache_dir, f'{os.path.splitext(os.path.basename(file_path))[0]}_{key}.parquet')
+    if not os.path.isfile(cache_file):
+        os.makedirs(cache_dir, exist_ok=True)
+        read_csv().to_parquet(cache_file, index=False)
+    return pd.read_parquet(cache_file, filters = [(settings.get('year_column'), 'in', list(settings.get('years_of_interest')))])
 ###############################################################################
 ###############################################################################
 ###############################################################################
@@ -30,35 +113,33 @@ def load_data_add_geospatial_region(settings: dict) -> gpd.GeoDataFrame:
 
     '''
     #load data
-    rivers_data = pd.read_csv(settings.get('river_state_data'))
-    #filter to years of interest
-    rivers_data = rivers_data.loc[rivers_data[settings.get('year_column')].isin(settings.get('years_of_interest'))].reset_index(drop=True)
-    # maybe remove impact sites
+    rivers_data = read_river_state_data(settings)
+    #filter to years of interest, maybe remove impact sites and filter fails, and remove sites not wanted/needed, in one pass
+    keep = rivers_data[settings.get('year_column')].isin(settings.get('years_of_interest'))
     if not settings.get('include_impact_sites'):
-        rivers_data = rivers_data.loc[rivers_data[settings.get('status_column')] == settings.get('rep_site_status')].reset_index(drop=True)
-    #maybe remove filter fails
+        keep &= rivers_data[settings.get('status_column')] == settings.get('rep_site_status')
     if settings.get('remove_filter_fails'):
-        rivers_data = rivers_data.loc[rivers_data[settings.get('filter_column')] == True].reset_index(drop=True)
-        
-    #remove sites not wanted/needed
-    rivers_data = rivers_data.loc[~rivers_data[settings.get('site_column')].isin(settings.get('ignore_sites'))]
+        keep &= rivers_data[settings.get('filter_column')] == True
+    keep &= ~rivers_data[settings.get('site_column')].isin(settings.get('ignore_sites'))
+    rivers_data = rivers_data.loc[keep].reset_index(drop=True)
+    for column_j in rivers_data.select_dtypes('category').columns:
+        rivers_data[column_j] = rivers_data[column_j].cat.remove_unused_categories()
     
   
-    #get list of sites
-    all_sites = list(rivers_data[settings.get('site_column')].unique())
-    site_region_map = {}
-    for site_j in all_sites:
-        sub_data = rivers_data.loc[rivers_data[settings.get('site_column')] == site_j]
-        my_x = sub_data[settings.get('x_column')].values[-1]
-        my_y = sub_data[settings.get('y_column')].values[-1]
-        my_region = assign_site_to_fmu(my_x,my_y,settings,settings.get('site_epsg_code'), region_type = settings.get('region_type'), max_distance = settings.get('max_distance'))
-        site_region_map.update({site_j:my_region})
+    #get the last recorded location of each site and assign all sites to a region in one go
+    site_locations = rivers_data.drop_duplicates(subset=settings.get('site_column'), keep='last')
+    site_regions = assign_sites_to_fmu(site_locations,
+                                       settings,
+                                       site_column  = settings.get('site_column'),
+                                       x_column     = settings.get('x_column'),
+                                       y_column     = settings.get('y_column'),
+                                       epsg_code    = settings.get('site_epsg_code'),
+                                       region_type  = settings.get('region_type'),
+                                       max_distance = settings.get('max_distance'))
+    site_region_map = site_regions['region'].to_dict()
         
-    #iterate through rivers data 
-    region_column = []
-    for site_k in rivers_data[settings.get('site_column')]:
-        region_column.append(site_region_map.get(site_k,None))
-    rivers_data[settings.get('region_type')] = region_column
+    #add region to rivers data 
+    rivers_data[settings.get('region_type')] = rivers_data[settings.get('site_column')].map(site_region_map)
 
     return rivers_data
 
@@ -78,6 +159,185 @@ def create_df(settings):
 #################################################################################################################
 #################################################################################################################
 #################################################################################################################
+def build_site_state_table(rivers_data : pd.DataFrame,
+                           rivers_sites: list,
+                           site_dict   : dict,
+                           settings    : dict) -> pd.DataFrame:
+    '''
+    Function to build the site level state table (one row per site and state period, one column per attribute) in one pass.
+    The long NOF grade data is pivoted to a wide table of ordered categorical grades (see grade_functions.get_grade_dtype) and
+    the composite Water quality, Aquatic Life and Ecosystem Health grades are the row-wise worst grades of their attributes.
+
+    Parameters
+    ----------
+    rivers_data : pd.DataFrame
+        DESCRIPTION. Long dataframe of NOF grades (one row per site, state period and attribute), as returned by load_data_add_geospatial_region.
+    rivers_sites : list
+        DESCRIPTION. Sorted list of sites to include.
+    site_dict : dict
+        DESCRIPTION. Mapping of Hilltop site names to site names with macrons.
+    settings : dict
+        DESCRIPTION. Settings dictionary.
+
+    Returns
+    -------
+    gis_data : pd.DataFrame
+        DESCRIPTION. Dataframe with the same columns as create_df. Missing grades are 'No Data'.
+
+    '''
+    site_column      = settings.get('site_column')
+    year_column      = settings.get('year_column')
+    attribute_column = settings.get('NPS_attribute_column')
+    grade_column     = settings.get('NPS_grade_column')
+    grade_dtype      = get_grade_dtype(settings)
+
+    data = rivers_data.loc[(rivers_data[site_column].isin(rivers_sites)) & (rivers_data[year_column].isin(settings.get('years_of_interest')))]
+
+    #rows are ordered by state period and then by site, sites with no data in a state period are left out
+    all_rows = pd.MultiIndex.from_product([settings.get('years_of_interest'), rivers_sites], names = [year_column, site_column])
+    meta_data = data.drop_duplicates(subset=[year_column, site_column], keep='first').set_index([year_column, site_column])
+    #the text columns are read as categories (see river_state_dtypes), the site table keeps their plain values
+    meta_data = meta_data.astype({x : meta_data[x].cat.categories.dtype for x in meta_data.select_dtypes('category').columns})
+    for state_period_j, site_i in all_rows[~all_rows.isin(meta_data.index)]:
+        print(f'Check data, site {site_i}, {state_period_j}, data is missing...')
+    all_rows  = all_rows[all_rows.isin(meta_data.index)]
+    meta_data = meta_data.reindex(all_rows)
+
+    #pivot the grades to one column per parameter
+    grades = data.loc[data[attribute_column].isin(settings.get('parameter_list'))]
+    grades = grades.drop_duplicates(subset=[year_column, site_column, attribute_column], keep='first')
+    grades = grades.pivot(index=[year_column, site_column], columns=attribute_column, values=grade_column)
+    grades = grades.reindex(index=all_rows, columns=settings.get('parameter_list'))
+    grades = grades.apply(lambda x: to_grades(x, grade_dtype))
+
+    #composite grades
+    water_quality       = worst_grade(grades, settings.get('water_quality_attributes'), grade_dtype)
+    aquatic_life        = worst_grade(grades, settings.get('aquatic_life_attributes'), grade_dtype)
+    ecosystem_processes = pd.Series(NO_DATA, index=all_rows, dtype=grade_dtype)
+    ecosystem_health    = worst_grade(pd.concat([water_quality, aquatic_life, ecosystem_processes], axis=1, keys=['water_quality', 'aquatic_life', 'ecosystem_processes']),
+                                      ['water_quality', 'aquatic_life', 'ecosystem_processes'],
+                                      grade_dtype)
+
+    site_names = all_rows.get_level_values(site_column)
+    for site_i in site_names[~site_names.isin(list(site_dict.keys()))]:
+        print(f'{site_i} missing from macron dictionary')
+
+    gis_data = pd.concat([pd.Series(site_names, index=all_rows),                                 #Hilltop site name
+                          pd.Series([site_dict.get(x,x) for x in site_names], index=all_rows),   #macron site name
+                          meta_data[settings.get('x_column')],                                   #NZTM x
+                          meta_data[settings.get('y_column')],                                   #NZTM y
+                          meta_data[settings.get('status_column')],                              #Status
+                          meta_data[settings.get('region_type')],                                #FMU
+                          ecosystem_health,                                                      #Ecosystem health score
+                          water_quality,                                                         #Water quality score
+                          grades['NOF.CLAR.Med'],                                                #Suspended Fine Sediment score
+                          grades['NOF.DRP.Combined'],                                            #DRP score
+                          grades['NOF.NH4N.Combined'],                                           #NH4 score
+                          grades['NOF.NO3.Combined'],                                            #NO3 score
+                          grades['NOF.Chl_a'],                                                   #Chlorophyll_a score
+                          aquatic_life,                                                          #Aquatic Life score
+                          grades['NOF.ASPM'],                                                    #ASPM score
+                          grades['NOF.MCI'],                                                     #MCI score
+                          grades['NOF.QMCI'],                                                    #QMCI score
+                          pd.Series(NO_DATA, index=all_rows, dtype=grade_dtype),                 #Fish IBI score
+                          ecosystem_processes,                                                   #Ecosystem Processes score
+                          ecosystem_processes,                                                   #DO score
+                          grades['NOF.ECOLI.Combined'],                                          #Human Health SOE score
+                          grades['NOF.ECOLI.G260'],                                              #E. coli G260 score
+                          grades['NOF.ECOLI.G540'],                                              #E. coli G540 score
+                          grades['NOF.ECOLI.Med'],                                               #E. coli median score
+                          grades['NOF.ECOLI.p95'],                                               #E. coli 95th percentile score
+                          pd.Series(all_rows.get_level_values(year_column), index=all_rows),     #state period
+                          ], axis=1).reset_index(drop=True)
+    gis_data.columns = create_df(settings).columns
+
+    return gis_data
+#################################################################################################################
+#################################################################################################################
+def build_fmu_state_table(gis_data : pd.DataFrame,
+                          settings : dict) -> pd.DataFrame:
+    '''
+    Function to build the FMU level state table, the worst grade of each attribute for every state period and FMU,
+    with a single grouped aggregation over the grade codes. There is no 'Region' row, as in the maps the Region layer is
+    drawn from the site data (the FMU rows are merged with the FMU polygons, which have no Region polygon).
+
+    Parameters
+    ----------
+    gis_data : pd.DataFrame
+        DESCRIPTION. Site level state table, as returned by build_site_state_table.
+    settings : dict
+        DESCRIPTION. Settings dictionary.
+
+    Returns
+    -------
+    fmu_data : pd.DataFrame
+        DESCRIPTION. Dataframe with columns FMU, the final_name_map attributes and state period. FMUs without sites have 'No Data'.
+
+    '''
+    grade_dtype   = get_grade_dtype(settings)
+    grade_columns = [settings.get('final_name_map').get(x) for x in list(settings.get('final_name_map').keys())]
+    fmu_list      = list(settings.get('fmu_name_map').values())
+
+    #missing grades have code 0, so the max code is the worst grade
+    codes = pd.DataFrame({column_j : gis_data[column_j].astype(grade_dtype).cat.codes.clip(lower=0) for column_j in grade_columns})
+    codes['state period'] = gis_data['state period'].values
+    codes['FMU']          = gis_data['FMU'].values
+    codes = codes.loc[codes['FMU'].isin(fmu_list)]
+
+    worst_codes = codes.groupby(['state period', 'FMU'])[grade_columns].max()
+
+    all_rows    = pd.MultiIndex.from_product([settings.get('years_of_interest'), fmu_list], names = ['state period', 'FMU'])
+    worst_codes = worst_codes.reindex(all_rows, fill_value=0)
+
+    fmu_data = pd.DataFrame({column_j : pd.Categorical.from_codes(worst_codes[column_j].to_numpy(), dtype=grade_dtype) for column_j in grade_columns})
+    fmu_data.insert(0, 'FMU', all_rows.get_level_values('FMU'))
+    fmu_data['state period'] = all_rows.get_level_values('state period')
+
+    return fmu_data
+###############################################################################
+###############################################################################
+###############################################################################
+def get_map_inputs(fmu_data : gpd.GeoDataFrame,
+                   gis_data : gpd.GeoDataFrame,
+                   columns  : list,
+                   settings : dict,
+                   options  : dict,
+                   code     : str) -> dict:
+    '''
+    Function to get the hashes of the inputs of one map, for the build manifest. Only the grade columns shown on the map
+    are hashed, so a changed grade only rebuilds the maps of that attribute (and the composites it is part of).
+
+    Parameters
+    ----------
+    fmu_data : gpd.GeoDataFrame
+        DESCRIPTION. Geodataframe of state data at a FMU level.
+    gis_data : gpd.GeoDataFrame
+        DESCRIPTION. Geodataframe of state data at a site level.
+    columns : list
+        DESCRIPTION. Grade columns shown on the map.
+    settings : dict
+        DESCRIPTION. Settings dictionary.
+    options : dict
+        DESCRIPTION. Remaining arguments of the map (legend, popup mode, etc).
+    code : str
+        DESCRIPTION. Code version from build_manifest.code_version.
+
+    Returns
+    -------
+    dict
+        DESCRIPTION. Dictionary of input name -> hash.
+
+    '''
+    grade_columns = list(settings.get('final_name_map').values())
+    return {'fmu_data'  : hash_frame(fmu_data, [x for x in fmu_data.columns if x not in grade_columns or x in columns]),
+            'site_data' : hash_frame(gis_data, [x for x in gis_data.columns if x not in grade_columns or x in columns]),
+            'settings'  : hash_settings({'map_settings'        : settings.get('map_settings'),
+                                         'geospatial_settings' : settings.get('geospatial_settings'),
+                                         'options'             : options}),
+            'code'      : code}
+#################################################################################################################
+#################################################################################################################
+#################################################################################################################
 
 
 if __name__ == '__main__':
@@ -87,14 +347,15 @@ if __name__ == '__main__':
     settings  =  load_settings()
     currentstateperiod = settings.get('years_of_interest')[-1]
     maplegendtemplates = settings.get('map_settings').get('map_legend_templates')
-    rivers_data  =  load_data_add_geospatial_region(settings)
+    #the wall time, CPU time, peak memory and output size of each stage are written to results/rivers/timing (profile_stages in the settings also saves a cProfile of the slowest stage)
+    if settings.get('profile_stages', False):
+        enable_profiling()
+    with stage('load_data_add_geospatial_region'):
+        rivers_data  =  load_data_add_geospatial_region(settings)
     
     # filter to years of interest
     current_rivers_data = rivers_data.loc[rivers_data[settings.get('year_column')] == settings.get('years_of_interest')[-1]]
 
-    #prepare pandas dataframe
-    gis_data = create_df(settings)
-    
     #get sites
     rivers_sites = get_sites_lists(current_rivers_data,settings)
     
@@ -104,130 +365,66 @@ if __name__ == '__main__':
     with open(settings.get('macron_data_file'), 'rb') as f:
         site_dict = pickle.load(f)
     
-    for state_period_j in settings.get('years_of_interest'):
-        state_period_data = rivers_data.loc[rivers_data[settings.get('year_column')] == state_period_j].reset_index(drop=True)
-        #iterate through river sites
-        for site_i in rivers_sites:
-            temp_data = None
-            temp_data = state_period_data.loc[state_period_data[settings.get('site_column')] == site_i]
-            
-            if not len(temp_data) > 0:
-                print(f'Check data, site {site_i}, {state_period_j}, data is missing...')
-            else:
-                #create list and append the data
-                temp_list = []
-                temp_list.append(site_i)  #append Hilltop site name
-                if not site_dict.get(site_i):
-                    print(f'{site_i} missing from macron dictionary')
-                temp_list.append(site_dict.get(site_i,site_i))  #append macron site name
-                temp_list.append(temp_data[settings.get('x_column')].values[0])  #append NZTM x
-                temp_list.append(temp_data[settings.get('y_column')].values[0])  #append NZTM y
-                
-                temp_list.append(temp_data[settings.get('status_column')].values[0])  #append Status
-                temp_list.append(temp_data[settings.get('region_type')].values[0])  #append FMU
-
-                #Create dictionary with parameetrs as keys and NOF grades as values
-                temp_dict = {}
-                for param_i in settings.get('parameter_list'):
-                    temp_data_2 = None
-                    temp_data_2 = temp_data.loc[temp_data[settings.get('NPS_attribute_column')] == param_i]
-                    if len(temp_data_2)>0:
-                        temp_dict.update({param_i:temp_data_2[settings.get('NPS_grade_column')].values[0]})
-                    else:
-                        temp_dict.update({param_i:''})
-                
-                #----------------------------------------------------------
-                #Create list of water quality
-                water_quality = []
-                for wq_i in settings.get('water_quality_attributes'):
-                    water_quality.append(temp_dict.get(wq_i))
-                water_quality = max(water_quality)
-                #----------------------------------------------------------
-                
-                #----------------------------------------------------------
-                #Create list of aquatic life
-                aquatic_life = []
-                for al_i in settings.get('aquatic_life_attributes'):
-                    aquatic_life.append(temp_dict.get(al_i))
-                aquatic_life = max(aquatic_life)
-                #----------------------------------------------------------
-                
-        
-                #----------------------------------------------------------
-                #Create list of Ecosystem processes
-                # ecosystem_processes = None
-                # if site_i in rivers_DOx_sites:
-                #     ecosystem_processes = rivers_DOx.loc[(rivers_DOx[settings.get('dox_site_column')] == site_i) & 
-                #                                          (rivers_DOx[settings.get('NPS_dox_attribute_column')] == settings.get('dox_combined_attr'))][settings.get('NPS_dox_grade_column')].values[0]
-                # else:
-                ecosystem_processes = ''
-                #----------------------------------------------------------
-        
-                #----------------------------------------------------------
-                #Create list of Ecosystem health
-                ecosystem_health = None
-                ecosystem_health = [water_quality,
-                                 aquatic_life,
-                                 ecosystem_processes,
-                                 ]
-                ecosystem_health = max(ecosystem_health)
-                #----------------------------------------------------------    
-                temp_list.append(ecosystem_health)  #append Ecosystem health score
-                temp_list.append(water_quality)  #append Water quality score
-                temp_list.append(temp_dict['NOF.CLAR.Med'])  #append Suspended Fine Sediment score
-                temp_list.append(temp_dict['NOF.DRP.Combined'])  #append Suspended DRP score
-                temp_list.append(temp_dict['NOF.NH4N.Combined'])  #append NH4 score
-                temp_list.append(temp_dict['NOF.NO3.Combined'])  #append NO3 score
-                temp_list.append(temp_dict['NOF.Chl_a'])  #append Chlorophyll_a score
-                temp_list.append(aquatic_life)  #append Aquatic Life score
-                temp_list.append(temp_dict['NOF.ASPM'])  #append ASPM score
-                temp_list.append(temp_dict['NOF.MCI'])  #append MCI score
-                temp_list.append(temp_dict['NOF.QMCI'])  #append QMCI score
-                temp_list.append('    ')  #append Fish IBI score
-                temp_list.append(ecosystem_processes)  #append Ecosystem Processes score
-                temp_list.append(ecosystem_processes)  #append DO score
-                temp_list.append(temp_dict['NOF.ECOLI.Combined'])  #append Human Health SOE score
-                temp_list.append(temp_dict['NOF.ECOLI.G260'])  #append Human Health SOE score
-                temp_list.append(temp_dict['NOF.ECOLI.G540'])  #append Human Health SOE score
-                temp_list.append(temp_dict['NOF.ECOLI.Med'])  #append Human Health SOE score
-                temp_list.append(temp_dict['NOF.ECOLI.p95'])  #append Human Health SOE score
-                temp_list.append(state_period_j)  # append state period
-        
-                gis_data.loc[len(gis_data)] = temp_list
+    #build the site level table for all state periods
+    with stage('build_site_state_table'):
+        gis_data = build_site_state_table(rivers_data, rivers_sites, site_dict, settings)
         
     dt_string = datetime.datetime.now().strftime(f'%Y_%m_%d__%H_%M')    
     
     gis_data  =  gis_data.fillna('No Data')
-    gis_data  =  gis_data.replace('','No Data')
     
     
     
     reverse_final_name_map = {v: k for k, v in settings.get('final_name_map').items()}
-    fmu_data = pd.DataFrame(columns = ['FMU'] + [settings.get('final_name_map').get(x) for x in list(settings.get('final_name_map').keys())] + ['state period'])
-    
-    for state_period_k in settings.get('years_of_interest'):
-        for fmu_k in settings.get('fmu_name_map').values():
-            filtered_gis_data = gis_data.loc[(gis_data['state period'] ==state_period_k) & (gis_data['FMU'] ==fmu_k)].reset_index(drop=True)
-            new_row = [fmu_k]
-            for column_j in [settings.get('final_name_map').get(x) for x in list(settings.get('final_name_map').keys())]:
-                if len([x for x in list(filtered_gis_data[column_j].unique()) if x != 'No Data']) > 0:
-                    new_row.append(max([x for x in list(filtered_gis_data[column_j].unique()) if x != 'No Data']))
-                else:
-                    new_row.append('No Data')
-            new_row.append(state_period_k)   
-            fmu_data.loc[len(fmu_data)] = new_row
+    #worst grade of each attribute in each FMU and state period
+    with stage('build_fmu_state_table'):
+        fmu_data = build_fmu_state_table(gis_data, settings)
             
             
-    geospatial_file = gpd.read_file(settings.get('geospatial_settings').get('geospatial_files').get('fmu').get('file'))      
+    with stage('add_geometry'):
+        geospatial_file = get_geospatial_layer(settings, 'fmu')
+        
+        fmu_data = fmu_data.merge(geospatial_file, left_on='FMU', right_on=settings.get('geospatial_settings').get('geospatial_files').get('fmu').get('name'))
+        fmu_data = gpd.GeoDataFrame(fmu_data, geometry="geometry")
+        
+        gis_data = gpd.GeoDataFrame(
+        gis_data, geometry=gpd.points_from_xy(gis_data.NZTMX, gis_data.NZTMY), crs="EPSG:2193")
+        gis_data = gis_data.to_crs(4326) 
+    
     
-    fmu_data = fmu_data.merge(geospatial_file, left_on='FMU', right_on=settings.get('geospatial_settings').get('geospatial_files').get('fmu').get('name'))
-    fmu_data = gpd.GeoDataFrame(fmu_data, geometry="geometry")
+    #the build manifest records the inputs of each output, so outputs with unchanged inputs are not rebuilt (force_rebuild in the settings rebuilds everything)
+    manifest = load_manifest(os.path.join(results_dir, 'build_manifest.json'))
+    code = code_version(os.path.dirname(os.path.abspath(__file__)))
+    force_rebuild = settings.get('force_rebuild', False)
+    all_columns = [settings.get('final_name_map').get(x,x) for x in settings.get('final_name_map').keys()]
     
-    gis_data = gpd.GeoDataFrame(
-    gis_data, geometry=gpd.points_from_xy(gis_data.NZTMX, gis_data.NZTMY), crs="EPSG:2193")
-    gis_data = gis_data.to_crs(4326) 
+    #map_popup_mode is 'inline' (site plots embedded in the maps) or 'lazy' (site plots drawn from one shared json file when opened)
+    map_popup_mode = settings.get('map_popup_mode', 'inline')
+    if map_popup_mode == 'lazy':
+        save_name = os.path.join(results_dir, 'site_histories.json')
+        inputs = get_map_inputs(fmu_data.iloc[0:0], gis_data, all_columns, settings, {'current_state_period' : currentstateperiod}, code)
+        if output_status(manifest, save_name, inputs, force_rebuild) is not None:
+            with stage('write_site_histories', output_files = [save_name]):
+                write_site_histories(gis_data,
+                                     columns              = all_columns,
+                                     save_name            = save_name,
+                                     settings             = settings,
+                                     current_state_period = currentstateperiod)
+            record_output(manifest, save_name, inputs)
     
+    #riverlines and FMU outlines as vector tiles, so the maps can show them without writing them into every map
+    plot_riverlines = settings.get('map_settings').get('plot_riverlines', False)
+    if plot_riverlines and settings.get('geospatial_settings').get('vector_tiles') is not None:
+        with stage('export_vector_tiles', output_files = [settings.get('geospatial_settings').get('vector_tiles').get('file')]):
+            export_vector_tiles(load_zone_riverlines(settings, 'fmu'),
+                                get_geospatial_layer(settings, 'fmu'),
+                                save_name           = settings.get('geospatial_settings').get('vector_tiles').get('file'),
+                                tile_settings       = settings.get('geospatial_settings').get('vector_tiles'),
+                                stream_order_column = settings.get('geospatial_settings').get('geospatial_files').get('rec2').get('stream_order'),
+                                fmu_name_column     = settings.get('geospatial_settings').get('geospatial_files').get('fmu').get('name'),
+                                source_key          = riverline_cache_key(settings, 'fmu'))
     
+    map_jobs = []
     for param_j in settings.get('final_name_map').keys():
         
         if not param_j in settings.get('ecoli_parameters'):
@@ -235,18 +432,52 @@ if __name__ == '__main__':
         else:
             legend_template = 'nof_grade_template_ecoli'
             
-        make_map(fmu_data,
-                 gis_data,
-                 current_column = settings.get('final_name_map').get(param_j,param_j),
-                     fmu_column='FMU',
-                     save_name = os.path.join(results_dir, f'{settings.get("final_name_map").get(param_j).replace(".","").replace(":"," ").replace(">"," ")}.html'),
-                     settings=settings,
-                     legend_template=maplegendtemplates.get(legend_template),
-                     plot_riverlines = False,
-                     popup_text  = True,
-                     opacity_column = False,
-                     current_state_period = currentstateperiod
-                    )
+        map_jobs.append({'current_column'       : settings.get('final_name_map').get(param_j,param_j),
+                         'fmu_column'           : 'FMU',
+                         'save_name'            : os.path.join(results_dir, f'{settings.get("final_name_map").get(param_j).replace(".","").replace(":"," ").replace(">"," ")}.html'),
+                         'legend_template'      : maplegendtemplates.get(legend_template),
+                         'plot_riverlines'      : plot_riverlines,
+                         'popup_text'           : True,
+                         'opacity_column'       : False,
+                         'current_state_period' : currentstateperiod,
+                         'popup_mode'           : map_popup_mode,
+                         'popup_data_file'      : 'site_histories.json',
+                         })
         
+    #map_output_mode is 'per_attribute' (one map per attribute), 'multi_attribute' (one map with an attribute control) or 'both'
+    map_output_mode = settings.get('map_output_mode', 'per_attribute')
+    if map_output_mode in ['per_attribute', 'both']:
+        #only the maps with changed inputs are made
+        map_inputs = {x.get('save_name') : get_map_inputs(fmu_data, gis_data, [x.get('current_column')], settings,
+                                                          {k:v for k,v in x.items() if k != 'save_name'}, code) for x in map_jobs}
+        map_jobs = [x for x in map_jobs if output_status(manifest, x.get('save_name'), map_inputs.get(x.get('save_name')), force_rebuild) is not None]
+        #make the maps, possibly in parallel (map_workers in the settings)
+        with stage('make_maps'):
+            failures = make_maps(fmu_data, gis_data, settings, map_jobs, n_workers = settings.get('map_workers', 1))
+        for map_job in map_jobs:
+            if map_job.get('save_name') not in failures:
+                record_output(manifest, map_job.get('save_name'), map_inputs.get(map_job.get('save_name')))
+    if map_output_mode in ['multi_attribute', 'both']:
+        save_name = os.path.join(results_dir, 'All attributes.html')
+        #the legend of each attribute, as for the per attribute maps
+        legend_templates = [maplegendtemplates.get('nof_grade_template_ecoli' if x in settings.get('ecoli_parameters') else 'nof_grade_template')
+                            for x in settings.get('final_name_map').keys()]
+        inputs = get_map_inputs(fmu_data, gis_data, all_columns, settings,
+                                {'legend_templates' : legend_templates, 'plot_riverlines' : plot_riverlines, 'current_state_period' : currentstateperiod}, code)
+        if output_status(manifest, save_name, inputs, force_rebuild) is not None:
+            with stage('make_multi_attribute_map', label = os.path.basename(save_name)):
+                make_multi_attribute_map(fmu_data,
+                                         gis_data,
+                                         columns              = all_columns,
+                                         fmu_column           = 'FMU',
+                                         save_name            = save_name,
+                                         settings             = settings,
+                                         legend_templates     = legend_templates,
+                                         plot_riverlines      = plot_riverlines,
+                                         current_state_period = currentstateperiod)
+            record_output(manifest, save_name, inputs)
     
-    
\ No newline at end of file
+    #save the manifest and report what was rebuilt
+    report_build(manifest)
+    #save the stage timings of this run
+    write_stage_report(os.path.join(results_dir, 'timing', f'river_maps_{dt_string}'))
@@ -1,38 +1,233 @@
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import pickle
 import os
+import json
+import html
+import traceback
+import hashlib
+import re
 import folium
 import geopandas as gpd
-from branca.element import Template, MacroElement, Element, IFrame
+from branca.element import Template, MacroElement, Element, IFrame, JavascriptLink
 from folium.plugins import Geocoder, FeatureGroupSubGroup
 from geopandas.tools import sjoin,sjoin_nearest
+from plotly.offline import get_plotlyjs_version
+import sys
+#shared modules (e.g. geospatial_layers) are in the shared folder at the top of the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'shared'))
+from geospatial_layers import get_geospatial_layer, source_signature, topology_simplify, to_topojson, write_parquet_atomic
+from grade_functions import get_grade_dtype
+from vector_tiles import add_vector_tile_layer
+from instrumentation import stage, get_stage_records, clear_stage_records, add_stage_records
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
+#inputs shared by every map made by make_maps, set once per worker process
+_SHARED_MAP_INPUTS = {}
 
+#riverlines of every zone, loaded once per process and keyed by riverline_cache_key
+_RIVERLINE_CACHE = {}
+
+#javascript for make_map. The FMU polygons and sites are written once, in one content group per FMU, and the (empty)
+#Region/FMU base layers in the layer control choose which content groups are shown and which donut plot the polygons use.
+FMU_LAYER_SWITCH_TEMPLATE = """
+{% macro script(this, kwargs) %}
+(function() {
+    var map         = {{ this._parent.get_name() }};
+    var regionPopup = {{ this.region_popup }};
+    var fmus        = [
+        {%- for fmu in this.fmus %}
+        {name: {{ fmu.name }}, content: {{ fmu.content }}, polygons: {{ fmu.polygons }}},
+        {%- endfor %}
+    ];
+    function showFmu(name) {
+        fmus.forEach(function(fmu) {
+            if (name === "Region" || name === fmu.name) { map.addLayer(fmu.content); } else { map.removeLayer(fmu.content); }
+            var popup = fmu.polygons ? fmu.polygons.getPopup() : null;
+            if (popup) {
+                if (fmu.fmuPopup === undefined) { fmu.fmuPopup = popup.getContent(); }
+                popup.setContent(name === "Region" && regionPopup ? regionPopup : fmu.fmuPopup);
+            }
+        });
+    }
+    map.on("baselayerchange", function(e) { showFmu(e.name); });
+    showFmu("Region");
+})();
+{% endmacro %}
+"""
+
+#javascript for the lazy site popups. The site grade histories are fetched from the json file written by write_site_histories
+#the first time a popup is opened, and the grade history plot is drawn in the popup.
+LAZY_POPUP_TEMPLATE = """
+{% macro script(this, kwargs) %}
+(function() {
+    var map       = {{ this._parent.get_name() }};
+    var histories = null;
+    function getHistories() {
+        if (histories === null) { histories = fetch({{ this.data_file }}).then(function(response) { return response.json(); }); }
+        return histories;
+    }
+    map.on("popupopen", function(e) {
+        var div = e.popup.getElement().querySelector(".site-history-plot");
+        if (!div || div.dataset.drawn) { return; }
+        getHistories().then(function(h) {
+            var site   = div.dataset.site;
+            var column = h.attributes.indexOf(div.dataset.column);
+            var codes  = h.sites[site] || [];
+            var traces = {};
+            for (var i = 0; i < h.periods.length; i++) {
+                if (!codes[i]) { continue; }
+                var grade = parseInt(codes[i].charAt(column), 36);
+                var label = h.grades[grade];
+                if (!(label in traces)) {
+                    traces[label] = {x: [], y: [], text: [], name: label, type: "scatter", mode: "markers+text",
+                                     marker: {color: h.colours[grade], size: []}};
+                }
+                traces[label].x.push(h.periods[i]);
+                traces[label].y.push(site);
+                traces[label].text.push(label);
+                traces[label].marker.size.push(h.periods[i] === h.current ? 40 : 20);
+            }
+            Plotly.newPlot(div, Object.values(traces),
+                           {title  : site + "<br>" + div.dataset.column,
+                            xaxis  : {type: "category", categoryorder: "category ascending", tickangle: 45},
+                            yaxis  : {visible: false, showticklabels: false},
+                            legend : {title: {text: "Grade"}}});
+            div.dataset.drawn = "1";
+        });
+    });
+})();
+{% endmacro %}
+"""
+
+#javascript for make_multi_attribute_map. The FMU polygons and sites are written once, each feature holds its grade codes
+#(one base 36 character per attribute) and the select control restyles the features in the browser. The legend of the
+#attribute is shown, and the (empty) Region/FMU base layers in the layer control choose which FMU is shown.
+MULTI_ATTRIBUTE_MAP_TEMPLATE = """
+{% macro script(this, kwargs) %}
+(function() {
+    var map          = {{ this._parent.get_name() }};
+    var attributes   = {{ this.attributes }};
+    var legends      = {{ this.legends }};
+    var gradeLabels  = {{ this.grade_labels }};
+    var gradeColours = {{ this.grade_colours }};
+    var periods      = {{ this.periods }};
+    var fmuData      = {{ this.fmu_geojson }};
+    var siteData     = {{ this.site_geojson }};
+    var current      = 0;
+    var selected     = "Region";
+
+    function gradeOf(codes) { return parseInt(codes.charAt(current), 36); }
+
+    function fmuStyle(feature) {
+        return {fillColor   : gradeColours[gradeOf(feature.properties.g)],
+                fillOpacity : {{ this.fill_opacity }},
+                color       : "{{ this.line_colour }}",
+                weight      : {{ this.line_weight }}};
+    }
+    function siteStyle(feature) {
+        return {fillColor   : gradeColours[gradeOf(feature.properties.g)],
+                fillOpacity : 0.9,
+                color       : "#000000",
+                weight      : 1,
+                opacity     : 1};
+    }
+    function sitePopup(feature) {
+        var rows = "";
+        for (var i = 0; i < periods.length; i++) {
+            var codes = feature.properties.h[i];
+            if (codes) { rows += "<tr><td>" + periods[i] + "</td><td><b>" + gradeLabels[gradeOf(codes)] + "</b></td></tr>"; }
+        }
+        return "<b>" + feature.properties.n + "</b><br>" + attributes[current] + "<table>" + rows + "</table>";
+    }
+
+    function showLegend() {
+        document.querySelectorAll(".attribute-legend").forEach(function(div) {
+            div.style.display = parseInt(div.dataset.legend) === legends[current] ? "" : "none";
+        });
+    }
+
+    var fmuLayer = L.geoJSON(null, {
+        filter        : function(feature) { return selected === "Region" || feature.properties.n === selected; },
+        style         : fmuStyle,
+        onEachFeature : function(feature, layer) {
+            layer.bindTooltip(feature.properties.n);
+            layer.bindPopup(function() { return "<b>" + feature.properties.n + "</b><br>" + attributes[current] + ": " + gradeLabels[gradeOf(feature.properties.g)]; });
+        }
+    }).addTo(map);
+
+    var siteLayer = L.geoJSON(null, {
+        filter        : function(feature) { return gradeOf(feature.properties.g) > 0 && (selected === "Region" || feature.properties.f === selected); },
+        pointToLayer  : function(feature, latlng) { return L.circleMarker(latlng, {radius: 8}); },
+        style         : siteStyle,
+        onEachFeature : function(feature, layer) {
+            layer.bindTooltip(feature.properties.n);
+            layer.bindPopup(function() { return sitePopup(feature); });
+        }
+    }).addTo(map);
+
+    function redraw() {
+        fmuLayer.clearLayers();
+        fmuLayer.addData(fmuData);
+        siteLayer.clearLayers();
+        siteLayer.addData(siteData);
+        map.closePopup();
+    }
+    map.on("baselayerchange", function(e) { selected = e.name; redraw(); });
+    redraw();
+    showLegend();
+
+    var control = L.control({position: "topright"});
+    control.onAdd = function() {
+        var div = L.DomUtil.create("div", "leaflet-bar");
+        var options = "";
+        for (var i = 0; i < attributes.length; i++) { options += "<option value='" + i + "'>" + attributes[i] + "</option>"; }
+        div.innerHTML = "<select style='font-size:18px;'>" + options + "</select>";
+        L.DomEvent.disableClickPropagation(div);
+        div.firstChild.onchange = function(e) {
+            current = parseInt(e.target.value);
+            redraw();
+            showLegend();
+        };
+        return div;
+    };
+    control.addTo(map);
+})();
+{% endmacro %}
+"""
 
 
 ###############################################################################
 ###############################################################################
 ###############################################################################
-def assign_site_to_fmu(x           : float,
-                       y           : float,
-                       settings    : dict,
-                       epsg_code   : int, 
-                       region_type : str = 'fmu', 
-                       max_distance: int|float = 500) -> str|None:
+def assign_sites_to_fmu(site_data   : pd.DataFrame,
+                        settings    : dict,
+                        site_column : str,
+                        x_column    : str,
+                        y_column    : str,
+                        epsg_code   : int,
+                        region_type : str = 'fmu',
+                        max_distance: int|float = 500) -> pd.DataFrame:
     '''
-    Function to assign an (x,y) point to a region. The region is defined by a shapefile, whch is defined in the settings.
+    Function to assign many (x,y) points to a region in one go. The region shapefile is loaded and reprojected once,
+    points that fall within a region are assigned with a single spatial join, and the remaining points are assigned with
+    a single nearest join limited to max_distance.
 
     Parameters
     ----------
-    x : float
-        DESCRIPTION. x-coordinate.
-    y : float
-        DESCRIPTION. y-coordinate.
+    site_data : pd.DataFrame
+        DESCRIPTION. Dataframe with one row per site holding the site coordinates.
     settings : dict
         DESCRIPTION. Settings dictionary.
+    site_column : str
+        DESCRIPTION. Column in site_data that identifies the site.
+    x_column : str
+        DESCRIPTION. Column in site_data with the x-coordinate.
+    y_column : str
+        DESCRIPTION. Column in site_data with the y-coordinate.
     epsg_code : int
-        DESCRIPTION. EPSG code of the (x,y) coordinate.
+        DESCRIPTION. EPSG code of the (x,y) coordinates.
     region_type : str, optional
         DESCRIPTION. The default is 'fmu'. Type of region. Usually will be 'fmu' but in future could be things like 'region', 'district', 'wmsz', etc.
     max_distance : int|float, optional
@@ -40,30 +235,135 @@ def assign_site_to_fmu(x           : float,
 
     Returns
     -------
-    my_region : str|None
-        DESCRIPTION. If the point is within a region then the name of the region, otherwise returns None.
+    site_regions : pd.DataFrame
+        DESCRIPTION. Dataframe indexed by site with a 'region' column (None if no region is within max_distance) and a 'distance' column.
 
     '''
-        
-    gdf = gpd.read_file(settings.get('geospatial_settings').get('geospatial_files').get(region_type).get('file'))
-    
-    #load
-    point  = gpd.points_from_xy([x],[y], crs = f"EPSG:{epsg_code}")
-    pointz = gpd.GeoDataFrame(point, geometry=gpd.points_from_xy(point.x, point.y, crs = f"EPSG:{epsg_code}"))
-    pointz_C = pointz.to_crs(f"EPSG:{settings.get('geospatial_settings').get('geospatial_files').get(region_type).get('epsg')}")
-
-    pointInPolys = sjoin_nearest(pointz_C, gdf, how='left', max_distance = max_distance, distance_col = 'distance')
-    if len([x_ for x_ in pointInPolys['distance'] if not pd.isna(x_)]) > 0:
-        my_region    = pointInPolys.loc[pointInPolys['distance'] == pointInPolys['distance'].min()][settings.get('geospatial_settings').get('geospatial_files').get(region_type).get('name')].values[-1]
-    else:
-        my_region = None
+    region_settings = settings.get('geospatial_settings').get('geospatial_files').get(region_type)
+    region_name     = region_settings.get('name')
+    region_crs      = f"EPSG:{region_settings.get('epsg')}"
+
+    gdf = get_geospatial_layer(settings, region_type, epsg = region_settings.get('epsg'))
+    gdf = gdf[[region_name, 'geometry']]
+
+    #build all the points at once
+    points = gpd.GeoDataFrame({'site' : site_data[site_column].values},
+                              geometry=gpd.points_from_xy(site_data[x_column], site_data[y_column], crs = f"EPSG:{epsg_code}"))
+    points = points.to_crs(region_crs)
+
+    #1) points inside a region
+    within = sjoin(points, gdf, how='inner', predicate='within')
+    within = within.groupby(level=0).last()
+    within['distance'] = 0.
+
+    #2) remaining points, nearest region within max_distance
+    outside = points.loc[~points.index.isin(within.index)]
+    nearest = sjoin_nearest(outside, gdf, how='inner', max_distance = max_distance, distance_col = 'distance')
+    nearest = nearest.loc[nearest['distance'] == nearest.groupby(level=0)['distance'].transform('min')]
+    nearest = nearest.groupby(level=0).last()
+
+    assigned = pd.concat([within[[region_name, 'distance']], nearest[[region_name, 'distance']]])
+    site_regions = pd.DataFrame({'region' : assigned[region_name], 'distance' : assigned['distance']}).reindex(points.index)
+    site_regions['region'] = site_regions['region'].astype(object).where(site_regions['region'].notna(), None)
+    site_regions.index = points['site'].values
+
+    return site_regions
+###############################################################################
+###############################################################################
+###############################################################################
+def riverline_cache_key(settings : dict,
+                        zone     : str = 'fmu') -> str:
+    '''
+    Function to build the key of the cached riverlines for a zone type. The key changes when the REC2 source, the zone
+    source or the stream order filter changes, so the cache is rebuilt instead of going stale.
+
+    Parameters
+    ----------
+    settings : dict
+        DESCRIPTION. Settings dictionary.
+    zone : str, optional
+        DESCRIPTION. The default is 'fmu'. Name of the zone type for the shapefile.
+
+    Returns
+    -------
+    str
+        DESCRIPTION. Key for the cached riverlines.
+
+    '''
+    rec_settings  = settings.get('geospatial_settings').get('geospatial_files').get('rec2')
+    zone_settings = settings.get('geospatial_settings').get('geospatial_files').get(zone)
+    key = '|'.join([source_signature(rec_settings.get('file')),
+                    f"layer={rec_settings.get('layer')}",
+                    f"stream_order={rec_settings.get('stream_order')}>={settings.get('map_settings').get('min_stream_order')}",
+                    source_signature(zone_settings.get('file')),
+                    f"zone_layer={zone_settings.get('layer')}",
+                    f"zone_name={zone_settings.get('name')}"])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+###############################################################################
+###############################################################################
+###############################################################################
+def load_zone_riverlines(settings : dict,
+                         zone     : str = 'fmu') -> gpd.GeoDataFrame:
+    '''
+    Function to get the riverlines of every zone (e.g. every FMU) in one pass. Only the part of the REC2 network under the
+    zones is read, and the result is saved as GeoParquet (by write_parquet_atomic) in the rec_fmu_riverlines folder, keyed
+    by riverline_cache_key. A cache file that cannot be read is rebuilt.
+
+    Parameters
+    ----------
+    settings : dict
+        DESCRIPTION. Settings dictionary.
+    zone : str, optional
+        DESCRIPTION. The default is 'fmu'. Name of the zone type for the shapefile.
+
+    Returns
+    -------
+    rec_zone_riverlines : gpd.GeoDataFrame
+        DESCRIPTION. geodataframe of the riverlines (EPSG 2193), with the zone name column. The index is the REC2 row, so a
+        riverline crossing a zone boundary appears once for each zone with the same index.
+
+    '''
+    key = riverline_cache_key(settings, zone)
+    if key in _RIVERLINE_CACHE:
+        return _RIVERLINE_CACHE.get(key)
     
-    return my_region
+    rec_settings = settings.get('geospatial_settings').get('geospatial_files').get('rec2')
+    cache_file   = os.path.join(settings.get('geospatial_settings').get('geospatial_files').get('rec_fmu_riverlines'), f'REC_{zone}_{key}.parquet')
+    rec_zone_riverlines = None
+    if os.path.isfile(cache_file):
+        try:
+            rec_zone_riverlines = gpd.read_parquet(cache_file)
+        except Exception as error:
+            #a damaged or unreadable cache file is rebuilt from the source
+            print(f'Rebuilding {cache_file}: {error}')
+    if rec_zone_riverlines is None:
+        #read zone data
+        zone_name_column = settings.get('geospatial_settings').get('geospatial_files').get(zone).get('name')
+        parent_zone  = get_geospatial_layer(settings, zone, epsg = 2193)
+        parent_zone  = parent_zone[[zone_name_column,'geometry']]
+        
+        #read rec data, only the riverlines under the zones are read from the file
+        recdata = gpd.read_file(rec_settings.get('file'),
+                                layer = rec_settings.get('layer'),
+                                mask  = parent_zone.dissolve().geometry)
+        recdata = recdata.loc[recdata[rec_settings.get('stream_order')] >= settings.get('map_settings').get('min_stream_order')]
+        recdata  = recdata.to_crs(2193)
+        
+        #tag the riverlines with every zone they intersect
+        rec_zone_riverlines = gpd.sjoin(recdata, parent_zone, how="inner", predicate="intersects").drop(columns = 'index_right')
+        
+        try:
+            write_parquet_atomic(rec_zone_riverlines, cache_file)
+        except ImportError:
+            #pyarrow is not installed, so we only keep the riverlines in memory
+            pass
+    _RIVERLINE_CACHE.update({key : rec_zone_riverlines})
+    return rec_zone_riverlines
 ###############################################################################
 ###############################################################################
 ###############################################################################
 def get_riverlines(settings    : dict,
-                   current_zone: str,
+                   current_zone: str|list,
                    zone        : str = 'fmu') -> gpd.GeoDataFrame:
     '''
     Function to generate riverlines for a region so that these may be plotted on a map.
@@ -72,8 +372,8 @@ def get_riverlines(settings    : dict,
     ----------
     settings : dict
         DESCRIPTION. Settings dictionary.
-    current_zone : str
-        DESCRIPTION. Name of the current zone (usually name of the FMU).
+    current_zone : str|list
+        DESCRIPTION. Name of the current zone (usually name of the FMU), or a list of zones (e.g. for the whole region).
     zone : str, optional
         DESCRIPTION. The default is 'fmu'. Name of the zone type for the shapefile. Basically, riverlines are taken from the Rec2 and filtered to this zone.
 
@@ -84,29 +384,12 @@ def get_riverlines(settings    : dict,
 
     '''
     if not type(current_zone) == list:
-        zone_name = current_zone
         current_zone = [current_zone]
-    else:
-        zone_name = 'Region'
-        
-    if os.path.isfile(f"{settings.get('geospatial_settings').get('geospatial_files').get('rec_fmu_riverlines')}/REC_{zone_name}.pkl"):
-        rec_zone_riverlines = pd.read_pickle(f"{settings.get('geospatial_settings').get('geospatial_files').get('rec_fmu_riverlines')}/REC_{zone_name}.pkl")
-    else:
-        #rear rec data
-        recdata = gpd.read_file(settings.get('geospatial_settings').get('geospatial_files').get('rec2').get('file'),
-                                layer=settings.get('geospatial_settings').get('geospatial_files').get('rec2').get('layer'))
-        recdata = recdata.loc[recdata[settings.get('geospatial_settings').get('geospatial_files').get('rec2').get('stream_order')] >= settings.get('map_settings').get('min_stream_order')].reset_index(drop=True)
-        recdata  = recdata.to_crs(2193)
-        
-        #read zone data
-        parent_zone  = gpd.read_file(settings.get('geospatial_settings').get('geospatial_files').get(zone).get('file'))
-        parent_zone  = parent_zone.to_crs(2193)
         
-        #filter to only riverlines in the current zone
-        rec_zone_riverlines = gpd.sjoin(recdata,parent_zone.loc[parent_zone[settings.get('geospatial_settings').get('geospatial_files').get(zone).get('name')].isin(current_zone)], how="left", predicate="intersects")
-        rec_zone_riverlines = rec_zone_riverlines.loc[rec_zone_riverlines[settings.get('geospatial_settings').get('geospatial_files').get(zone).get('name')].isin(current_zone)].reset_index(drop=True)
-        
-        rec_zone_riverlines.to_pickle(f"{settings.get('geospatial_settings').get('geospatial_files').get('rec_fmu_riverlines')}/REC_{zone_name}.pkl")
+    rec_zone_riverlines = load_zone_riverlines(settings, zone)
+    rec_zone_riverlines = rec_zone_riverlines.loc[rec_zone_riverlines[settings.get('geospatial_settings').get('geospatial_files').get(zone).get('name')].isin(current_zone)]
+    #riverlines on a boundary between zones are only kept once
+    rec_zone_riverlines = rec_zone_riverlines.loc[~rec_zone_riverlines.index.duplicated()].reset_index(drop=True)
         
     return rec_zone_riverlines 
 ###############################################################################
@@ -186,7 +469,7 @@ def make_donut_plot(df           : pd.DataFrame,
 
     '''
     df = df.loc[df[topic_column] != 'No Data']
-    df_pie = df.groupby([topic_column])[topic_column].count().reset_index(name = 'count')
+    df_pie = df.groupby([topic_column], observed=True)[topic_column].count().reset_index(name = 'count')
     
     fig = px.pie(df_pie, values='count', names=topic_column, color=topic_column,
                  color_discrete_map = settings.get('map_settings').get('nof_grade_mapping'),
@@ -198,12 +481,49 @@ def make_donut_plot(df           : pd.DataFrame,
 ###############################################################################
 ###############################################################################
 ###############################################################################
+def simplify_fmu_polygons(data       : gpd.GeoDataFrame,
+                          fmu_column : str,
+                          settings   : dict) -> gpd.GeoDataFrame:
+    '''
+    Function to get FMU polygons in EPSG 4326, simplified with the shared-border simplification of the FMU layer. The
+    simplified layer is computed once and cached (see geospatial_layers), so every map uses the same polygons. If the FMUs
+    in data are not in the FMU layer, data itself is simplified.
+
+    Parameters
+    ----------
+    data : gpd.GeoDataFrame
+        DESCRIPTION. Geodataframe of state data at a FMU level.
+    fmu_column : str
+        DESCRIPTION. Name of FMU column in data.
+    settings : dict
+        DESCRIPTION. Dictionary of settings.
+
+    Returns
+    -------
+    data : gpd.GeoDataFrame
+        DESCRIPTION. Copy of data in EPSG 4326 with simplified geometries.
+
+    '''
+    tolerance = settings.get('map_settings').get('map_figure_settings').get('simplify_tolerance')
+    data = data.to_crs(4326)
+    
+    fmu_gdf = get_geospatial_layer(settings, 'fmu', epsg = 4326, simplify_tolerance = tolerance)
+    #an FMU can be stored as several features (e.g. islands), so they are joined into one geometry per FMU
+    fmu_geometry = fmu_gdf.dissolve(by = settings.get('geospatial_settings').get('geospatial_files').get('fmu').get('name')).geometry
+    if data[fmu_column].isin(fmu_geometry.index).all():
+        data["geometry"] = gpd.GeoSeries(data[fmu_column].map(fmu_geometry), index = data.index, crs = 4326)
+        return data
+    return topology_simplify(data, tolerance)
+###############################################################################
+###############################################################################
+###############################################################################
 def add_fmu_shape(m              : folium.Map,
                           feature_groups : list,
                           current_fmu    : str|list,
                           fmu_name       : str,
                           settings       : dict,
-                          plot_riverlines: bool) -> tuple[folium.Map,list]:
+                          plot_riverlines: bool,
+                          show           : bool = True) -> tuple[folium.Map,list]:
     '''
     Function to add FMU shapefiles and possibly riverlines to a map.
 
@@ -220,7 +540,10 @@ def add_fmu_shape(m              : folium.Map,
     settings : dict
         DESCRIPTION. Dictionary of settings.
     plot_riverlines : bool
-        DESCRIPTION. Whether we plot riverlines on the map or not.
+        DESCRIPTION. Whether we plot riverlines on the map or not. If settings['geospatial_settings']['vector_tiles'] is set, the riverlines
+        and FMU outlines are drawn from those vector tiles instead of being written into the map.
+    show : bool, optional
+        DESCRIPTION. The default is True. Whether the FMU feature group is shown when the map is opened.
 
     Returns
     -------
@@ -231,17 +554,22 @@ def add_fmu_shape(m              : folium.Map,
 
     '''
     ###############################################  
-    if fmu_name == 'Region':
+    if fmu_name == 'Region' and plot_riverlines and settings.get('geospatial_settings').get('vector_tiles') is not None:
+        #FMU outlines and riverlines are streamed from the vector tiles (see vector_tiles.export_vector_tiles)
+        m = add_vector_tile_layer(m, settings)
+    elif fmu_name == 'Region':
         #add FMU outlines
-        fmu_gdf = gpd.read_file(settings.get('geospatial_settings').get('geospatial_files').get('fmu').get('file'))
-        fmu_gdf["geometry"] = fmu_gdf["geometry"].simplify(tolerance=settings.get('map_settings').get('map_figure_settings').get('fmu_simplify_tolerance'),
-                                                                       preserve_topology=True)
+        fmu_gdf = get_geospatial_layer(settings, 'fmu', simplify_tolerance = settings.get('map_settings').get('map_figure_settings').get('fmu_simplify_tolerance'))
         fmu_gdf = fmu_gdf[["geometry"]]
-        geojson  = folium.GeoJson(fmu_gdf, style_function=lambda x: {"fillColor": settings.get('map_settings').get('map_figure_settings').get('fmu_fill_color'),
-                                                          "color": settings.get('map_settings').get('map_figure_settings').get('linecolor'), 
-                                                          "weight": settings.get('map_settings').get('map_figure_settings').get('fmu_lineweight'),
-                                                          },
-                                                          control = False).add_to(m)
+        fmu_style = lambda x: {"fillColor": settings.get('map_settings').get('map_figure_settings').get('fmu_fill_color'),
+                               "color": settings.get('map_settings').get('map_figure_settings').get('linecolor'), 
+                               "weight": settings.get('map_settings').get('map_figure_settings').get('fmu_lineweight'),
+                               }
+        if settings.get('map_settings').get('map_figure_settings').get('fmu_outline_format', 'geojson') == 'topojson':
+            #shared borders are only written once
+            geojson  = folium.TopoJson(to_topojson(fmu_gdf.to_crs(4326)), 'objects.data', style_function=fmu_style, control = False).add_to(m)
+        else:
+            geojson  = folium.GeoJson(fmu_gdf, style_function=fmu_style, control = False).add_to(m)
         if plot_riverlines:
             rec_zone_riverlines = get_riverlines(settings,current_fmu,zone = 'fmu')
             riverlines = rec_zone_riverlines.to_crs(4326)
@@ -253,7 +581,7 @@ def add_fmu_shape(m              : folium.Map,
                                                               }).add_to(m)
     ###############################################    
     #add FMU feature group    
-    feature_groups.append(folium.FeatureGroup(name=fmu_name, overlay =False, control=True, show = True))
+    feature_groups.append(folium.FeatureGroup(name=fmu_name, overlay =False, control=True, show = show))
     return m,feature_groups
 ###############################################################################
 ###############################################################################
@@ -343,6 +671,27 @@ def add_fmu_level_results(feature_groups       : list,
 
     
 
+###############################################################################
+###############################################################################
+###############################################################################
+def build_site_histories(site_data : pd.DataFrame) -> dict:
+    '''
+    Function to split the site level results into one dataframe per site, sorted by state period. This is done once
+    and reused for every site popup, rather than searching the whole dataframe for each site.
+
+    Parameters
+    ----------
+    site_data : pd.DataFrame
+        DESCRIPTION. Dataframe of state data at a site level.
+
+    Returns
+    -------
+    dict
+        DESCRIPTION. Dictionary of site name -> dataframe of the results at that site, sorted by state period.
+
+    '''
+    site_data = site_data.sort_values(by='state period', kind='stable')
+    return {x : y.reset_index(drop=True) for x,y in site_data.groupby('Site name label', sort=False)}
 ###############################################################################
 ###############################################################################
 ###############################################################################
@@ -352,7 +701,9 @@ def add_site_level_results(feature_groups       : list,
                            fmu_column           : str, 
                            current_fmu          : str|list, 
                            current_column       : str, 
-                           current_state_period : str) -> list:
+                           current_state_period : str,
+                           popup_mode           : str = 'inline',
+                           site_histories       : dict|None = None) -> list:
     '''
     Function to add site level data to a map
 
@@ -372,6 +723,11 @@ def add_site_level_results(feature_groups       : list,
         DESCRIPTION. Name of the current topic (e.g. MCI, E. coli, etc). 
     current_state_period : str
         DESCRIPTION. The most recent state period (to know which year is the main one to plot).
+    popup_mode : str, optional
+        DESCRIPTION. The default is 'inline'. If 'inline' the grade history plot of each site is embedded in its popup, if 'lazy' the popup
+        only holds a placeholder which is drawn from the site histories json file when it is opened (see write_site_histories).
+    site_histories : dict|None, optional
+        DESCRIPTION. The default is None. Per site results from build_site_histories. If None they are built from site_data.
 
     Returns
     -------
@@ -379,14 +735,19 @@ def add_site_level_results(feature_groups       : list,
         DESCRIPTION. Updated feature group list.
 
     '''
+    if site_histories is None and popup_mode != 'lazy':
+        site_histories = build_site_histories(site_data)
     filtered_sites = site_data.loc[(site_data[fmu_column].isin(current_fmu)) & (site_data['state period'] == current_state_period)].reset_index(drop=True)
     for index_a,row_a in filtered_sites.iterrows():
         if not row_a[current_column] == 'No Data':
             outline_colour = "#000000"
             current_site_name = row_a['Site name label']
-            current_site_filtered_data = site_data.loc[site_data['Site name label'] == current_site_name].sort_values(by='state period').reset_index(drop=True)
-            iframe = IFrame(html = make_site_plot(current_site_filtered_data,current_site_name,current_column, settings,current_state_period), width=600, height=350)
-            popup = folium.Popup(iframe, max_width=600)
+            if popup_mode == 'lazy':
+                popup = folium.Popup(f'<div class="site-history-plot" data-site="{html.escape(current_site_name)}" data-column="{html.escape(current_column)}" '
+                                     'style="width:580px;height:330px;"></div>', max_width=600)
+            else:
+                iframe = IFrame(html = make_site_plot(site_histories.get(current_site_name),current_site_name,current_column, settings,current_state_period), width=600, height=350)
+                popup = folium.Popup(iframe, max_width=600)
             
             folium.CircleMarker(
             location=[row_a.geometry.y, row_a.geometry.x],
@@ -414,7 +775,10 @@ def make_map(data                : gpd.GeoDataFrame,
              plot_riverlines     : bool = False,
              popup_text          : bool = True,
              opacity_column      : bool|str = False,
-             current_state_period: str = '2019 - 2023'
+             current_state_period: str = '2019 - 2023',
+             popup_mode          : str = 'inline',
+             popup_data_file     : str = 'site_histories.json',
+             site_histories      : dict|None = None
             ):
     '''
     Function to generate and save a map of the state in the region
@@ -443,14 +807,19 @@ def make_map(data                : gpd.GeoDataFrame,
         DESCRIPTION. The default is False. If False, then a default opacity is used from the settings dictionary. If a string is provided then that should be the name of a column in the dataframe which represents the opacity of that shape.
     current_state_period : str, optional
         DESCRIPTION. The default is '2019 - 2023'. The most recent state period (to know which year is the main one to plot).
+    popup_mode : str, optional
+        DESCRIPTION. The default is 'inline'. If 'inline' the site grade history plots are embedded in the map, if 'lazy' they are drawn
+        in the browser from popup_data_file when a popup is opened, which keeps the map file small.
+    popup_data_file : str, optional
+        DESCRIPTION. The default is 'site_histories.json'. Location of the site histories json file (written by write_site_histories) relative
+        to the saved map. Only used if popup_mode is 'lazy'. Browsers block fetching local files, so lazy maps need to be opened from a web server.
+    site_histories : dict|None, optional
+        DESCRIPTION. The default is None. Per site results from build_site_histories, so they can be shared between maps. If None they are built here.
 
     '''
    
-    #make sure we are in the right crs
-    data = data.to_crs(4326) 
-    #simplify the spatial polygons to make a smaller file size
-    data["geometry"] = data["geometry"].simplify(tolerance=settings.get('map_settings').get('map_figure_settings').get('simplify_tolerance'),
-                                                                   preserve_topology=True)
+    #make sure we are in the right crs, and use the simplified polygons to make a smaller file size
+    data = simplify_fmu_polygons(data, fmu_column, settings)
     #################################################
     #make a map
     m = folium.Map(location=[data.centroid.y.mean(), data.centroid.x.mean()], 
@@ -462,55 +831,73 @@ def make_map(data                : gpd.GeoDataFrame,
     
     
     fmu_list = sorted(list(data[fmu_column].unique()))
-    fmu_list = [fmu_list] + fmu_list
+    
+    #split the site results by site once, rather than once per site and FMU
+    if site_histories is None and popup_mode != 'lazy':
+        site_histories = build_site_histories(site_data)
+    
+    #the Region and FMU layers in the layer control are empty, they only choose which FMU content is shown (see FMU_LAYER_SWITCH_TEMPLATE)
+    base_layers = []
+    for fmu_name in ['Region'] + fmu_list:
+        with stage('add_fmu_shape'):
+            m,base_layers = add_fmu_shape(m,
+                                      base_layers,
+                                      fmu_list if fmu_name == 'Region' else [fmu_name],
+                                      fmu_name,
+                                      settings,
+                                      plot_riverlines,
+                                      show = fmu_name == 'Region')
+        m.add_child(base_layers[-1])
       
-    #iterate through the FMUs
+    #iterate through the FMUs, each FMU polygon and site is only added once
     feature_groups = []
     for fmu_n in fmu_list:
-        ###############################################
-
-        current_fmu = fmu_n
-        if type(current_fmu) == list:
-            fmu_name = 'Region'
-        else:
-            current_fmu = [fmu_n]
-            fmu_name = fmu_n
-        #################################################
-        #plot the FMU level results
-        m,feature_groups = add_fmu_shape(m,
-                                  feature_groups,
-                                  current_fmu,
-                                  fmu_name,
-                                  settings,
-                                  plot_riverlines)
+        feature_groups.append(folium.FeatureGroup(name=f'{fmu_n} content', control=False, show = True))
         #################################################
         #plot the FMU level results
-        feature_groups = add_fmu_level_results(feature_groups,
-                                  data,
-                                  site_data,
-                                  settings,
-                                  fmu_column,
-                                  current_fmu,
-                                  fmu_name,
-                                  current_state_period,
-                                  opacity_column,
-                                  current_column,
-                                  popup_text)
+        with stage('add_fmu_level_results'):
+            feature_groups = add_fmu_level_results(feature_groups,
+                                      data,
+                                      site_data,
+                                      settings,
+                                      fmu_column,
+                                      [fmu_n],
+                                      fmu_n,
+                                      current_state_period,
+                                      opacity_column,
+                                      current_column,
+                                      popup_text)
         ###############################################
         #plot site level data
-        feature_groups = add_site_level_results(feature_groups, 
-                                   site_data, 
-                                   settings, 
-                                   fmu_column, 
-                                   current_fmu, 
-                                   current_column, 
-                                   current_state_period)
+        with stage('add_site_level_results'):
+            feature_groups = add_site_level_results(feature_groups, 
+                                       site_data, 
+                                       settings, 
+                                       fmu_column, 
+                                       [fmu_n], 
+                                       current_column, 
+                                       current_state_period,
+                                       popup_mode,
+                                       site_histories)
         ###############################################
 
         m.add_child(feature_groups[-1]) 
         ###############################################
-
     
+    #region wide donut plot, used for the FMU polygons when the Region layer is selected
+    region_popup = None
+    if popup_text:
+        region_sites = site_data.loc[(site_data[fmu_column].isin(fmu_list)) & (site_data['state period'] == current_state_period)].reset_index(drop=True)
+        region_popup = IFrame(html = make_donut_plot(region_sites,'Region',current_column,settings), width=500, height=500).render()
+    layer_switch = MacroElement()
+    layer_switch._template   = Template(FMU_LAYER_SWITCH_TEMPLATE)
+    layer_switch.region_popup = json.dumps(region_popup)
+    layer_switch.fmus         = [{'name'     : json.dumps(str(x)),
+                                  'content'  : y.get_name(),
+                                  'polygons' : next((z.get_name() for z in y._children.values() if isinstance(z, folium.GeoJson)), 'null')}
+                                 for x,y in zip(fmu_list, feature_groups)]
+    m.add_child(layer_switch)
+
     macro = MacroElement()
     macro._template = Template(legend_template)  
     folium.LayerControl(collapsed=False).add_to(m) 
@@ -523,4 +910,373 @@ def make_map(data                : gpd.GeoDataFrame,
     ).add_to(m.get_root().header)
     
     m.get_root().add_child(macro)  
-    m.save(save_name)
\ No newline at end of file
+    
+    if popup_mode == 'lazy':
+        #plotly is loaded once for the map, and the site plots are drawn when their popup is opened
+        m.get_root().header.add_child(JavascriptLink(f'https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js'))
+        lazy_popups = MacroElement()
+        lazy_popups._template = Template(LAZY_POPUP_TEMPLATE)
+        lazy_popups.data_file = json.dumps(popup_data_file)
+        m.add_child(lazy_popups)
+    with stage('save', output_files = [save_name]):
+        m.save(save_name)
+###############################################################################
+###############################################################################
+###############################################################################
+def grade_code_strings(data        : pd.DataFrame,
+                       columns     : list,
+                       grade_dtype : pd.CategoricalDtype) -> pd.Series:
+    '''
+    Function to pack the grades of several columns into one short string per row, one base 36 character (the grade code) per column.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DESCRIPTION. Dataframe with grade columns.
+    columns : list
+        DESCRIPTION. Grade columns, in the order they are packed.
+    grade_dtype : pd.CategoricalDtype
+        DESCRIPTION. Grade type from grade_functions.get_grade_dtype.
+
+    Returns
+    -------
+    pd.Series
+        DESCRIPTION. Series of grade code strings.
+
+    '''
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    codes = np.column_stack([data[x].astype(grade_dtype).cat.codes.clip(lower=0).to_numpy() for x in columns])
+    return pd.Series([''.join(digits[x] for x in row) for row in codes], index=data.index)
+###############################################################################
+###############################################################################
+###############################################################################
+def site_grade_histories(site_data   : pd.DataFrame,
+                         columns     : list,
+                         grade_dtype : pd.CategoricalDtype,
+                         periods     : list) -> dict:
+    '''
+    Function to get the grade history of every site as a list of grade code strings (see grade_code_strings), one per state period.
+
+    Parameters
+    ----------
+    site_data : pd.DataFrame
+        DESCRIPTION. Dataframe of state data at a site level.
+    columns : list
+        DESCRIPTION. Grade columns, in the order they are packed.
+    grade_dtype : pd.CategoricalDtype
+        DESCRIPTION. Grade type from grade_functions.get_grade_dtype.
+    periods : list
+        DESCRIPTION. State periods, in the order they are listed. Periods without data at a site are an empty string.
+
+    Returns
+    -------
+    dict
+        DESCRIPTION. Dictionary of site name -> list of grade code strings.
+
+    '''
+    site_codes = grade_code_strings(site_data, columns, grade_dtype)
+    history    = site_codes.groupby([site_data['Site name label'], site_data['state period']]).first().unstack()
+    history    = history.reindex(columns = periods).fillna('')
+    return {x : list(y) for x,y in zip(history.index, history.to_numpy())}
+###############################################################################
+###############################################################################
+###############################################################################
+def write_site_histories(site_data            : pd.DataFrame,
+                         columns              : list,
+                         save_name            : str,
+                         settings             : dict,
+                         current_state_period : str = '2019 - 2023'):
+    '''
+    Function to write the grade histories of every site for every attribute to one compact json file. This is the file used
+    by the site popups of maps made with popup_mode = 'lazy', so it only needs to be written once for all of the attribute maps.
+
+    Parameters
+    ----------
+    site_data : pd.DataFrame
+        DESCRIPTION. Dataframe of state data at a site level.
+    columns : list
+        DESCRIPTION. Names of the topics (e.g. MCI, E. coli, etc) to include.
+    save_name : str
+        DESCRIPTION. Filename to save the json file as.
+    settings : dict
+        DESCRIPTION. Dictionary of settings.
+    current_state_period : str, optional
+        DESCRIPTION. The default is '2019 - 2023'. The most recent state period (to know which year is the main one to plot).
+
+    '''
+    grade_dtype = get_grade_dtype(settings)
+    periods     = sorted(site_data['state period'].unique())
+    histories   = {'attributes' : list(columns),
+                   'grades'     : list(grade_dtype.categories),
+                   'colours'    : [settings.get('map_settings').get('nof_grade_mapping').get(x) for x in grade_dtype.categories],
+                   'periods'    : [str(x) for x in periods],
+                   'current'    : str(current_state_period),
+                   'sites'      : site_grade_histories(site_data, columns, grade_dtype, periods)}
+    with open(save_name, 'w', encoding='utf-8') as f:
+        json.dump(histories, f, separators=(',', ':'), ensure_ascii=False)
+###############################################################################
+###############################################################################
+###############################################################################
+def attribute_legend_template(legend_template : str,
+                              legend_n        : int) -> str:
+    '''
+    Function to wrap the html of a legend template in a hidden div of class attribute-legend, so make_multi_attribute_map
+    can show the legend of the selected attribute. The header and script macros of the legend are not changed.
+
+    Parameters
+    ----------
+    legend_template : str
+        DESCRIPTION. String used to add a legend to a map (a template with an html macro).
+    legend_n : int
+        DESCRIPTION. Number of the legend, saved as data-legend on the div.
+
+    Returns
+    -------
+    str
+        DESCRIPTION. Legend template with the wrapped html macro.
+
+    '''
+    legend_template, n_html = re.subn(r'\{%(-?)\s*macro\s+html\s*\(', r'{%\1 macro legend_html(', legend_template, count = 1)
+    if n_html == 0:
+        return legend_template
+    return (legend_template +
+            '{% macro html(this, kwargs) %}'
+            f'<div class="attribute-legend" data-legend="{legend_n}" style="display:none">{{{{ legend_html(this, kwargs) }}}}</div>'
+            '{% endmacro %}')
+###############################################################################
+###############################################################################
+###############################################################################
+def make_multi_attribute_map(data                : gpd.GeoDataFrame,
+                             site_data           : gpd.GeoDataFrame,
+                             columns             : list,
+                             fmu_column          : str,
+                             save_name           : str,
+                             settings            : dict,
+                             legend_templates    : list,
+                             plot_riverlines     : bool = False,
+                             current_state_period: str = '2019 - 2023'
+                            ):
+    '''
+    Function to generate and save one map holding every attribute. The FMU polygons and sites are written once with
+    their grades as compact per-feature properties, and a drop down control restyles the map and switches the legend in
+    the browser. As in make_map, the Region/FMU layers in the layer control choose which FMUs are shown.
+
+    Parameters
+    ----------
+    data : gpd.GeoDataFrame
+        DESCRIPTION. Geodataframe of state data at a FMU level.
+    site_data : gpd.GeoDataFrame
+        DESCRIPTION. Geodataframe of state data at a site level.
+    columns : list
+        DESCRIPTION. Names of the topics (e.g. MCI, E. coli, etc) to include, in the order they are listed in the control.
+    fmu_column : str
+        DESCRIPTION. Name of FMU column in the input geodataframes.
+    save_name : str
+        DESCRIPTION. Filename to save map as.
+    settings : dict
+        DESCRIPTION. Dictionary of settings.
+    legend_templates : list
+        DESCRIPTION. Strings used to add a legend to the map, one for each of columns. Each different legend is written once.
+    plot_riverlines : bool, optional
+        DESCRIPTION. The default is False. If True, we will plot riverlines on the map.
+    current_state_period : str, optional
+        DESCRIPTION. The default is '2019 - 2023'. The most recent state period (to know which year is the main one to plot).
+
+    '''
+    grade_dtype = get_grade_dtype(settings)
+    periods     = sorted(site_data['state period'].unique())
+
+    #FMU polygons, current state period only
+    data = simplify_fmu_polygons(data.loc[data['state period'] == current_state_period], fmu_column, settings)
+    fmu_features = gpd.GeoDataFrame({'n' : data[fmu_column].values,
+                                     'g' : grade_code_strings(data, columns, grade_dtype).values},
+                                    geometry = data.geometry.values, crs = data.crs)
+
+    #sites, current state period for the colours and every state period for the popup
+    history      = site_grade_histories(site_data, columns, grade_dtype, periods)
+    current      = site_data.loc[site_data['state period'] == current_state_period].drop_duplicates(subset='Site name label')
+    site_features = gpd.GeoDataFrame({'n' : current['Site name label'].values,
+                                      'f' : current[fmu_column].astype(str).values,
+                                      'g' : grade_code_strings(current, columns, grade_dtype).values,
+                                      'h' : [history.get(x) for x in current['Site name label']]},
+                                     geometry = current.geometry.values, crs = site_data.crs).to_crs(4326)
+    #################################################
+    #make a map
+    m = folium.Map(location=[data.centroid.y.mean(), data.centroid.x.mean()], 
+                   zoom_start=settings.get('map_settings').get('map_figure_settings').get('zoom_start'), 
+                   tiles=None) 
+    folium.raster_layers.TileLayer(tiles=settings.get('map_settings').get('map_figure_settings').get('tile_layer'), show=True,control=False).add_to(m)
+    
+    #the Region and FMU layers in the layer control are empty, they only choose which FMUs are shown
+    fmu_list = sorted(list(data[fmu_column].unique()))
+    base_layers = []
+    for fmu_name in ['Region'] + fmu_list:
+        with stage('add_fmu_shape'):
+            m,base_layers = add_fmu_shape(m,
+                                      base_layers,
+                                      fmu_list if fmu_name == 'Region' else [fmu_name],
+                                      fmu_name,
+                                      settings,
+                                      plot_riverlines,
+                                      show = fmu_name == 'Region')
+        m.add_child(base_layers[-1])
+    #################################################
+    #add the legends, hidden except for the legend of the selected attribute
+    legends = list(dict.fromkeys(legend_templates))
+    for legend_n, legend_j in enumerate(legends):
+        macro = MacroElement()
+        macro._template = Template(attribute_legend_template(legend_j, legend_n))
+        m.get_root().add_child(macro)
+    #################################################
+    #add the features and the attribute control
+    switcher = MacroElement()
+    switcher._template   = Template(MULTI_ATTRIBUTE_MAP_TEMPLATE)
+    switcher.attributes    = json.dumps(list(columns))
+    switcher.legends       = json.dumps([legends.index(x) for x in legend_templates])
+    switcher.grade_labels  = json.dumps(list(grade_dtype.categories))
+    switcher.grade_colours = json.dumps([settings.get('map_settings').get('nof_grade_mapping').get(x) for x in grade_dtype.categories])
+    switcher.periods       = json.dumps([str(x) for x in periods])
+    switcher.fmu_geojson   = fmu_features.to_json(drop_id=True, separators=(',', ':'))
+    switcher.site_geojson  = site_features.to_json(drop_id=True, separators=(',', ':'))
+    switcher.fill_opacity  = settings.get('map_settings').get('map_figure_settings').get('fillOpacity')
+    switcher.line_colour   = settings.get('map_settings').get('map_figure_settings').get('linecolor')
+    switcher.line_weight   = settings.get('map_settings').get('map_figure_settings').get('lineweight')
+    m.add_child(switcher)
+    folium.LayerControl(collapsed=False).add_to(m) 
+    
+    Element(
+        '<style>.leaflet-control-layers-list { '
+        '  font-size:18px;'
+        '}'
+        '</style>'
+    ).add_to(m.get_root().header)
+    with stage('save', output_files = [save_name]):
+        m.save(save_name)
+###############################################################################
+###############################################################################
+###############################################################################
+def warm_map_caches(settings : dict,
+                    map_jobs : list):
+    '''
+    Function to build the FMU layers and riverlines used by a set of maps, so their cache files exist before the maps are
+    made. Worker processes then only read the cache files instead of all building and writing them at once.
+
+    Parameters
+    ----------
+    settings : dict
+        DESCRIPTION. Dictionary of settings.
+    map_jobs : list
+        DESCRIPTION. List of dictionaries with the make_map arguments of each map (as for make_maps).
+
+    '''
+    figure_settings = settings.get('map_settings').get('map_figure_settings')
+    vector_tiles    = settings.get('geospatial_settings').get('vector_tiles') is not None
+    for map_job in map_jobs:
+        plot_riverlines = map_job.get('plot_riverlines', False)
+        try:
+            #layers of simplify_fmu_polygons and add_fmu_shape, the layers are kept in memory after the first map
+            get_geospatial_layer(settings, 'fmu', epsg = 4326, simplify_tolerance = figure_settings.get('simplify_tolerance'))
+            if not (plot_riverlines and vector_tiles):
+                get_geospatial_layer(settings, 'fmu', simplify_tolerance = figure_settings.get('fmu_simplify_tolerance'))
+            if plot_riverlines and not vector_tiles:
+                load_zone_riverlines(settings, 'fmu')
+        except Exception:
+            #the maps that need the layer fail and are reported by make_maps
+            print(f"Failed to build the layers of map {map_job.get('save_name')}:\n{traceback.format_exc()}")
+###############################################################################
+###############################################################################
+###############################################################################
+def _init_map_worker(data      : gpd.GeoDataFrame,
+                     site_data : gpd.GeoDataFrame,
+                     settings  : dict,
+                     in_worker : bool = False):
+    '''
+    Function run once in each worker process to keep the inputs shared by every map, so they are not pickled per map.
+    The per site results used by the site popups are built here too, once per process.
+
+    '''
+    _SHARED_MAP_INPUTS.update({'data'           : data,
+                               'site_data'      : site_data,
+                               'settings'       : settings,
+                               'site_histories' : build_site_histories(site_data),
+                               'in_worker'      : in_worker})
+###############################################################################
+###############################################################################
+###############################################################################
+def _make_map_job(map_job: dict) -> tuple[str,str|None,list]:
+    '''
+    Function to make one map from the shared inputs, returning the save name, the traceback text if it failed and,
+    in a worker process, the stage timings of the map so they can be merged into the main process.
+
+    '''
+    in_worker = _SHARED_MAP_INPUTS.get('in_worker', False)
+    if in_worker:
+        clear_stage_records()
+    error = None
+    try:
+        with stage('make_map', label = os.path.basename(map_job.get('save_name'))):
+            make_map(_SHARED_MAP_INPUTS.get('data'),
+                     _SHARED_MAP_INPUTS.get('site_data'),
+                     settings       = _SHARED_MAP_INPUTS.get('settings'),
+                     site_histories = _SHARED_MAP_INPUTS.get('site_histories'),
+                     **map_job)
+    except Exception:
+        error = traceback.format_exc()
+    return map_job.get('save_name'), error, get_stage_records() if in_worker else []
+###############################################################################
+###############################################################################
+###############################################################################
+def make_maps(data      : gpd.GeoDataFrame,
+              site_data : gpd.GeoDataFrame,
+              settings  : dict,
+              map_jobs  : list,
+              n_workers : int = 1) -> dict:
+    '''
+    Function to make a set of maps which share the same inputs, possibly in parallel over a process pool.
+    A failure in one map is reported and does not stop the other maps.
+
+    Parameters
+    ----------
+    data : gpd.GeoDataFrame
+        DESCRIPTION. Geodataframe of state data at a FMU level.
+    site_data : gpd.GeoDataFrame
+        DESCRIPTION. Geodataframe of state data at a site level.
+    settings : dict
+        DESCRIPTION. Dictionary of settings.
+    map_jobs : list
+        DESCRIPTION. List of dictionaries, each holding the remaining make_map arguments for one map (current_column, fmu_column, save_name, legend_template, etc).
+    n_workers : int, optional
+        DESCRIPTION. The default is 1. Number of worker processes. If 1 or less the maps are made one after another in this process.
+
+    Returns
+    -------
+    failures : dict
+        DESCRIPTION. Dictionary of save name -> traceback text for the maps that failed (empty if all maps were made).
+
+    '''
+    failures = {}
+    if n_workers <= 1 or len(map_jobs) <= 1:
+        _init_map_worker(data, site_data, settings)
+        results = [_make_map_job(map_job) for map_job in map_jobs]
+    else:
+        #the layer and riverline caches are built here, so the workers only read them
+        with stage('warm_map_caches'):
+            warm_map_caches(settings, map_jobs)
+        results = []
+        with ProcessPoolExecutor(max_workers = min(n_workers, len(map_jobs)),
+                                 initializer = _init_map_worker,
+                                 initargs    = (data, site_data, settings, True)) as executor:
+            futures = {executor.submit(_make_map_job, map_job) : map_job.get('save_name') for map_job in map_jobs}
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception:
+                    #a worker died (e.g. out of memory), the maps that had not finished fail and the finished maps are kept
+                    results.append((futures.get(future), traceback.format_exc(), []))
+
+    for save_name, error, stage_records in results:
+        add_stage_records(stage_records)
+        if error is not None:
+            print(f'Failed to make map {save_name}:\n{error}')
+            failures.update({save_name : error})
+    return failures
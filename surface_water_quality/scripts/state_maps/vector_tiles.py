@@ -0,0 +1,309 @@
+import os
+import gzip
+import json
+import tempfile
+import shapely
+import folium
+import geopandas as gpd
+from branca.element import Template, MacroElement, JavascriptLink
+
+#mapbox_vector_tile and pmtiles are only needed to export the vector tiles
+try:
+    import mapbox_vector_tile
+    from pmtiles.tile import zxy_to_tileid, TileType, Compression
+    from pmtiles.writer import Writer
+    from pmtiles.reader import Reader, MmapSource
+except ImportError:
+    mapbox_vector_tile = None
+
+#half of the web mercator (EPSG 3857) world width, in metres
+_WORLD_HALF_WIDTH = 20037508.342789244
+#size of a vector tile in tile units, and the buffer kept around each tile so lines are not cut at the tile edge
+_TILE_EXTENT = 4096
+_TILE_BUFFER = 64
+
+#javascript to draw the riverlines and FMU boundaries from a PMTiles archive with protomaps-leaflet
+VECTOR_TILE_LAYER_TEMPLATE = """
+{% macro script(this, kwargs) %}
+protomapsL.leafletLayer({
+    url         : {{ this.url }},
+    maxDataZoom : {{ this.max_zoom }},
+    labelRules  : [],
+    paintRules  : [
+        {dataLayer  : "fmu",
+         symbolizer : new protomapsL.LineSymbolizer({color: {{ this.fmu_colour }}, width: {{ this.fmu_weight }}})},
+        {dataLayer  : "riverlines",
+         symbolizer : new protomapsL.LineSymbolizer({color: {{ this.riverline_colour }},
+                                                     width: function(z, f) { return f.props.stream_order / {{ this.max_stream_order }} * {{ this.max_riverline_weight }}; }})}
+    ]
+}).addTo({{ this._parent.get_name() }});
+{% endmacro %}
+"""
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+def tile_bounds(z : int,
+                x : int,
+                y : int) -> tuple:
+    '''
+    Function to get the bounds of a tile in web mercator (EPSG 3857).
+
+    Parameters
+    ----------
+    z : int
+        DESCRIPTION. Zoom level.
+    x : int
+        DESCRIPTION. Tile column.
+    y : int
+        DESCRIPTION. Tile row (counted from the top).
+
+    Returns
+    -------
+    tuple
+        DESCRIPTION. (minx, miny, maxx, maxy) of the tile.
+
+    '''
+    size = 2 * _WORLD_HALF_WIDTH / 2**z
+    return (-_WORLD_HALF_WIDTH + x * size,
+             _WORLD_HALF_WIDTH - (y + 1) * size,
+            -_WORLD_HALF_WIDTH + (x + 1) * size,
+             _WORLD_HALF_WIDTH - y * size)
+###############################################################################
+###############################################################################
+###############################################################################
+def stream_order_for_zoom(z                   : int,
+                          stream_order_by_zoom: dict) -> int:
+    '''
+    Function to get the smallest stream order drawn at a zoom level. The threshold is taken from the largest zoom in
+    stream_order_by_zoom that is not above z, so e.g. {6 : 6, 9 : 4, 11 : 3} draws stream order 6+ at zoom 6 to 8.
+
+    Parameters
+    ----------
+    z : int
+        DESCRIPTION. Zoom level.
+    stream_order_by_zoom : dict
+        DESCRIPTION. Dictionary of zoom level -> minimum stream order.
+
+    Returns
+    -------
+    int
+        DESCRIPTION. Minimum stream order at this zoom level (0 if no threshold applies).
+
+    '''
+    zooms = [int(x) for x in stream_order_by_zoom.keys() if int(x) <= z]
+    if len(zooms) == 0:
+        return 0
+    return stream_order_by_zoom.get(max(zooms), stream_order_by_zoom.get(str(max(zooms))))
+###############################################################################
+###############################################################################
+###############################################################################
+def read_tile_metadata(file_path : str) -> dict:
+    '''
+    Function to read the metadata of a PMTiles archive.
+
+    Parameters
+    ----------
+    file_path : str
+        DESCRIPTION. Path to the PMTiles archive.
+
+    Returns
+    -------
+    dict
+        DESCRIPTION. Metadata dictionary, empty if the archive does not exist or cannot be read.
+
+    '''
+    if mapbox_vector_tile is None or not os.path.isfile(file_path):
+        return {}
+    try:
+        with open(file_path, 'rb') as f:
+            return Reader(MmapSource(f)).metadata()
+    except Exception:
+        return {}
+###############################################################################
+###############################################################################
+###############################################################################
+def encode_tile_layer(name     : str,
+                      geoms    : list,
+                      props    : list,
+                      tree     : shapely.STRtree,
+                      bounds   : tuple) -> dict|None:
+    '''
+    Function to clip the geometries that fall in a tile and build one vector tile layer from them.
+
+    Parameters
+    ----------
+    name : str
+        DESCRIPTION. Name of the layer in the tile.
+    geoms : list
+        DESCRIPTION. Geometries (EPSG 3857), already simplified for the zoom level.
+    props : list
+        DESCRIPTION. Properties dictionary of each geometry.
+    tree : shapely.STRtree
+        DESCRIPTION. Spatial index of geoms.
+    bounds : tuple
+        DESCRIPTION. Bounds of the tile, from tile_bounds.
+
+    Returns
+    -------
+    dict|None
+        DESCRIPTION. Layer dictionary for mapbox_vector_tile.encode, None if no geometry falls in the tile.
+
+    '''
+    buffer  = (bounds[2] - bounds[0]) * _TILE_BUFFER / _TILE_EXTENT
+    clip_to = (bounds[0] - buffer, bounds[1] - buffer, bounds[2] + buffer, bounds[3] + buffer)
+    idx = tree.query(shapely.box(*clip_to))
+    if len(idx) == 0:
+        return None
+    clipped = shapely.clip_by_rect(geoms[idx], *clip_to)
+    features = [{'geometry' : g, 'properties' : props[i]} for i,g in zip(idx, clipped) if not g.is_empty]
+    if len(features) == 0:
+        return None
+    return {'name' : name, 'features' : features}
+###############################################################################
+###############################################################################
+###############################################################################
+def export_vector_tiles(riverlines          : gpd.GeoDataFrame,
+                        fmu_gdf             : gpd.GeoDataFrame,
+                        save_name           : str,
+                        tile_settings       : dict,
+                        stream_order_column : str = 'StreamOrde',
+                        fmu_name_column     : str = 'FMU_Name',
+                        source_key          : str = '') -> bool:
+    '''
+    Function to export riverlines and FMU boundaries to a PMTiles archive of vector tiles. Each zoom level keeps the
+    riverlines from the stream order set in tile_settings['stream_order_by_zoom'] upwards and is simplified to about
+    tile_settings['simplify_pixels'] screen pixels. The archive is not rebuilt if it was made from the same source_key.
+
+    Parameters
+    ----------
+    riverlines : gpd.GeoDataFrame
+        DESCRIPTION. Riverlines (e.g. from map_functions.load_zone_riverlines).
+    fmu_gdf : gpd.GeoDataFrame
+        DESCRIPTION. FMU polygons.
+    save_name : str
+        DESCRIPTION. Filename to save the PMTiles archive as.
+    tile_settings : dict
+        DESCRIPTION. Dictionary with min_zoom, max_zoom, stream_order_by_zoom and simplify_pixels.
+    stream_order_column : str, optional
+        DESCRIPTION. The default is 'StreamOrde'. Stream order column of the riverlines.
+    fmu_name_column : str, optional
+        DESCRIPTION. The default is 'FMU_Name'. FMU name column of the FMU polygons.
+    source_key : str, optional
+        DESCRIPTION. The default is ''. Key of the inputs (e.g. map_functions.riverline_cache_key), saved in the archive metadata.
+
+    Returns
+    -------
+    bool
+        DESCRIPTION. True if the archive was written, False if the existing archive was up to date.
+
+    '''
+    if mapbox_vector_tile is None:
+        raise ImportError('mapbox_vector_tile and pmtiles are needed to export vector tiles (pip install mapbox-vector-tile pmtiles)')
+    min_zoom = tile_settings.get('min_zoom', 6)
+    max_zoom = tile_settings.get('max_zoom', 12)
+    stream_order_by_zoom = tile_settings.get('stream_order_by_zoom', {})
+
+    if read_tile_metadata(save_name).get('source_key') == f'{source_key}|{min_zoom}|{max_zoom}|{stream_order_by_zoom}':
+        return False
+
+    riverlines = riverlines.to_crs(3857)
+    riverlines = riverlines.loc[~riverlines.index.duplicated()].reset_index(drop=True)
+    fmu_gdf    = fmu_gdf.to_crs(3857).reset_index(drop=True)
+    #FMU polygons are drawn as outlines
+    fmu_lines  = fmu_gdf.geometry.boundary.to_numpy()
+    fmu_props  = [{'name' : str(x)} for x in fmu_gdf[fmu_name_column]]
+
+    minx, miny, maxx, maxy = fmu_gdf.total_bounds
+    tiles = {}
+    for z in range(min_zoom, max_zoom + 1):
+        #tolerance of about simplify_pixels pixels at this zoom (256 pixels per tile)
+        tolerance = 2 * _WORLD_HALF_WIDTH / 2**z / 256 * tile_settings.get('simplify_pixels', 1.0)
+
+        rivers_z = riverlines.loc[riverlines[stream_order_column] >= stream_order_for_zoom(z, stream_order_by_zoom)]
+        layers = [('riverlines',
+                   shapely.simplify(rivers_z.geometry.to_numpy(), tolerance),
+                   [{'stream_order' : int(x)} for x in rivers_z[stream_order_column]]),
+                  ('fmu',
+                   shapely.simplify(fmu_lines, tolerance, preserve_topology=True),
+                   fmu_props)]
+        layers = [(name, geoms, props, shapely.STRtree(geoms)) for name, geoms, props in layers]
+
+        size = 2 * _WORLD_HALF_WIDTH / 2**z
+        x_range = range(max(int((minx + _WORLD_HALF_WIDTH) // size), 0), min(int((maxx + _WORLD_HALF_WIDTH) // size), 2**z - 1) + 1)
+        y_range = range(max(int((_WORLD_HALF_WIDTH - maxy) // size), 0), min(int((_WORLD_HALF_WIDTH - miny) // size), 2**z - 1) + 1)
+        for x in x_range:
+            for y in y_range:
+                bounds = tile_bounds(z, x, y)
+                tile_layers = [encode_tile_layer(name, geoms, props, tree, bounds) for name, geoms, props, tree in layers]
+                tile_layers = [layer for layer in tile_layers if layer is not None]
+                if len(tile_layers) == 0:
+                    continue
+                tile = mapbox_vector_tile.encode(tile_layers, default_options = {'quantize_bounds' : bounds, 'extents' : _TILE_EXTENT})
+                tiles.update({zxy_to_tileid(z, x, y) : gzip.compress(tile, mtime=0)})
+
+    lon_lat = gpd.GeoSeries([shapely.box(minx, miny, maxx, maxy)], crs=3857).to_crs(4326).total_bounds
+    #the archive is written to a temporary file and moved into place, so an interrupted run never leaves a truncated archive
+    os.makedirs(os.path.dirname(os.path.abspath(save_name)), exist_ok=True)
+    handle, temp_file = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(save_name)), prefix = f'{os.path.basename(save_name)}.', suffix = '.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            writer = Writer(f)
+            for tile_id in sorted(tiles.keys()):
+                writer.write_tile(tile_id, tiles.get(tile_id))
+            writer.finalize({'tile_type'        : TileType.MVT,
+                             'tile_compression' : Compression.GZIP,
+                             'min_lon_e7'       : int(lon_lat[0] * 10000000),
+                             'min_lat_e7'       : int(lon_lat[1] * 10000000),
+                             'max_lon_e7'       : int(lon_lat[2] * 10000000),
+                             'max_lat_e7'       : int(lon_lat[3] * 10000000),
+                             'center_zoom'      : min_zoom},
+                            {'name'             : os.path.splitext(os.path.basename(save_name))[0],
+                             'source_key'       : f'{source_key}|{min_zoom}|{max_zoom}|{stream_order_by_zoom}',
+                             'max_stream_order' : int(riverlines[stream_order_column].max()) if len(riverlines) > 0 else 1,
+                             'vector_layers'    : [{'id' : 'riverlines', 'fields' : {'stream_order' : 'Number'}, 'minzoom' : min_zoom, 'maxzoom' : max_zoom},
+                                                   {'id' : 'fmu',        'fields' : {'name' : 'String'},         'minzoom' : min_zoom, 'maxzoom' : max_zoom}]})
+        os.replace(temp_file, save_name)
+    finally:
+        if os.path.isfile(temp_file):
+            os.remove(temp_file)
+    print(f'Wrote {len(tiles)} vector tiles to {save_name}')
+    return True
+###############################################################################
+###############################################################################
+###############################################################################
+def add_vector_tile_layer(m        : folium.Map,
+                          settings : dict) -> folium.Map:
+    '''
+    Function to add the riverlines and FMU boundaries from the PMTiles archive in settings['geospatial_settings']['vector_tiles']
+    to a map, as a protomaps-leaflet layer. The tiles are streamed from the archive when they are needed, so they do not add to the map file size.
+
+    Parameters
+    ----------
+    m : folium.Map
+        DESCRIPTION. The folium map object.
+    settings : dict
+        DESCRIPTION. Dictionary of settings.
+
+    Returns
+    -------
+    m : folium.Map
+        DESCRIPTION. Updated folium map object.
+
+    '''
+    tile_settings   = settings.get('geospatial_settings').get('vector_tiles')
+    figure_settings = settings.get('map_settings').get('map_figure_settings')
+
+    m.get_root().header.add_child(JavascriptLink(tile_settings.get('js', 'https://unpkg.com/protomaps-leaflet@4.0.1/dist/protomaps-leaflet.js')))
+    tile_layer = MacroElement()
+    tile_layer._template = Template(VECTOR_TILE_LAYER_TEMPLATE)
+    tile_layer.url                  = json.dumps(tile_settings.get('url', os.path.basename(tile_settings.get('file'))))
+    tile_layer.max_zoom             = tile_settings.get('max_zoom', 12)
+    tile_layer.fmu_colour           = json.dumps(figure_settings.get('linecolor'))
+    tile_layer.fmu_weight           = figure_settings.get('fmu_lineweight')
+    tile_layer.riverline_colour     = json.dumps(figure_settings.get('riverline_colour'))
+    tile_layer.max_riverline_weight = figure_settings.get('max_riverline_weight')
+    tile_layer.max_stream_order     = read_tile_metadata(tile_settings.get('file')).get('max_stream_order', 1)
+    m.add_child(tile_layer)
+    return m
@@ -9,6 +9,11 @@ from branca.element import Template, MacroElement, Element, IFrame
 from folium.plugins import Geocoder, FeatureGroupSubGroup
 from thefuzz import fuzz
 from map_functions import make_map
+import sys
+#shared modules (e.g. geospatial_layers, build_manifest) are in the shared folder at the top of the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'shared'))
+from geospatial_layers import get_geospatial_layer
+from build_manifest import hash_frame, hash_settings, hash_files, code_version, load_manifest, output_status, record_output, report_build
 from settings import load_settings
 
 
@@ -28,9 +33,7 @@ def load_and_simplify_region(settings: dict):
         DESCRIPTION. Geodataframe of region
 
     '''
-    fmu_gdf = gpd.read_file(settings.get('geospatial_settings').get('geospatial_files').get('fmu').get('file'))
-    fmu_gdf["geometry"] = fmu_gdf["geometry"].simplify(tolerance=settings.get('map_settings').get('map_figure_settings').get('fmu_simplify_tolerance'),
-                                                                   preserve_topology=True)
+    fmu_gdf = get_geospatial_layer(settings, 'fmu', simplify_tolerance = settings.get('map_settings').get('map_figure_settings').get('fmu_simplify_tolerance'))
     # fmu_gdf = fmu_gdf[["geometry"]]
     return fmu_gdf
     
@@ -61,8 +64,23 @@ if __name__ == '__main__':
     #get site meta data
     site_meta_data = pd.read_excel(settings.get('lawa_sites_meta_data_file'))
     
-    #make map
-    make_map(fmu_gdf,os.path.join(results_dir, "recent_swimmability_map.html"),settings)
+    #make map, unless its inputs are unchanged since it was last made
+    manifest = load_manifest(os.path.join(results_dir, 'build_manifest.json'))
+    save_name = os.path.join(results_dir, "recent_swimmability_map.html")
+    #the site name aliases decide which meta data each site gets, so a corrected or reviewed alias rebuilds the map
+    alias_file = settings.get('site_alias_file', os.path.join(data_dir, 'site_name_aliases.csv'))
+    inputs = {'fmu_data'   : hash_frame(fmu_gdf),
+              'data_files' : hash_files([os.path.join(data_dir, x) for x in settings.get('fmu_files').values()] + 
+                                        [os.path.join(data_dir, settings.get('all_site_results')), settings.get('lawa_sites_meta_data_file')]),
+              'aliases'    : hash_files([alias_file]),
+              'settings'   : hash_settings({k:v for k,v in settings.items() if k not in ['parent_dir','data_dir','results_dir']}),
+              'code'       : code_version(os.path.dirname(os.path.abspath(__file__)))}
+    if output_status(manifest, save_name, inputs, settings.get('force_rebuild', False)) is not None:
+        make_map(fmu_gdf,save_name,settings)
+        #make_map adds its new fuzzy matches to the aliases, the map was made with them so they do not rebuild it
+        inputs.update({'aliases' : hash_files([alias_file])})
+        record_output(manifest, save_name, inputs)
+    report_build(manifest)
 
     
         
\ No newline at end of file
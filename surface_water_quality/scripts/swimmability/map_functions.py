@@ -5,10 +5,10 @@ import pickle
 import os
 import folium
 import geopandas as gpd
-from thefuzz import fuzz
 from branca.element import Template, MacroElement, Element, IFrame
 from folium.plugins import Geocoder, FeatureGroupSubGroup
 from settings import parameter_gradings
+from site_name_resolver import resolve_site_names
 ####################################################################################
 ####################################################################################
 ####################################################################################
@@ -146,22 +146,6 @@ def make_donut_plot(df_row           : pd.Series,
 ###############################################################################
 ###############################################################################
 ###############################################################################
-def find_closest_name(name      : str, 
-                      name_list : list) -> str:
-    score = 0
-    site = ''
-    for site_j in name_list:
-        new_score = fuzz.ratio(name, site_j)
-        if new_score > score:
-            score = new_score
-            site = site_j
-            
-    return site       
-
-###############################################################################
-###############################################################################
-###############################################################################
-
 def add_points(m              : folium.Map,
                settings       : dict,) -> folium.Map:
     param_grading_dict, grading_order_dict, reverse_grading_order_dict,cmap,name_map = parameter_gradings()
@@ -175,10 +159,24 @@ def add_points(m              : folium.Map,
     
     subset_columns = [settings.get('green_column'),settings.get('amber_column'),settings.get('red_column'),settings.get('no_sample_column')]
     
+    #match the site names to the LAWA meta data names once, fuzzy matches are saved to the alias table for review
+    meta_data_names = [str(x) for x in site_meta_data[settings.get("meta_data_site_column")].to_list()]
+    corrected_names = resolve_site_names(data_points[settings.get('site_column')].to_list(),
+                                         meta_data_names,
+                                         alias_file = settings.get('site_alias_file', os.path.join(settings.get('data_dir'), 'site_name_aliases.csv')),
+                                         min_score = settings.get('site_match_min_score', 80))
+    #first meta data row of each name, keyed by the same str names that resolve_site_names returns
+    meta_data_rows = {}
+    for row_k, name_k in enumerate(meta_data_names):
+        meta_data_rows.setdefault(name_k, row_k)
+    
     #iterate through the sites...
     for iter_j,row_j in data_points.iterrows():
         site_name = row_j[settings.get('site_column')]
-        site_corrected_name = find_closest_name(site_name,[str(x) for x in site_meta_data[settings.get("meta_data_site_column")].to_list()])
+        site_corrected_name = corrected_names.get(str(site_name))
+        if site_corrected_name not in meta_data_rows:
+            #unresolved names are reported by resolve_site_names, the site has no location so it is left off the map
+            continue
         
         html_popup = make_donut_plot(row_j,
                             f"{site_name} <br> swimmability: {settings.get('contact_rec_season_text')}",
@@ -189,14 +187,14 @@ def add_points(m              : folium.Map,
 
         max_colour  = pd.to_numeric(row_j[subset_columns], errors='coerce').idxmax()
         
-        current_meta_data = site_meta_data.loc[site_meta_data[settings.get("meta_data_site_column")] == site_corrected_name].reset_index(drop=True)
+        current_meta_data = site_meta_data.iloc[[meta_data_rows.get(site_corrected_name)] if site_corrected_name in meta_data_rows else []].reset_index(drop=True)
         
         current_meta_data_gdf = gpd.GeoDataFrame(
                 current_meta_data, geometry=gpd.points_from_xy(current_meta_data[settings.get('x_column')], current_meta_data[settings.get('y_column')]), crs=f"EPSG:{settings.get('site_epsg_code')}"
             )
         
         folium.CircleMarker(
-            location=[current_meta_data_gdf.geometry.y, current_meta_data_gdf.geometry.x],
+            location=[current_meta_data_gdf.geometry.y.iloc[0], current_meta_data_gdf.geometry.x.iloc[0]],
             radius=8,
             color = settings.get('map_settings').get('map_figure_settings').get('linecolor'),
             weight = 1,
@@ -0,0 +1,186 @@
+import os
+import re
+import unicodedata
+import numpy as np
+import pandas as pd
+from thefuzz import fuzz
+
+#rapidfuzz scores all the names at once, without it the names are scored one pair at a time with thefuzz
+try:
+    from rapidfuzz import process as rapidfuzz_process
+    from rapidfuzz import fuzz as rapidfuzz_fuzz
+except ImportError:
+    rapidfuzz_process = None
+    rapidfuzz_fuzz = None
+
+ALIAS_COLUMNS = ['name', 'resolved_name', 'method', 'score', 'reviewed']
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+def normalise_name(name : str) -> str:
+    '''
+    Function to normalise a site name for matching: macrons and other accents are removed, the name is lower case,
+    @ is written as at, '.', '/' and apostrophes are dropped (d/s -> ds) and other punctuation is a space.
+
+    Parameters
+    ----------
+    name : str
+        DESCRIPTION. Site name.
+
+    Returns
+    -------
+    str
+        DESCRIPTION. Normalised site name.
+
+    '''
+    name = ''.join([x for x in unicodedata.normalize('NFKD', str(name)) if not unicodedata.combining(x)]).lower()
+    name = name.replace('@', ' at ')
+    name = re.sub(r"[./'’]", '', name)
+    name = re.sub(r'[^a-z0-9]+', ' ', name)
+    return name.strip()
+###############################################################################
+###############################################################################
+###############################################################################
+def load_alias_table(alias_file : str|None) -> pd.DataFrame:
+    '''
+    Function to load the table of resolved site names. Fuzzy matches are added to it with reviewed = False, once checked
+    (and corrected in resolved_name if needed) reviewed can be set to True. Matches scored below the threshold of
+    resolve_site_names have method = unresolved, they are only used once reviewed.
+
+    Parameters
+    ----------
+    alias_file : str|None
+        DESCRIPTION. Path to the alias csv, None or a missing file gives an empty table.
+
+    Returns
+    -------
+    pd.DataFrame
+        DESCRIPTION. Dataframe with columns name, resolved_name, method, score and reviewed.
+
+    '''
+    if alias_file is None or not os.path.isfile(alias_file):
+        return pd.DataFrame(columns = ALIAS_COLUMNS)
+    table = pd.read_csv(alias_file, dtype = {'name' : str, 'resolved_name' : str})
+    #reviewed is edited by hand, so TRUE, true, 1 and yes are all read as reviewed
+    table['reviewed'] = table['reviewed'].astype(str).str.strip().str.lower().isin(['true', '1', '1.0', 'yes'])
+    return table
+###############################################################################
+###############################################################################
+###############################################################################
+def closest_names(names      : list,
+                  candidates : list) -> tuple[list, list]:
+    '''
+    Function to find the most similar candidate (fuzz.ratio) for each name.
+
+    Parameters
+    ----------
+    names : list
+        DESCRIPTION. Names to match.
+    candidates : list
+        DESCRIPTION. Names to match to.
+
+    Returns
+    -------
+    tuple[list, list]
+        DESCRIPTION. Position of the best candidate and its score for each name.
+
+    '''
+    if rapidfuzz_process is not None:
+        scores = rapidfuzz_process.cdist(names, candidates, scorer = rapidfuzz_fuzz.ratio)
+        best = np.argmax(scores, axis=1)
+        return [int(x) for x in best], [float(scores[i, x]) for i, x in enumerate(best)]
+
+    best, best_scores = [], []
+    for name_j in names:
+        scores = [fuzz.ratio(name_j, x) for x in candidates]
+        best.append(int(np.argmax(scores)))
+        best_scores.append(float(max(scores)))
+    return best, best_scores
+###############################################################################
+###############################################################################
+###############################################################################
+def resolve_site_names(names      : list,
+                       candidates : list,
+                       alias_file : str|None = None,
+                       min_score  : float = 80) -> dict:
+    '''
+    Function to match site names to the names of the site meta data. Each name is looked up in the alias table, then as
+    an exact name, then as a normalised name (normalise_name). Only the names left over are fuzzy matched, in one batch,
+    and those matches are added to the alias table so later runs do not need to fuzzy match them. Fuzzy matches scored
+    below min_score are not used, and aliases that are not reviewed yet are reported.
+
+    Parameters
+    ----------
+    names : list
+        DESCRIPTION. Site names to resolve.
+    candidates : list
+        DESCRIPTION. Site names of the meta data.
+    alias_file : str|None, optional
+        DESCRIPTION. The default is None. Path to the alias csv, None does not use or save aliases.
+    min_score : float, optional
+        DESCRIPTION. The default is 80. Lowest fuzzy score (0 to 100) a match is used at, names scored below it are
+        unresolved until their alias is reviewed.
+
+    Returns
+    -------
+    dict
+        DESCRIPTION. Dictionary of site name -> meta data site name ('' if the name is unresolved).
+
+    '''
+    candidates = [str(x) for x in candidates]
+    candidate_set = set(candidates)
+    normalised = {}
+    for candidate_j in candidates:
+        normalised.setdefault(normalise_name(candidate_j), candidate_j)
+    aliases = load_alias_table(alias_file)
+    aliases = aliases.loc[aliases['resolved_name'].isin(candidate_set) & (aliases['reviewed'] | (aliases['method'] != 'unresolved'))]
+    unreviewed = set(aliases.loc[~aliases['reviewed'], 'name'])
+    aliases = dict(zip(aliases['name'], aliases['resolved_name']))
+
+    resolved = {}
+    leftovers = []
+    for name_j in dict.fromkeys([str(x) for x in names]):
+        if name_j in aliases:
+            resolved.update({name_j : aliases.get(name_j)})
+        elif name_j in candidate_set:
+            resolved.update({name_j : name_j})
+        elif normalise_name(name_j) in normalised:
+            resolved.update({name_j : normalised.get(normalise_name(name_j))})
+        else:
+            leftovers.append(name_j)
+
+    used_unreviewed = [x for x in resolved.keys() if x in unreviewed]
+    if len(used_unreviewed) > 0:
+        print(f'Used {len(used_unreviewed)} site name aliases that are not reviewed: {", ".join(used_unreviewed)}')
+    if len(leftovers) == 0:
+        return resolved
+    if len(candidates) == 0:
+        resolved.update({x : '' for x in leftovers})
+        print(f'Could not resolve {len(leftovers)} site names, there are no meta data names: {", ".join(leftovers)}')
+        return resolved
+
+    #fuzzy match the names left over, and save the matches for review, matches below min_score are saved as unresolved
+    normalised_candidates = [normalise_name(x) for x in candidates]
+    best, scores = closest_names([normalise_name(x) for x in leftovers], normalised_candidates)
+    matches = pd.DataFrame({'name'          : leftovers,
+                            'resolved_name' : [candidates[x] for x in best],
+                            'method'        : ['fuzzy' if x >= min_score else 'unresolved' for x in scores],
+                            'score'         : scores,
+                            'reviewed'      : False})
+    fuzzy = matches.loc[matches['method'] == 'fuzzy']
+    unresolved = matches.loc[matches['method'] == 'unresolved']
+    resolved.update(dict(zip(fuzzy['name'], fuzzy['resolved_name'])))
+    resolved.update({x : '' for x in unresolved['name']})
+    if len(fuzzy) > 0:
+        print(f'Fuzzy matched {len(fuzzy)} of {len(resolved)} site names, not reviewed: {", ".join(fuzzy["name"])}')
+    if len(unresolved) > 0:
+        print(f'Could not resolve {len(unresolved)} site names (fuzzy score below {min_score}): ' + 
+              ', '.join([f'{x} (closest {y}, {z:.0f})' for x, y, z in zip(unresolved['name'], unresolved['resolved_name'], unresolved['score'])]))
+    if alias_file is not None:
+        table = load_alias_table(alias_file)
+        table = pd.concat([table.loc[~table['name'].isin(matches['name'])], matches], ignore_index=True) if len(table) > 0 else matches
+        os.makedirs(os.path.dirname(os.path.abspath(alias_file)), exist_ok=True)
+        table.to_csv(alias_file, index=False)
+    return resolved